@@ -1,22 +1,28 @@
-import tkinter as tk
-from tkinter import ttk, scrolledtext, messagebox
 import threading
 import time
 import datetime
-import requests
-import base64
-import pyautogui
-import io
+import argparse
 import os
 import json
 import re
-from PIL import Image, ImageTk, ImageChops, ImageStat  # 引入图像计算
 
-try:
-    import pygetwindow as gw
-except ImportError:
-    gw = None
-    print("Warning: pygetwindow not installed. Window selection might fail.")
+from cinescribe.balancer import EndpointPool, format_pool_stats
+from cinescribe.cache import ResponseCache, format_cache_stats
+from cinescribe.gating import ChangeDetector
+from cinescribe.imaging import ImagePreprocessor, fit_box, format_imaging_stats
+from cinescribe.journal import LogJournal
+from cinescribe.scheduler import CaptureScheduler, format_schedule_stats
+from cinescribe.session import SpillWindow, append_capped, format_session_stats
+from cinescribe.summarize import StoryTree, format_items
+from cinescribe.uiqueue import UIEventQueue
+from cinescribe.tokens import Section, TokenBudget, format_budget_stats
+from cinescribe.llm import LLMClient, format_client_stats, format_stream_metrics
+from cinescribe.pipeline import BatchWorkerPool
+from cinescribe.sources import SyntheticSource, VideoFileSource, WindowSource, format_capture_stats, format_pts
+
+# GUI 依赖按需导入 (见 load_gui_modules)，无界面模式不会加载 tkinter / pyautogui / pygetwindow
+tk = ttk = scrolledtext = messagebox = filedialog = ImageTk = None
+
 
 # =========================================================================
 #                                 配置区域
@@ -26,16 +32,73 @@ except ImportError:
 LLM_API_URL = "http://192.168.71.10:1234/v1/chat/completions"
 MODEL_ID = "qwen/qwen3-vl-30b"
 
+# --- 端点池 (每个角色可配置多个 (地址, 模型 ID)，同一角色的模型 ID 须一致；增加 GPU 服务器只需追加端点) ---
+LLM_ENDPOINTS = [(LLM_API_URL, MODEL_ID)]  # 单帧分析
+SUMMARY_ENDPOINTS = LLM_ENDPOINTS  # 阶段回顾 / 分幕汇总 / 最终解说
+LOAD_BALANCE_POLICY = "least_outstanding"  # "least_outstanding" 在途请求最少 / "latency" 观测延迟最低
+ENDPOINT_MAX_FAILURES = 3  # 连续失败多少次后熔断端点 (期间请求直接跳过，不再等待超时)
+ENDPOINT_EJECT_SECONDS = 30  # 熔断多久后做健康检查，通过后重新接入
+LLM_MAX_RETRIES = 1  # 请求失败后的重试次数 (优先换一个端点)
+RETRY_BACKOFF_SECONDS = 1.0  # 首次重试前的最大等待 (随机抖动)，之后每次翻倍
+HEDGE_REQUESTS = True  # 非流式请求超过该角色 p95 延迟仍未返回时，向另一个端点发送副本 (需要多个端点)
+
+# --- 网络连接 (长连接池) ---
+HTTP_CONNECT_TIMEOUT = 5  # 建立连接超时 (秒)
+HTTP_READ_TIMEOUT = 60  # 等待模型回复超时 (秒)
+MAX_REQUESTS_PER_ENDPOINT = 2  # 并发请求上限
+# 附加到每个请求的后端参数：llama.cpp 的 cache_prompt 复用相同提示词前缀的 KV 缓存；
+# 端点拒绝时自动去掉，设为 {} 不附加
+PROMPT_CACHE_OPTIONS = {"cache_prompt": True}
+
+# --- 提示词 token 预算 (每次请求 输入 + 输出 的上限，超出时按优先级裁剪历史段落) ---
+PROMPT_TOKEN_BUDGETS = {MODEL_ID: 8192}
+
+# --- 回复缓存 (单帧分析，按模型 + 提示词 + 图片感知哈希寻址) ---
+RESPONSE_CACHE_DIR = "response_cache"  # 设为 None 关闭缓存
+RESPONSE_CACHE_MAX_MB = 200  # 超出后按最近使用时间淘汰
+
+# --- 截屏 ---
+CAPTURE_BACKEND = "auto"  # "mss" 只抓取窗口区域 (快) / "pyautogui" / "auto" 已安装 mss 时使用 mss
+# 送分析帧的缩放与 JPEG 编码交给独立进程 (帧像素经共享内存传递)，不占用采集循环的 GIL；0 在采集线程内处理
+PREPROCESS_WORKERS = 1
+# 送分析帧的编码：format "JPEG" / "PNG" / "WEBP" (llama.cpp 的图片解码不支持 WebP)，quality 有损质量，grayscale 转灰度，
+# subsampling JPEG 色度抽样 "4:4:4" / "4:2:2" / "4:2:0"，max_bytes 超出时逐级降低质量 (不低于 min_quality)
+FRAME_ENCODE_PROFILE = {"format": "JPEG", "quality": 80}
+
 # --- 运行参数 ---
-DEFAULT_INTERVAL = 3  # 默认采样间隔 (秒)
+DEFAULT_INTERVAL = 3  # 默认 (初始) 采样间隔 (秒)
 SUMMARY_TRIGGER_COUNT = 12  # 每分析多少帧触发一次阶段回顾
-AUTO_PAUSE_VIDEO = True  # 阶段回顾时是否尝试暂停视频
+# 阶段回顾在后台生成，不打断采集；开启后实时模式会在回顾期间暂停视频并等待生成完毕
+# (旧行为：需要激活播放器窗口并模拟空格键，会抢占键盘焦点)
+AUTO_PAUSE_VIDEO = False
+
+# --- 会话记录 (内存中只保留提示词会读到的最近几条，更早的追加到日志旁的 *_frames.jsonl / *_summaries.jsonl) ---
+FRAME_LOG_WINDOW = 10  # 单帧记录：单帧分析读最近 2 条，阶段回顾读最近 10 条
+SUMMARY_LOG_WINDOW = 2  # 阶段回顾原文 (提示词中的历史剧情由 StoryTree 维护)
+LOG_VIEW_MAX_LINES = 2000  # 界面日志栏 / 回顾栏最多保留的行数，更早的内容只在日志文件中
+UI_FRAME_INTERVAL_MS = 50  # 界面刷新间隔 (毫秒)：引擎事件在分析线程中合并，界面每帧统一处理一次
+PREVIEW_SIZE = (380, 250)  # 预览缩略图尺寸，在分析线程中缩好再交给界面
+
+# --- 分层汇总 (阶段回顾 → 幕 → 全片，每次请求的输入有上限) ---
+ACT_PHASES = 4  # 每 4 个阶段回顾在后台汇总为一幕
+SUMMARY_CONTEXT_TOKENS = 1200  # 单帧分析 / 阶段回顾提示词中历史剧情的上限 (估算 token)
+REDUCE_INPUT_TOKENS = 6000  # 幕汇总与最终解说输入的上限；超出时分组再汇总一层
+REDUCE_WORKERS = 2  # 并行汇总的线程数
 
 # --- 视觉去重参数 ---
 ENABLE_VISUAL_DEDUP = True  # 是否开启视觉去重
-SCENE_CHANGE_THRESHOLD = 2.5  # 差异阈值 (0-255)。
+CHANGE_DETECTOR = "phash"  # 变化检测方法: "mean" (平均像素差) / "dhash" / "phash" / "histogram"
+SUBTITLE_BAND = 1 / 3  # 字幕带占画面底部的比例，专注检测字幕变化
+SUBTITLE_CHANGE_THRESHOLD = None  # 字幕带差异阈值 (0-100)，None 使用检测方法的默认值
+SCENE_CHANGE_THRESHOLD = None  # 画面区差异阈值 (0-100)，只对镜头切换等大变化敏感；None 同上
 MAX_SKIP_COUNT = 10  # 即使画面一直不动，每跳过多少次也强制分析一次
 
+# --- 自适应采样 (画面变化快时加密，静止时放缓；关闭视觉去重时固定为采样间隔) ---
+ADAPTIVE_CAPTURE = True
+MIN_CAPTURE_INTERVAL = 1.0  # 最短采样间隔 (秒)
+MAX_CAPTURE_INTERVAL = 8.0  # 最长采样间隔 (秒)
+CALL_BUDGET = None  # 每部片最多调用模型的次数 (None 不限)；离线模式按剩余片长平均分配
+
 # --- 提示词 (Prompt) 设置 ---
 
 # 1. 单帧分析模式
@@ -50,6 +113,10 @@ PROMPT_SINGLE_FRAME = (
     "4. 回复字数严格控制在 130字 以内。注意,即使字幕来自未知人物,也应该完整记录。只关注中文即可"
 )
 
+# 历史剧情附在单帧分析 / 阶段回顾的系统消息之后：它只在阶段边界变化，
+# 与固定指令一起构成后端可复用 KV 缓存的稳定前缀
+PROMPT_STORY_CONTEXT = "\n\n【已知历史剧情(阶段回顾)】:\n{history}"
+
 # 2. 阶段回顾模式
 PROMPT_PHASE_SUMMARY = (
     """你是一个剧情梳理专家。请根据提供的最近多条画面记录，对这段时间的剧情进行阶段性回顾。
@@ -60,7 +127,14 @@ PROMPT_PHASE_SUMMARY = (
     回复字数严格控制在 200字 以内。"""
 )
 
-# 3. 最终总结模式 (已优化：强调具体细节和故事性)
+# 3. 分幕汇总模式 (把若干阶段回顾合并为一幕)
+PROMPT_ACT_SUMMARY = (
+    "你是一个剧情梳理专家。请把按时间顺序排列的若干段剧情回顾合并为一段连贯的剧情梗概。\n"
+    "保留关键事件、人物名字、重要台词与因果关系，去掉重复内容，不要揣测人物内心。\n"
+    "回复字数严格控制在 300字 以内。"
+)
+
+# 4. 最终总结模式 (已优化：强调具体细节和故事性)
 PROMPT_FINAL_SUMMARY = (
     "你是一位专注于深度剧情解析的影视解说文案创作者。全片播放结束，请根据所有的剧情阶段回顾，撰写一份细节丰富、剧情连贯的解说文案。\n"
     "【关键要求】\n"
@@ -76,35 +150,503 @@ PROMPT_FINAL_SUMMARY = (
 #                                 代码主体
 # =========================================================================
 
-class VideoAnalyzerApp:
-    def __init__(self, root):
-        self.root = root
-        self.root.title("CineScribe_VLM")
-        self.root.geometry("1200x900")
+def create_endpoint_pools(client):
+    """按配置为 vlm (单帧分析) / summary 两个角色创建端点池"""
+    return {role: EndpointPool(client, role, endpoints, LOAD_BALANCE_POLICY, ENDPOINT_MAX_FAILURES,
+                               ENDPOINT_EJECT_SECONDS, LLM_MAX_RETRIES, RETRY_BACKOFF_SECONDS, HEDGE_REQUESTS)
+            for role, endpoints in (("vlm", LLM_ENDPOINTS), ("summary", SUMMARY_ENDPOINTS))}
+
+
+def create_response_cache():
+    """按配置打开回复缓存；RESPONSE_CACHE_DIR 为空时不缓存"""
+    if not RESPONSE_CACHE_DIR:
+        return None
+    return ResponseCache(RESPONSE_CACHE_DIR, RESPONSE_CACHE_MAX_MB * 1024 * 1024)
+
+
+class PhaseSummaryJob:
+    """一次后台阶段回顾：触发时的单帧记录快照，生成结果写入日志中预留的位置"""
+
+    def __init__(self, recent_frames, slot):
+        self.recent_frames = recent_frames
+        self.slot = slot
+        self.done = threading.Event()
+
+
+class AnalysisEngine:
+    """
+    无界面分析引擎：帧来源 → 视觉去重 → 单帧分析 → 阶段回顾 → 最终解说。
+    不依赖 tkinter；GUI 与命令行都通过 add_listener 订阅事件：
+    log / summary / final / capture / preview / diff / stats / network / cache / budget / imaging / finished，
+    以及阶段回顾与最终解说的流式输出 stream_start / stream_token / stream_end。
+    """
+
+    def __init__(self, source, sampling_interval=DEFAULT_INTERVAL, log_dir=".", client=None, cache=None):
+        self.source = source
+        # 可传入共享的 LLMClient，让同一进程中的多个会话复用连接池
+        self.client = client or LLMClient(HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT, MAX_REQUESTS_PER_ENDPOINT,
+                                          PROMPT_CACHE_OPTIONS)
+        self.pools = create_endpoint_pools(self.client)
+        self.cache = cache or create_response_cache()
+        self.budget = TokenBudget(PROMPT_TOKEN_BUDGETS)
+        self.sampling_interval = sampling_interval
+        self.log_dir = log_dir
+        self.listeners = []
 
         # 数据存储
         self.is_running = False
-        self.target_window_title = tk.StringVar(value="")
+        self.thread = None
         self.log_filename = ""
+        self.current_pts = 0.0  # 当前帧的显示时间戳 (秒)
+        self.current_frame = None
+        self.scheduler = None  # 自适应采样调度
+        self.summary_pool = None  # 后台阶段回顾 (单线程，按顺序生成)
+        self.journal = None  # 会话日志，阶段回顾按触发位置插入
+        self.story = None  # 阶段回顾 → 幕 → 全片 的分层汇总
+        self.imaging = None  # 送分析帧的缩放与编码进程池
 
         # 核心记忆库
-        self.raw_frame_logs = []  # 存储每一次单帧分析的文本结果
-        self.phase_summaries = []  # 存储每一次阶段回顾的文本结果
-
-        self.sampling_interval = DEFAULT_INTERVAL
+        self.raw_frame_logs = SpillWindow(FRAME_LOG_WINDOW)  # 最近的单帧分析结果
+        self.phase_summaries = SpillWindow(SUMMARY_LOG_WINDOW)  # 最近的阶段回顾
+        self.final_report = None
 
         # 视觉去重状态
-        self.last_pil_image = None
+        self.detector = ChangeDetector(CHANGE_DETECTOR, SUBTITLE_BAND, SUBTITLE_CHANGE_THRESHOLD,
+                                       SCENE_CHANGE_THRESHOLD)
+        self.last_frame = None  # 上一次送去分析的帧
+        self.consecutive_skips = 0
+
+    # ================= 事件与会话控制 =================
+
+    def add_listener(self, callback):
+        """callback(event, data)；在分析线程中调用，GUI 需自行切回主线程"""
+        self.listeners.append(callback)
+
+    def emit(self, event, **data):
+        for callback in list(self.listeners):
+            try:
+                callback(event, data)
+            except Exception as e:
+                print(f"Listener error: {e}")
+
+    def start(self):
+        """在后台线程中运行，立即返回"""
+        self.is_running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """请求停止；分析线程会完成最终结算后退出"""
+        self.is_running = False
+
+    def wait(self, timeout=None):
+        if self.thread:
+            self.thread.join(timeout)
+
+    def run(self):
+        """阻塞运行整个会话 (命令行直接调用)"""
+        name = "" if self.source.is_live else os.path.splitext(os.path.basename(self.source.path))[0] + "_"
+        start_time_str = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.log_filename = os.path.join(self.log_dir, f"movie_log_v4_{name}{start_time_str}.txt")
+        self.journal = LogJournal(self.log_filename)
+        self.summary_pool = BatchWorkerPool(self.run_phase_summary, workers=1, max_queue=2, name="summary")
+        self.story = StoryTree(self.reduce_summaries, ACT_PHASES, REDUCE_INPUT_TOKENS, REDUCE_WORKERS)
+        # 每张送出图片的格式、质量、字节数、视觉 token 与编码耗时写入 *_images.csv
+        self.imaging = ImagePreprocessor(PREPROCESS_WORKERS, {"frame": FRAME_ENCODE_PROFILE},
+                                         log_path=os.path.splitext(self.log_filename)[0] + "_images.csv")
+
+        # 重置数据：挤出内存窗口的记录写入日志旁的 jsonl
+        log_base = os.path.splitext(self.log_filename)[0]
+        self.raw_frame_logs = SpillWindow(FRAME_LOG_WINDOW, log_base + "_frames.jsonl")
+        self.phase_summaries = SpillWindow(SUMMARY_LOG_WINDOW, log_base + "_summaries.jsonl")
+        self.final_report = None
+        self.budget = TokenBudget(PROMPT_TOKEN_BUDGETS)
+        self.last_frame = None
+        self.current_frame = None
         self.consecutive_skips = 0
+        self.current_pts = 0.0
+        # 每次采样决策写入 *_schedule.csv，用于权衡成本与覆盖率
+        self.scheduler = CaptureScheduler(
+            self.sampling_interval, MIN_CAPTURE_INTERVAL, MAX_CAPTURE_INTERVAL, calls_per_sample=1.0,
+            call_budget=CALL_BUDGET, duration=None if self.source.is_live else self.source.end,
+            enabled=ADAPTIVE_CAPTURE and ENABLE_VISUAL_DEDUP,
+            log_path=os.path.splitext(self.log_filename)[0] + "_schedule.csv")
+
+        self.is_running = True
+        try:
+            self.analysis_loop()
+        finally:
+            self.is_running = False
+            self.summary_pool.close(wait=False)
+            self.story.close()
+            self.imaging.close()
+            self.scheduler.close()
+            self.raw_frame_logs.close()
+            self.phase_summaries.close()
+            self.journal.close()
+            self.emit("finished", final=self.final_report, log_filename=self.log_filename)
+
+    # ================= 核心工具函数 =================
+
+    def calculate_image_diff(self, frame):
+        """
+        计算当前帧与上次分析帧的视觉差异 (ChangeScore)。
+        字幕带 (画面下 1/3) 与画面区分别比较，字幕变化或镜头切换都会触发分析。
+        """
+        return self.detector.compare(self.last_frame, frame)
+
+    def log_frame_result(self, message, tag="INFO"):
+        """记录单帧分析结果"""
+        if not self.source.is_live:
+            timestamp = format_pts(self.current_pts)  # 离线模式记录影片内时间
+        else:
+            timestamp = datetime.datetime.now().strftime("%H:%M:%S")
+        prefix = ""
+        if tag == "SKIP":
+            prefix = "⏭️ "
+        elif tag == "AI":
+            prefix = "🤖 "
+
+        full_msg = f"[{timestamp}] {prefix}{message}\n"
+        self.emit("log", text=full_msg, tag=tag)
+
+        # 仅当 tag 为 AI 时才写入文件
+        if tag == "AI":
+            self.journal.append(full_msg)
+
+    def log_summary_result(self, message):
+        """记录阶段回顾结果 (正文已在生成时流式写入界面与文件)"""
+        self.emit("summary", content=message)
+        self.log_frame_result(f"【触发回顾】 {message[:30]}...", tag="INFO")
+
+    def log_final_report(self, message):
+        """记录最终解说 (正文已在生成时流式写入界面与文件)"""
+        self.final_report = message
+        self.emit("final", content=message)
+
+    def control_video(self, action="pause"):
+        """尝试控制视频播放/暂停 (发送空格键)"""
+        if not AUTO_PAUSE_VIDEO or not self.source.is_live: return
+        try:
+            win = self.source.find_window()
+            if win:
+                import pyautogui
+                if not win.isActive:
+                    win.activate()
+                    time.sleep(0.2)
+                pyautogui.press('space')
+                print(f"Video action: {action}")
+        except Exception as e:
+            print(f"Video control failed: {e}")
+
+    def capture_screen_data(self):
+        """
+        从帧来源取一帧 (截屏或视频文件解码)，返回 PIL_Image；
+        送分析的 Base64 在确定分析后才由预处理进程生成，跳过的静止帧不编码
+        """
+        frame = self.source.read()
+        if frame is None:
+            return None
+        self.emit("capture", **self.source.stats())
+        self.current_pts = frame.pts
+        self.current_frame = frame
+        # 之后的缩放都生成新图、不修改原图，比较、预览与编码共用这一帧，不再复制
+        self.emit("preview", image=frame.image)
+        return frame.image
+
+    def calls_used(self):
+        """本次会话已发出的模型请求数 (缓存命中不计)"""
+        return sum(s["requests"] for s in self.client.stats().values())
+
+    def pool_stats(self):
+        return [pool.stats() for pool in self.pools.values()]
+
+    def call_llm(self, messages, max_tokens=200, kind="frame", role="vlm"):
+        """
+        非流式请求 (单帧分析 / 分幕汇总)，由角色 role 的端点池选择端点。
+        先查回复缓存，成功的回复写回缓存；kind 为预算统计的请求类型。
+        """
+        pool = self.pools[role]
+        key = None
+        if self.cache:
+            key = self.cache.make_key(pool.model, messages, max_tokens)
+            cached = self.cache.get(key)
+            if cached is not None:
+                self.emit("cache", **self.cache.stats())
+                return cached
+        self.budget.record(kind, pool.model, messages, max_tokens)
+        result = pool.chat(messages, max_tokens=max_tokens, temperature=0.6)
+        if key and result:
+            self.cache.put(key, result)
+        self.emit("network", stats=self.client.stats(), pools=self.pool_stats())
+        self.emit("budget", stats=self.budget.stats())
+        if self.cache:
+            self.emit("cache", **self.cache.stats())
+        return result
+
+    def call_llm_stream(self, kind, header, footer, messages, max_tokens=200, slot=None):
+        """
+        流式请求 (用于阶段回顾与最终解说)：header、token、footer 依次推送给订阅者
+        并写入日志中的占位 slot (None 时追加到日志末尾)，不必等整段生成完。记录首字延迟与生成速度。
+        """
+        self.emit("stream_start", kind=kind, text=header)
+        own_slot = slot is None
+        if own_slot:
+            slot = self.journal.reserve()
+        self.journal.write(slot, header)
+
+        def on_token(text):
+            self.emit("stream_token", kind=kind, text=text)
+            self.journal.write(slot, text)
+
+        pool = self.pools["summary"]
+        self.budget.record(kind, pool.model, messages, max_tokens)
+        metrics = {}
+        result = None
+        try:
+            result = pool.chat(messages, max_tokens=max_tokens, temperature=0.6, on_token=on_token, metrics=metrics)
+        finally:
+            tail = footer if result else "（生成失败）\n"
+            self.journal.write(slot, tail)
+            if own_slot:
+                self.journal.finish(slot)
+        self.emit("stream_end", kind=kind, text=tail, ok=result is not None, metrics=metrics)
+        self.emit("network", stats=self.client.stats(), pools=self.pool_stats())
+        if result:
+            self.log_frame_result(f"生成完成：{format_stream_metrics(metrics)}", tag="INFO")
+        return result
+
+    # ================= 核心 AI 流程 (优化版) =================
+
+    def analysis_loop(self):
+        while self.is_running:
+            loop_start = time.time()
+            pil_img = self.capture_screen_data()
+
+            if self.source.finished:
+                # 离线模式：文件读完即进入最终结算
+                self.is_running = False
+                break
+
+            should_analyze = False
+            changed = None  # 没有读到帧时不更新调度器的运动度
+
+            if pil_img:
+                changed = False
+                if ENABLE_VISUAL_DEDUP:
+                    score = self.calculate_image_diff(self.current_frame)
+                    self.emit("diff", value=score.level, subtitle=score.subtitle, picture=score.picture,
+                              changed=score.changed,
+                              thresholds=(self.detector.subtitle_threshold, self.detector.picture_threshold))
+
+                    changed = score.changed
+                    if score.changed or self.consecutive_skips >= MAX_SKIP_COUNT:
+                        should_analyze = True
+                        if self.consecutive_skips >= MAX_SKIP_COUNT:
+                            self.log_frame_result("强制分析 (超时)", tag="INFO")
+                        self.consecutive_skips = 0
+                        self.last_frame = self.current_frame
+                    else:
+                        should_analyze = False
+                        self.consecutive_skips += 1
+                        self.log_frame_result(f"画面静止 (Diff: 字幕 {score.subtitle:.1f} / 画面 {score.picture:.1f})，"
+                                              f"跳过分析", tag="SKIP")
+                else:
+                    should_analyze = True
+
+            if should_analyze:
+                # 长边缩小到 1024 后按 FRAME_ENCODE_PROFILE 编码
+                img_b64 = self.imaging.run("frame", [pil_img], max_dim=1024)
+                self.emit("imaging", **self.imaging.stats())
+                frame_result = self.perform_single_frame_analysis(img_b64)
+                if frame_result:
+                    self.raw_frame_logs.append(frame_result)
+                    self.log_frame_result(frame_result, tag="AI")
+                    if self.raw_frame_logs.total % SUMMARY_TRIGGER_COUNT == 0:
+                        self.trigger_phase_summary_sequence()
+
+            elapsed = time.time() - loop_start
+            # 调度器按画面变化与调用预算决定下一次采样间隔 (同步调用，后端变慢时 elapsed 自然变长)
+            current_loop_wait_setting = self.scheduler.next_interval(self.current_pts, changed, self.calls_used(),
+                                                                     sampled=should_analyze)
+            schedule_text = format_schedule_stats(self.scheduler.stats())
+
+            if not self.source.is_live:
+                # 离线模式：按媒体时间推进，不等待墙钟时间
+                self.source.advance(current_loop_wait_setting)
+                progress = self.source.progress()
+                progress_text = f"{progress * 100:.1f}%" if progress is not None else "-"
+                self.emit("stats", text=f"已分析: {self.raw_frame_logs.total}帧 | 阶段回顾: {self.phase_summaries.total} | "
+                                        f"耗时: {elapsed:.2f}s | 影片时间: {format_pts(self.current_pts)} ({progress_text})"
+                                        f" | {schedule_text}")
+                continue
+
+            wait_time = max(0.1, current_loop_wait_setting - elapsed)
+
+            self.emit("stats", text=f"已分析: {self.raw_frame_logs.total}帧 | 阶段回顾: {self.phase_summaries.total} | "
+                                    f"耗时: {elapsed:.2f}s | 下次: {wait_time:.1f}s | {schedule_text}")
+
+            time.sleep(wait_time)
+
+        self.source.close()
+        self.perform_final_summary_sequence()
+
+    def perform_single_frame_analysis(self, img_b64):
+        recent_frames = self.raw_frame_logs.recent(2)
+        # 系统消息 = 固定指令 + 只在阶段边界变化的历史剧情，作为后端可复用的稳定前缀；
+        # 每帧都变的最近记录与图片放在用户消息中，超出预算时只裁剪这部分
+        system = PROMPT_SINGLE_FRAME + PROMPT_STORY_CONTEXT.format(
+            history=self.story.context(SUMMARY_CONTEXT_TOKENS) or "无")
+        context_text = self.budget.fit(self.pools["vlm"].model, "【最近2帧记录】:\n{recent}", [
+            Section("recent", "\n".join(recent_frames) if recent_frames else "无")
+        ], fixed=system + "\n\n请分析下面这张图片：", images=[img_b64], max_tokens=150)
+
+        messages = [
+            {"role": "system", "content": system},
+            {"role": "user", "content": [
+                {"type": "text", "text": context_text + "\n\n请分析下面这张图片："},
+                {"type": "image_url", "image_url": {"url": img_b64}}
+            ]}
+        ]
+        return self.call_llm(messages, max_tokens=150)
+
+    def trigger_phase_summary_sequence(self):
+        """
+        把最近的单帧记录快照交给后台线程生成阶段回顾，日志中在当前位置为它预留内容，采集不中断。
+        AUTO_PAUSE_VIDEO 开启的实时模式下，暂停视频并等待回顾完成后再恢复 (旧行为)。
+        """
+        job = PhaseSummaryJob(self.raw_frame_logs.recent(10), self.journal.reserve())
+        pause = AUTO_PAUSE_VIDEO and self.source.is_live
+        if pause:
+            self.log_frame_result(">>> 触发阶段回顾，尝试暂停视频...", tag="INFO")
+            self.control_video("pause")
+            time.sleep(1.0)
+        else:
+            self.log_frame_result(">>> 触发阶段回顾 (后台生成)...", tag="INFO")
+
+        if not self.summary_pool.submit(job):
+            self.journal.finish(job.slot)
+            return
+
+        if pause:
+            job.done.wait()
+            self.log_frame_result(">>> 回顾完成，恢复视频播放...", tag="INFO")
+            self.control_video("play")
+
+    def run_phase_summary(self, job):
+        """后台线程：生成阶段回顾，完成后并入记忆库"""
+        try:
+            summary = self.perform_phase_summary(job.recent_frames, job.slot)
+            if summary:
+                self.phase_summaries.append(summary)
+                self.story.add_phase(summary)
+                self.log_summary_result(summary)
+        finally:
+            self.journal.finish(job.slot)
+            job.done.set()
+
+    def perform_phase_summary(self, recent_frames, slot=None):
+        system = PROMPT_PHASE_SUMMARY + PROMPT_STORY_CONTEXT.format(
+            history=self.story.context(SUMMARY_CONTEXT_TOKENS) or "无")
+        context_text = self.budget.fit(self.pools["summary"].model, "【最近10帧详细记录】:\n{recent}", [
+            Section("recent", "\n".join(recent_frames) if recent_frames else "无")
+        ], fixed=system + "\n\n请开始阶段回顾：", max_tokens=300)
+
+        messages = [
+            {"role": "system", "content": system},
+            {"role": "user", "content": context_text + "\n\n请开始阶段回顾："}
+        ]
+        timestamp = datetime.datetime.now().strftime("%H:%M")
+        return self.call_llm_stream("summary", f"\n=== 阶段回顾 [{timestamp}] ===\n", "\n=======================\n\n",
+                                    messages, max_tokens=300, slot=slot)
+
+    def reduce_summaries(self, items):
+        """汇总线程：把若干阶段回顾 / 幕 [(标签, 文本)] 合并为一段剧情梗概"""
+        text = self.budget.fit(self.pools["summary"].model, "{summaries}", [
+            Section("summaries", format_items(items), keep="head")
+        ], fixed=PROMPT_ACT_SUMMARY + "\n\n请合并为一段剧情梗概：", max_tokens=500)
+        messages = [
+            {"role": "system", "content": PROMPT_ACT_SUMMARY},
+            {"role": "user", "content": text + "\n\n请合并为一段剧情梗概："}
+        ]
+        summary = self.call_llm(messages, max_tokens=500, kind="act", role="summary")
+        if summary:
+            self.log_frame_result(f"已汇总 {items[0][0]} - {items[-1][0]}", tag="INFO")
+        return summary
+
+    def perform_final_summary_sequence(self):
+        self.log_frame_result(">>> 正在进行最终结算...", tag="INFO")
+        frames_since_last_summary = self.raw_frame_logs.total % SUMMARY_TRIGGER_COUNT
+        if frames_since_last_summary > 0:
+            self.log_frame_result(f"补齐剩余 {frames_since_last_summary} 帧的阶段回顾...", tag="INFO")
+            self.summary_pool.submit(PhaseSummaryJob(self.raw_frame_logs.recent(10), self.journal.reserve()))
+        # 等待后台回顾全部完成
+        self.summary_pool.close(wait=True)
+
+        final_report = self.perform_final_summary()
+        if final_report:
+            self.log_final_report(final_report)
+
+    def perform_final_summary(self):
+        # 各幕汇总完成后，超出提示词剩余空间的部分再分组汇总 (而不是截掉结尾)
+        model = self.pools["summary"].model
+        template = "【全片剧情线索(分幕与阶段回顾)】:\n{context}\n"
+        fixed = PROMPT_FINAL_SUMMARY + "\n\n请生成最终解说文案："
+        items = self.story.final_items(self.budget.available(model, template, ["context"], fixed, max_tokens=2000))
+        context_text = self.budget.fit(model, template, [
+            Section("context", format_items(items), keep="head")
+        ], fixed=fixed, max_tokens=2000)
+
+        messages = [
+            {"role": "system", "content": PROMPT_FINAL_SUMMARY},
+            {"role": "user", "content": context_text + "\n\n请生成最终解说文案："}
+        ]
+        return self.call_llm_stream("final", "\n\n★★★★★ 全片影视解说 ★★★★★\n", "\n", messages, max_tokens=2000)
+
+
+# =========================================================================
+#                                 图形界面
+# =========================================================================
+
+def load_gui_modules():
+    """导入 tkinter / ImageTk；仅在启动 GUI 时调用"""
+    global tk, ttk, scrolledtext, messagebox, filedialog, ImageTk
+    import tkinter
+    from tkinter import ttk as _ttk, scrolledtext as _scrolledtext, messagebox as _messagebox, \
+        filedialog as _filedialog
+    from PIL import ImageTk as _ImageTk
+    tk, ttk, scrolledtext, messagebox, filedialog = tkinter, _ttk, _scrolledtext, _messagebox, _filedialog
+    ImageTk = _ImageTk
+
+
+class VideoAnalyzerApp:
+    """GUI：只负责选择窗口/文件与裁切设置，启动引擎并显示引擎事件"""
+
+    def __init__(self, root):
+        self.root = root
+        self.root.title("CineScribe_VLM")
+        self.root.geometry("1200x900")
+
+        self.engine = None
+        self.target_window_title = tk.StringVar(value="")
+        self.video_path = tk.StringVar(value="")  # 非空时使用离线视频文件模式
 
         # 裁切设置 (上, 下, 左, 右) - 单位像素
         self.crop_top = tk.IntVar(value=0)
         self.crop_bottom = tk.IntVar(value=0)
         self.crop_left = tk.IntVar(value=0)
         self.crop_right = tk.IntVar(value=0)
+        for var in (self.crop_top, self.crop_bottom, self.crop_left, self.crop_right):
+            var.trace_add("write", self.on_crop_changed)
+
+        # 引擎事件：显示最新值的只保留最后一次，相邻的日志 / 流式文本拼接
+        self.ui_events = UIEventQueue(
+            latest=("preview", "diff", "stats", "network", "cache", "budget", "capture", "imaging"),
+            concat=("log", "stream_token"))
 
         # 界面初始化
         self.setup_ui()
+        self.root.after(UI_FRAME_INTERVAL_MS, self.drain_ui_events)
 
     def setup_ui(self):
         # 1. 顶部控制栏
@@ -118,6 +660,9 @@ class VideoAnalyzerApp:
         self.btn_pick = ttk.Button(control_frame, text="🖱️ 选取", command=self.start_window_picker)
         self.btn_pick.pack(side=tk.LEFT, padx=2)
 
+        self.btn_open_video = ttk.Button(control_frame, text="🎞️ 视频文件", command=self.choose_video_file)
+        self.btn_open_video.pack(side=tk.LEFT, padx=2)
+
         ttk.Separator(control_frame, orient=tk.VERTICAL).pack(side=tk.LEFT, padx=10, fill=tk.Y)
 
         ttk.Label(control_frame, text="间隔(s):").pack(side=tk.LEFT)
@@ -178,7 +723,7 @@ class VideoAnalyzerApp:
         self.lbl_image.pack(expand=True, fill=tk.BOTH, padx=5, pady=5)
 
         # 差异度显示
-        self.lbl_diff_val = ttk.Label(self.img_frame, text="视觉差异度(下1/3): 0.0", background="#eee", anchor="e")
+        self.lbl_diff_val = ttk.Label(self.img_frame, text="视觉差异度: -", background="#eee", anchor="e")
         self.lbl_diff_val.pack(fill=tk.X, padx=2, pady=2)
 
         # 阶段总结列表
@@ -198,102 +743,62 @@ class VideoAnalyzerApp:
         # 3. 底部状态栏
         self.lbl_stats = ttk.Label(self.root, text="统计: -", padding=5, relief=tk.SUNKEN)
         self.lbl_stats.pack(fill=tk.X)
+        self.lbl_network = ttk.Label(self.root, text="网络: -", padding=5, relief=tk.SUNKEN)
+        self.lbl_network.pack(fill=tk.X)
+        self.lbl_cache = ttk.Label(self.root, text="缓存: -", padding=5, relief=tk.SUNKEN)
+        self.lbl_cache.pack(fill=tk.X)
+        self.lbl_budget = ttk.Label(self.root, text="提示词 token: -", padding=5, relief=tk.SUNKEN)
+        self.lbl_budget.pack(fill=tk.X)
+        self.lbl_capture = ttk.Label(self.root, text="采集: -", padding=5, relief=tk.SUNKEN)
+        self.lbl_capture.pack(fill=tk.X)
+        self.lbl_imaging = ttk.Label(self.root, text="图像预处理: -", padding=5, relief=tk.SUNKEN)
+        self.lbl_imaging.pack(fill=tk.X)
 
-    # ================= 核心工具函数 =================
-
-    def calculate_image_diff(self, img_new):
-        """
-        计算当前帧与上一帧的视觉差异度。
-        仅检测画面下 1/3 区域，以极大提高对字幕变化的敏感度。
-        """
-        if self.last_pil_image is None:
-            return 100.0  # 第一帧，差异最大
-
-        try:
-            # 1. 获取图像尺寸
-            width, height = img_new.size
-
-            # 2. 定义下 1/3 的裁切区域 (Left, Top, Right, Bottom)
-            # 假设字幕通常在底部，专注检测这里可以忽略画面上方的背景微动，但敏锐捕捉字幕
-            crop_top = int(height * (2 / 3))
-            crop_box = (0, crop_top, width, height)
-
-            # 3. 裁切并缩放进行比较
-            img1_part = self.last_pil_image.crop(crop_box).resize((64, 20)).convert("RGB")  # 保持一定比例缩放
-            img2_part = img_new.crop(crop_box).resize((64, 20)).convert("RGB")
-
-            # 4. 计算差异图像
-            diff_img = ImageChops.difference(img1_part, img2_part)
-
-            # 5. 计算平均差异值 (0-255)
-            stat = ImageStat.Stat(diff_img)
-            diff_val = sum(stat.mean) / len(stat.mean)
-            return diff_val
-        except Exception as e:
-            print(f"Diff calc error: {e}")
-            return 100.0
-
-    def log_frame_result(self, message, tag="INFO"):
-        """记录单帧分析结果"""
-        timestamp = datetime.datetime.now().strftime("%H:%M:%S")
-        prefix = ""
-        if tag == "SKIP":
-            prefix = "⏭️ "
-        elif tag == "AI":
-            prefix = "🤖 "
-
-        full_msg = f"[{timestamp}] {prefix}{message}\n"
-        self._append_text(self.txt_log, full_msg)
+    def _append_text(self, widget, text):
+        append_capped(widget, [(text, None)], LOG_VIEW_MAX_LINES)
 
-        # 仅当 tag 为 AI 时才写入文件
-        if self.log_filename and tag == "AI":
-            with open(self.log_filename, "a", encoding="utf-8") as f:
-                f.write(full_msg)
+    def show_preview(self, img):
+        # UI 显示用的缩略图 (直接缩小，不复制原图)
+        img_display = fit_box(img, PREVIEW_SIZE)
+        self.photo = ImageTk.PhotoImage(img_display)
+        self.lbl_image.config(image=self.photo, text="")
 
-    def log_summary_result(self, message):
-        """记录阶段回顾结果"""
-        timestamp = datetime.datetime.now().strftime("%H:%M")
-        full_msg = f"\n=== 阶段回顾 [{timestamp}] ===\n{message}\n=======================\n\n"
-        self._append_text(self.txt_summary, full_msg)
-        self.log_frame_result(f"【触发回顾】 {message[:30]}...", tag="INFO")
-        if self.log_filename:
-            with open(self.log_filename, "a", encoding="utf-8") as f:
-                f.write(full_msg)
+    # ================= 业务逻辑 =================
 
-    def log_final_report(self, message):
-        """记录最终解说"""
-        self._append_text(self.txt_log, "\n\n★★★★★ 全片影视解说 ★★★★★\n" + message + "\n")
-        if self.log_filename:
-            with open(self.log_filename, "a", encoding="utf-8") as f:
-                f.write("\n\n★★★★★ 全片影视解说 ★★★★★\n" + message)
+    def get_crop(self):
+        return self.crop_top.get(), self.crop_bottom.get(), self.crop_left.get(), self.crop_right.get()
 
-    def _append_text(self, widget, text):
-        widget.config(state='normal')
-        widget.insert(tk.END, text)
-        widget.see(tk.END)
-        widget.config(state='disabled')
-
-    def control_video(self, action="pause"):
-        """尝试控制视频播放/暂停 (发送空格键)"""
-        if not AUTO_PAUSE_VIDEO: return
-        target_title = self.target_window_title.get()
-        if not target_title or not gw: return
+    def on_crop_changed(self, *_):
+        """运行中调整裁切值时同步给帧来源，与原来每帧重新读取裁切设置的行为一致"""
+        if not (self.engine and self.engine.is_running):
+            return
         try:
-            wins = gw.getWindowsWithTitle(target_title)
-            if wins:
-                win = wins[0]
-                if not win.isActive:
-                    win.activate()
-                    time.sleep(0.2)
-                pyautogui.press('space')
-                print(f"Video action: {action}")
-        except Exception as e:
-            print(f"Video control failed: {e}")
-
-    # ================= 业务逻辑 =================
+            crop = self.get_crop()
+        except tk.TclError:
+            return  # 输入框正在编辑 (空值或非数字)，等输入完整后再生效
+        self.engine.source.set_crop(crop)
+
+    def create_source(self):
+        """根据当前选择创建帧来源：视频文件优先，否则按窗口标题实时截屏"""
+        if self.video_path.get():
+            return VideoFileSource(self.video_path.get(), crop=self.get_crop())
+        return WindowSource(self.target_window_title.get(), crop=self.get_crop(), backend=CAPTURE_BACKEND)
+
+    def choose_video_file(self):
+        path = filedialog.askopenfilename(
+            title="选择视频文件",
+            filetypes=[("视频文件", "*.mp4 *.mkv *.avi *.mov *.flv *.wmv *.ts *.webm"), ("所有文件", "*.*")]
+        )
+        if path:
+            self.video_path.set(path)
+            self.target_window_title.set("")
+            self.lbl_status.config(text=f"离线文件: {os.path.basename(path)}", foreground="green")
+            self.preview_capture()
 
     def start_window_picker(self):
-        if not gw:
+        try:
+            import pygetwindow  # noqa: F401  仅检查是否安装
+        except ImportError:
             messagebox.showerror("错误", "未安装 pygetwindow")
             return
         self.lbl_status.config(text="请点击目标窗口...", foreground="blue")
@@ -305,6 +810,7 @@ class VideoAnalyzerApp:
         self.picker_win.bind('<Escape>', lambda e: self.picker_win.destroy())
 
     def on_picker_click(self, event):
+        import pygetwindow as gw
         x, y = self.root.winfo_pointerx(), self.root.winfo_pointery()
         self.picker_win.destroy()
         self.root.update()
@@ -315,6 +821,7 @@ class VideoAnalyzerApp:
                     if "Video AI Analyzer" in w.title: continue
                     if w.title:
                         self.target_window_title.set(w.title)
+                        self.video_path.set("")
                         self.lbl_status.config(text=f"已锁定: {w.title}", foreground="green")
                         self.preview_capture()
                         return
@@ -324,229 +831,183 @@ class VideoAnalyzerApp:
 
     def preview_capture(self):
         """不进行分析，仅刷新预览图以供调整裁切"""
-        if not self.target_window_title.get():
+        if not self.target_window_title.get() and not self.video_path.get():
             return
-        img, _ = self.capture_screen_data()
-        if img is None:
+        try:
+            source = self.create_source()
+        except (RuntimeError, ImportError) as e:
+            self.lbl_status.config(text=str(e), foreground="red")
+            return
+        frame = source.read()
+        source.close()
+        if frame is None:
             self.lbl_status.config(text="获取预览失败，窗口可能已关闭或最小化", foreground="red")
+            return
+        self.show_preview(frame.image)
 
     def start_analysis(self):
-        if not self.target_window_title.get():
-            messagebox.showerror("错误", "请先选择目标窗口！")
+        if not self.target_window_title.get() and not self.video_path.get():
+            messagebox.showerror("错误", "请先选择目标窗口或视频文件！")
             return
 
         try:
-            self.sampling_interval = float(self.spin_interval.get())
+            sampling_interval = float(self.spin_interval.get())
         except:
-            self.sampling_interval = DEFAULT_INTERVAL
+            sampling_interval = DEFAULT_INTERVAL
 
-        start_time_str = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        self.log_filename = f"movie_log_v4_{start_time_str}.txt"
+        try:
+            source = self.create_source()
+        except (RuntimeError, ImportError) as e:
+            messagebox.showerror("错误", str(e))
+            return
 
-        # 重置数据
-        self.raw_frame_logs = []
-        self.phase_summaries = []
-        self.last_pil_image = None
-        self.consecutive_skips = 0
+        self.engine = AnalysisEngine(source, sampling_interval=sampling_interval)
+        self.engine.add_listener(self.on_engine_event)
 
-        self.is_running = True
         self.btn_start.config(state=tk.DISABLED)
         self.btn_stop.config(state=tk.NORMAL)
         self.lbl_status.config(text="运行中", foreground="green")
 
-        threading.Thread(target=self.analysis_loop, daemon=True).start()
+        self.engine.start()
 
     def stop_analysis_trigger(self):
-        if self.is_running:
-            self.is_running = False
+        if self.engine and self.engine.is_running:
+            self.engine.stop()
             self.lbl_status.config(text="正在停止并生成最终报告...", foreground="orange")
 
-    def capture_screen_data(self):
-        """捕获屏幕，并根据裁切设置处理图像，返回 (PIL_Image, Base64_String)"""
-        if not gw: return None, None
-        try:
-            windows = gw.getWindowsWithTitle(self.target_window_title.get())
-            if windows:
-                win = windows[0]
-
-                # 获取用户设置的裁切值
-                c_top = self.crop_top.get()
-                c_bottom = self.crop_bottom.get()
-                c_left = self.crop_left.get()
-                c_right = self.crop_right.get()
+    def on_engine_event(self, event, data):
+        """引擎事件来自分析线程：预览在这里缩小，再放入合并队列，由 Tk 主线程按帧率取出"""
+        if event == "preview":
+            data = dict(data, image=fit_box(data["image"], PREVIEW_SIZE))
+        self.ui_events.put(event, data)
 
-                real_left = win.left + c_left
-                real_top = win.top + c_top
-                real_width = win.width - c_left - c_right
-                real_height = win.height - c_top - c_bottom
-
-                if real_width <= 10: real_width = 100
-                if real_height <= 10: real_height = 100
-
-                screenshot = pyautogui.screenshot(region=(real_left, real_top, real_width, real_height))
-
-                # 保持原图用于比较
-                original_img = screenshot.copy()
-
-                # UI 显示用的缩略图
-                img_display = screenshot.copy()
-                img_display.thumbnail((380, 250))
-                self.photo = ImageTk.PhotoImage(img_display)
-                self.lbl_image.config(image=self.photo, text="")
-
-                # LLM 用的 Base64
-                screenshot.thumbnail((1024, 1024))
-                buffered = io.BytesIO()
-                screenshot.save(buffered, format="JPEG", quality=80)
-                b64_str = f"data:image/jpeg;base64,{base64.b64encode(buffered.getvalue()).decode()}"
-
-                return original_img, b64_str
-        except Exception as e:
-            print(f"Capture error: {e}")
-        return None, None
-
-    def call_llm(self, messages, max_tokens=200):
-        payload = {
-            "model": MODEL_ID,
-            "messages": messages,
-            "temperature": 0.6,
-            "max_tokens": max_tokens
-        }
+    def drain_ui_events(self):
+        """Tk 主线程：每帧处理一次积累的引擎事件"""
         try:
-            resp = requests.post(LLM_API_URL, json=payload, timeout=60)
-            if resp.status_code == 200:
-                return resp.json()['choices'][0]['message']['content']
-        except Exception as e:
-            print(f"LLM Error: {e}")
-        return None
-
-    # ================= 核心 AI 流程 (优化版) =================
-
-    def analysis_loop(self):
-        while self.is_running:
-            loop_start = time.time()
-            pil_img, img_b64 = self.capture_screen_data()
-
-            should_analyze = False
-            diff_val = 0.0
-            current_loop_wait_setting = self.sampling_interval
-
-            if pil_img and img_b64:
-                if ENABLE_VISUAL_DEDUP:
-                    diff_val = self.calculate_image_diff(pil_img)
-
-                    diff_color = "red" if diff_val > SCENE_CHANGE_THRESHOLD else "green"
-                    self.root.after(0, lambda v=diff_val, c=diff_color: self.lbl_diff_val.config(
-                        text=f"视觉差异度(下1/3): {v:.2f} (阈值: {SCENE_CHANGE_THRESHOLD})", foreground=c
-                    ))
-
-                    if diff_val > SCENE_CHANGE_THRESHOLD or self.consecutive_skips >= MAX_SKIP_COUNT:
-                        should_analyze = True
-                        if self.consecutive_skips >= MAX_SKIP_COUNT:
-                            self.log_frame_result("强制分析 (超时)", tag="INFO")
-                        self.consecutive_skips = 0
-                        self.last_pil_image = pil_img
-                        current_loop_wait_setting = self.sampling_interval
-                    else:
-                        should_analyze = False
-                        self.consecutive_skips += 1
-                        self.log_frame_result(f"画面静止 (Diff: {diff_val:.1f})，延后0.5s检测...", tag="SKIP")
-                        current_loop_wait_setting = 0.5
-                else:
-                    should_analyze = True
-                    current_loop_wait_setting = self.sampling_interval
-
-            if should_analyze and img_b64:
-                frame_result = self.perform_single_frame_analysis(img_b64)
-                if frame_result:
-                    self.raw_frame_logs.append(frame_result)
-                    self.log_frame_result(frame_result, tag="AI")
-                    if len(self.raw_frame_logs) % SUMMARY_TRIGGER_COUNT == 0:
-                        self.trigger_phase_summary_sequence()
-
-            elapsed = time.time() - loop_start
-            wait_time = max(0.1, current_loop_wait_setting - elapsed)
-
-            self.root.after(0, lambda e=elapsed, w=wait_time: self.lbl_stats.config(
-                text=f"已分析: {len(self.raw_frame_logs)}帧 | 阶段回顾: {len(self.phase_summaries)} | 耗时: {e:.2f}s | 下次: {w:.1f}s"
-            ))
-
-            time.sleep(wait_time)
-
-        self.perform_final_summary_sequence()
-        self.root.after(0, lambda: self.btn_start.config(state=tk.NORMAL))
-        self.root.after(0, lambda: self.btn_stop.config(state=tk.DISABLED))
-        self.lbl_status.config(text="已完成", foreground="gray")
-
-    def perform_single_frame_analysis(self, img_b64):
-        context_text = "【已知历史剧情(阶段回顾)】:\n" + (
-            "\n".join(self.phase_summaries) if self.phase_summaries else "无")
-        recent_frames = self.raw_frame_logs[-2:]
-        context_text += "\n\n【最近2帧记录】:\n" + ("\n".join(recent_frames) if recent_frames else "无")
-
-        messages = [
-            {"role": "system", "content": PROMPT_SINGLE_FRAME},
-            {"role": "user", "content": [
-                {"type": "text", "text": context_text + "\n\n请分析下面这张图片："},
-                {"type": "image_url", "image_url": {"url": img_b64}}
-            ]}
-        ]
-        return self.call_llm(messages, max_tokens=150)
-
-    def trigger_phase_summary_sequence(self):
-        self.log_frame_result(">>> 触发阶段回顾，尝试暂停视频...", tag="INFO")
-        self.control_video("pause")
-        time.sleep(1.0)
-
-        summary = self.perform_phase_summary()
-        if summary:
-            self.phase_summaries.append(summary)
-            self.log_summary_result(summary)
-
-        self.log_frame_result(">>> 回顾完成，恢复视频播放...", tag="INFO")
-        self.control_video("play")
-
-    def perform_phase_summary(self):
-        context_text = "【已知历史剧情(阶段回顾)】:\n" + (
-            "\n".join(self.phase_summaries) if self.phase_summaries else "无")
-        recent_frames = self.raw_frame_logs[-10:]
-        context_text += "\n\n【最近10帧详细记录】:\n" + ("\n".join(recent_frames) if recent_frames else "无")
-
-        messages = [
-            {"role": "system", "content": PROMPT_PHASE_SUMMARY},
-            {"role": "user", "content": context_text + "\n\n请开始阶段回顾："}
-        ]
-        return self.call_llm(messages, max_tokens=300)
-
-    def perform_final_summary_sequence(self):
-        self.log_frame_result(">>> 正在进行最终结算...", tag="INFO")
-        frames_since_last_summary = len(self.raw_frame_logs) % SUMMARY_TRIGGER_COUNT
-        if frames_since_last_summary > 0:
-            self.log_frame_result(f"补齐剩余 {frames_since_last_summary} 帧的阶段回顾...", tag="INFO")
-            summary = self.perform_phase_summary()
-            if summary:
-                self.phase_summaries.append(summary)
-                self.log_summary_result(summary)
-
-        final_report = self.perform_final_summary()
-        if final_report:
-            self.log_final_report(final_report)
+            for event, data in self.ui_events.drain():
+                self.handle_engine_event(event, data)
+        finally:
+            self.root.after(UI_FRAME_INTERVAL_MS, self.drain_ui_events)
+
+    def handle_engine_event(self, event, data):
+        if event == "log":
+            self._append_text(self.txt_log, data["text"])
+        elif event in ("stream_start", "stream_token", "stream_end"):
+            # 阶段回顾流式写入回顾栏，最终解说写入日志栏
+            widget = self.txt_summary if data["kind"] == "summary" else self.txt_log
+            self._append_text(widget, data["text"])
+        elif event == "final":
             messagebox.showinfo("完成", "全片解说已生成")
+        elif event == "preview":
+            self.show_preview(data["image"])
+        elif event == "diff":
+            diff_color = "red" if data["changed"] else "green"
+            self.lbl_diff_val.config(text=f"视觉差异度 字幕(下1/3): {data['subtitle']:.1f} | 画面: {data['picture']:.1f} "
+                                          f"(阈值 {data['thresholds'][0]:.0f}/{data['thresholds'][1]:.0f})", foreground=diff_color)
+        elif event == "stats":
+            self.lbl_stats.config(text=data["text"])
+        elif event == "network":
+            text = "\n".join(filter(None, [format_client_stats(data["stats"]), format_pool_stats(data["pools"])]))
+            self.lbl_network.config(text="网络: " + text)
+        elif event == "cache":
+            self.lbl_cache.config(text=format_cache_stats(data))
+        elif event == "budget":
+            self.lbl_budget.config(text=format_budget_stats(data["stats"]))
+        elif event == "capture":
+            self.lbl_capture.config(text=format_capture_stats(data))
+        elif event == "imaging":
+            self.lbl_imaging.config(text=format_imaging_stats(data))
+        elif event == "finished":
+            self.btn_start.config(state=tk.NORMAL)
+            self.btn_stop.config(state=tk.DISABLED)
+            self.lbl_status.config(text="已完成", foreground="gray")
 
-    def perform_final_summary(self):
-        context_text = "【全片剧情线索(阶段回顾)】:\n"
-        for i, s in enumerate(self.phase_summaries):
-            context_text += f"阶段 {i + 1}: {s}\n"
-
-        messages = [
-            {"role": "system", "content": PROMPT_FINAL_SUMMARY},
-            {"role": "user", "content": context_text + "\n\n请生成最终解说文案："}
-        ]
-        return self.call_llm(messages, max_tokens=2000)
 
+# =========================================================================
+#                                 命令行入口
+# =========================================================================
 
-if __name__ == "__main__":
+def print_event(event, data):
+    """命令行订阅者：把分析记录打印到标准输出"""
+    if event == "log" and data["tag"] != "SKIP":
+        print(data["text"], end="", flush=True)
+    elif event == "summary":
+        # 阶段回顾在后台生成，与单帧记录交错，生成完毕后整段打印
+        print(f"\n=== 阶段回顾 ===\n{data['content']}\n", flush=True)
+    elif event in ("stream_start", "stream_token", "stream_end") and data["kind"] == "final":
+        print(data["text"], end="", flush=True)
+
+
+def run_headless(args):
+    crop = tuple(int(v) for v in args.crop.split(","))
+    if args.video:
+        source = VideoFileSource(args.video, start=args.start, end=args.end, crop=crop)
+    elif args.synthetic:
+        source = SyntheticSource(args.synthetic, start=args.start)
+    else:
+        source = WindowSource(args.window, crop=crop, backend=CAPTURE_BACKEND)
+
+    os.makedirs(args.out, exist_ok=True)
+    engine = AnalysisEngine(source, sampling_interval=args.interval, log_dir=args.out)
+    engine.add_listener(print_event)
+    engine.start()
+    try:
+        while engine.thread.is_alive():
+            engine.wait(0.5)
+            if args.duration and source.is_live and time.time() - source.start_time > args.duration:
+                engine.stop()
+    except KeyboardInterrupt:
+        print("Stopping, generating final report...")
+        engine.stop()
+        engine.wait()
+
+    if engine.final_report:
+        report_path = os.path.splitext(engine.log_filename)[0] + "_final.txt"
+        with open(report_path, "w", encoding="utf-8") as f:
+            f.write(engine.final_report)
+        print(f"Final report: {report_path}")
+    print(f"Log: {engine.log_filename}")
+    print(format_capture_stats(engine.source.stats()))
+    print(format_client_stats(engine.client.stats()))
+    pools = format_pool_stats(engine.pool_stats())
+    if pools:
+        print(pools)
+    stats = engine.story.stats()
+    print(f"分层汇总: {stats['phases']} 个阶段 → {stats['acts']} 幕 | 汇总请求 {stats['reductions']}")
+    schedule = engine.scheduler.stats()
+    print(format_schedule_stats(schedule) + " | 约束: " +
+          ", ".join(f"{reason} {count}" for reason, count in sorted(schedule["reasons"].items())))
+    if engine.cache:
+        print(format_cache_stats(engine.cache.stats()))
+    print(format_budget_stats(engine.budget.stats()))
+    print(format_imaging_stats(engine.imaging.stats()))
+    print(format_session_stats({"单帧": engine.raw_frame_logs.stats(), "阶段回顾": engine.phase_summaries.stats()}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CineScribe VLM v1。不带参数时启动图形界面。")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--video", help="离线分析本地视频文件 (无界面)")
+    group.add_argument("--window", help="无界面实时截取指定标题的窗口")
+    group.add_argument("--synthetic", type=float, metavar="SECONDS", help="分析程序生成的测试画面 (无界面，用于测试)")
+    parser.add_argument("--out", default=".", help="日志与报告输出目录")
+    parser.add_argument("--interval", type=float, default=DEFAULT_INTERVAL, help="采样间隔 (秒)")
+    parser.add_argument("--crop", default="0,0,0,0", help="边缘裁切 上,下,左,右 (px)")
+    parser.add_argument("--start", type=float, default=0.0, help="离线模式起始时间 (秒)")
+    parser.add_argument("--end", type=float, default=None, help="离线模式结束时间 (秒)")
+    parser.add_argument("--duration", type=float, default=None, help="实时模式运行时长 (秒)，默认直到 Ctrl+C")
+    args = parser.parse_args()
+
+    if args.video or args.window or args.synthetic:
+        run_headless(args)
+        return
+
+    load_gui_modules()
     root = tk.Tk()
     app = VideoAnalyzerApp(root)
 
     root.mainloop()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,29 @@
-import tkinter as tk
-from tkinter import ttk, scrolledtext, messagebox
 import threading
 import time
 import datetime
-import requests
-import base64
-import pyautogui
-import io
+import argparse
 import os
-import difflib
 import ctypes
 from ctypes import wintypes
-from PIL import Image, ImageTk, ImageChops, ImageStat, ImageDraw
+
+from cinescribe.balancer import EndpointPool, format_pool_stats
+from cinescribe.cache import ResponseCache, format_cache_stats
+from cinescribe.dedup import SubtitleDeduplicator
+from cinescribe.gating import ChangeDetector, SubtitleStripFilter
+from cinescribe.imaging import ImagePreprocessor, fit_box, format_imaging_stats
+from cinescribe.journal import LogJournal
+from cinescribe.llm import LLMClient, format_client_stats, format_stream_metrics
+from cinescribe.pipeline import BatchWorkerPool, OrderedSequencer
+from cinescribe.routing import CascadeRouter, format_route_stats
+from cinescribe.scheduler import CaptureScheduler, format_schedule_stats
+from cinescribe.session import SpillWindow, append_capped, format_session_stats
+from cinescribe.summarize import StoryTree, format_items
+from cinescribe.uiqueue import UIEventQueue
+from cinescribe.tokens import Section, TokenBudget, format_budget_stats
+from cinescribe.sources import ScreenRegionSource, SyntheticSource, VideoFileSource, format_capture_stats, format_pts
+
+# GUI 依赖按需导入 (见 load_gui_modules)，无界面模式不会加载 tkinter
+tk = ttk = scrolledtext = messagebox = filedialog = ImageTk = None
 
 # =========================================================================
 #                                 配置区域
@@ -24,21 +36,106 @@ OCR_MODEL_ID = "qwen/qwen3-vl-4b"
 VLM_API_URL = "http://192.168.71.10:1234/v1/chat/completions"
 VLM_MODEL_ID = "qwen/qwen3-vl-30b"
 
+# --- 端点池 (每个角色可配置多个 (地址, 模型 ID)，同一角色的模型 ID 须一致；增加 GPU 服务器只需追加端点) ---
+OCR_ENDPOINTS = [(OCR_API_URL, OCR_MODEL_ID)]
+VLM_ENDPOINTS = [(VLM_API_URL, VLM_MODEL_ID)]
+VLM_SMALL_ENDPOINTS = OCR_ENDPOINTS  # 简单批次的剧情分析 (级联路由的小模型层，默认与 OCR 共用 4B)
+SUMMARY_ENDPOINTS = VLM_ENDPOINTS  # 阶段回顾 / 分幕汇总 / 最终解说
+LOAD_BALANCE_POLICY = "least_outstanding"  # "least_outstanding" 在途请求最少 / "latency" 观测延迟最低
+ENDPOINT_MAX_FAILURES = 3  # 连续失败多少次后熔断端点 (期间请求直接跳过，不再等待超时)
+ENDPOINT_EJECT_SECONDS = 30  # 熔断多久后做健康检查，通过后重新接入
+LLM_MAX_RETRIES = 1  # 请求失败后的重试次数 (优先换一个端点)
+RETRY_BACKOFF_SECONDS = 1.0  # 首次重试前的最大等待 (随机抖动)，之后每次翻倍
+HEDGE_REQUESTS = True  # 非流式请求超过该角色 p95 延迟仍未返回时，向另一个端点发送副本 (需要多个端点)
+
+# --- 网络连接 (所有端点共用长连接池) ---
+HTTP_CONNECT_TIMEOUT = 5  # 建立连接超时 (秒)
+HTTP_READ_TIMEOUT = 90  # 等待模型回复超时 (秒)
+MAX_REQUESTS_PER_ENDPOINT = 2  # 每个端点的并发请求上限
+# 附加到每个请求的后端参数：llama.cpp 的 cache_prompt 复用相同提示词前缀的 KV 缓存；
+# 端点拒绝时自动去掉，设为 {} 不附加
+PROMPT_CACHE_OPTIONS = {"cache_prompt": True}
+
+# --- 提示词 token 预算 (每次请求 输入 + 输出 的上限，超出时按优先级裁剪历史段落) ---
+PROMPT_TOKEN_BUDGETS = {OCR_MODEL_ID: 4096, VLM_MODEL_ID: 8192}
+
+# --- 回复缓存 (OCR / 批次 VLM，按模型 + 提示词 + 图片感知哈希寻址，重跑同一部片直接命中) ---
+RESPONSE_CACHE_DIR = "response_cache"  # 设为 None 关闭缓存
+RESPONSE_CACHE_MAX_MB = 200  # 超出后按最近使用时间淘汰
+
+# --- 截屏 ---
+CAPTURE_BACKEND = "auto"  # "mss" 只抓取框选区域 (快) / "pyautogui" / "auto" 已安装 mss 时使用 mss
+
 # --- 运行参数 ---
-CAPTURE_INTERVAL = 2.5  # 采样间隔 (秒)
-BATCH_SIZE = 4  # 4帧拼接 (约10秒)
-SUMMARY_TRIGGER_BATCHES = 6  # 6次批处理后触发阶段回顾 (约60秒)
+CAPTURE_INTERVAL = 2.5  # 初始采样间隔 (秒)
+BATCH_SIZE = 4  # 4帧拼接 (按初始采样间隔约10秒)
+SUMMARY_TRIGGER_BATCHES = 6  # 6次批处理后触发阶段回顾 (按初始采样间隔约60秒)
+# 阶段回顾在后台生成，不打断采集；开启后实时模式仍会在回顾期间暂停播放器并等待生成完毕 (旧行为)
+AUTO_PAUSE_VIDEO = False
+
+# --- 会话记录 (内存中只保留提示词会读到的最近几条，更早的追加到日志旁的 *_batches.jsonl / *_summaries.jsonl) ---
+# 批次记录：阶段回顾读最近 SUMMARY_TRIGGER_BATCHES 条，多留一倍供后台回顾积压时使用 (更早的从磁盘读回)
+BATCH_LOG_WINDOW = 2 * SUMMARY_TRIGGER_BATCHES
+SUMMARY_LOG_WINDOW = 2  # 阶段回顾原文 (提示词中的全局脉络由 StoryTree 维护)
+LOG_VIEW_MAX_LINES = 2000  # 界面剧情流 / 回顾栏最多保留的行数，更早的内容只在日志文件中
+UI_FRAME_INTERVAL_MS = 50  # 界面刷新间隔 (毫秒)：引擎事件在分析线程中合并，界面每帧统一处理一次
+PREVIEW_SIZE = (280, 200)  # 预览缩略图尺寸，在分析线程中缩好再交给界面
+
+# --- 分层汇总 (阶段回顾 → 幕 → 全片，每次请求的输入有上限) ---
+ACT_PHASES = 4  # 每 4 个阶段回顾在后台汇总为一幕 (约 4 分钟)
+SUMMARY_CONTEXT_TOKENS = 1500  # 阶段回顾提示词中全局脉络的上限 (估算 token)
+REDUCE_INPUT_TOKENS = 6000  # 幕汇总与最终解说输入的上限；超出时分组再汇总一层
+REDUCE_WORKERS = 2  # 并行汇总的线程数
+
+# --- 自适应采样 (画面变化快时加密，静止、队列积压或后端变慢时放缓) ---
+ADAPTIVE_CAPTURE = True
+MIN_CAPTURE_INTERVAL = 1.0  # 最短采样间隔 (秒)
+MAX_CAPTURE_INTERVAL = 8.0  # 最长采样间隔 (秒)
+CALL_BUDGET = None  # 每部片最多调用模型的次数 (None 不限)；离线模式按剩余片长平均分配
 
 # --- 自适应分辨率 ---
 OCR_TARGET_WIDTH = 1024
 VLM_MAX_DIMENSION = 1560
+# 拼接 / 缩放 / JPEG 编码交给独立进程 (帧像素经共享内存传递)，不占用批处理线程的 GIL；0 在批处理线程内处理
+PREPROCESS_WORKERS = 2
+# 图片编码 (每个角色一套)：format "JPEG" / "PNG" / "WEBP" (llama.cpp 的图片解码不支持 WebP)，quality 有损质量，
+# grayscale 转灰度，subsampling JPEG 色度抽样 "4:4:4" / "4:2:2" / "4:2:0"，max_bytes 超出时逐级降低质量 (不低于 min_quality)
+OCR_ENCODE_PROFILE = {"format": "JPEG", "quality": 85, "grayscale": True}  # 字幕识别只需要亮度
+VLM_ENCODE_PROFILE = {"format": "JPEG", "quality": 80, "subsampling": "4:2:0", "max_bytes": 400 * 1024}
+
+# --- 级联模型路由 (按运动度 / 镜头切换 / 字幕密度给批次打分，简单批次交给小模型) ---
+MODEL_CASCADE = True  # 关闭后剧情分析全部使用大模型
+ROUTE_THRESHOLD = 0.35  # 批次难度 (0-1) 低于此值使用小模型
+ROUTE_ESCALATE = True  # 小模型回答未通过质量检查 (过短 / 看不懂画面) 时交给大模型重做
+ROUTE_MIN_ANSWER_CHARS = 30  # 质量检查要求的最少中文字数
 
 # --- 视觉参数 ---
-SCENE_CHANGE_THRESHOLD = 2.0
+CHANGE_DETECTOR = "phash"  # 变化检测方法: "mean" (平均像素差) / "dhash" / "phash" / "histogram"
+SUBTITLE_BAND = 1 / 5  # 字幕带占画面底部的比例 (同时用于截取 OCR 字幕条)
+SUBTITLE_CHANGE_THRESHOLD = None  # 字幕带差异阈值 (0-100)，None 使用检测方法的默认值
+SCENE_CHANGE_THRESHOLD = None  # 画面区差异阈值 (0-100)，None 使用检测方法的默认值
+ENABLE_VISUAL_DEDUP = True  # 跳过静止帧，整批静止时沿用上一片段的剧情
+MAX_SKIP_COUNT = 4  # 即使画面一直不动，每跳过多少帧也强制采集一帧
+
+# --- OCR 预过滤 (字幕条没有文字或与上一条相同时不送 OCR) ---
+ENABLE_OCR_PREFILTER = True
+SUBTITLE_MIN_STROKE_DENSITY = 0.004  # 笔画像素占比低于此值视为无字幕
+SUBTITLE_REPEAT_THRESHOLD = 0.3  # 与上一条送检字幕条的笔画差异 (0-1) 低于此值视为同一句
+
+# --- 字幕去重 (OCR 结果) ---
+SUBTITLE_DEDUP_THRESHOLD = 0.55  # 字符 n-gram 相似度达到此值视为重复台词 (约等于原 difflib ratio > 0.85)
+SUBTITLE_DEDUP_WINDOW = 600  # 去重历史保留时长 (秒，影片时间)
+
+# --- 批处理工作池 ---
+WORKER_THREADS = 2 * len(VLM_ENDPOINTS)  # 同时分析的批次数 (随 VLM 端点数增加)
+JOB_QUEUE_SIZE = 2  # 等待分析的批次队列上限
+QUEUE_OVERFLOW_POLICY = "block"  # 队列满时: "block" 阻塞采集 / "drop_oldest" 丢弃最旧批次 / "merge" 合并批次
 
 # =========================================================================
 #                                 提示词 (Prompts)
 # =========================================================================
+# 后端会复用与上一次请求相同的提示词前缀 (KV 缓存)：固定指令放在系统消息最前面，
+# 只在阶段边界变化的全局脉络紧随其后，每次都变化的历史、字幕与图片放在最后的用户消息中。
 
 PROMPT_OCR = (
     "你是一个专门的字幕读取程序。这张图片是同一位置、不同时间的字幕区域截图，被纵向拼接在一起。\n"
@@ -50,10 +147,10 @@ PROMPT_OCR = (
 
 PROMPT_BATCH_ANALYSIS = (
     "你是一个客观冷静的视频记录员。正在分析一段约10秒的视频片段。\n"
-    "【历史上下文（前20秒）】：\n{history}\n\n"
-    "【当前输入】：\n"
-    "1. 图片：由4个连续时刻画面按2x2拼接而成。\n"
-    "2. 字幕文本：\n{subtitles}\n\n"
+    "【输入】：\n"
+    "1. 历史上下文：前20秒的记录。\n"
+    "2. 图片：由4个连续时刻画面按2x2拼接而成。\n"
+    "3. 字幕文本：这段时间出现的字幕。\n\n"
     "【分析要求】：\n"
     "1. 客观描述：像监控记录员一样，描述画面中“谁”在“做什么”。重点关注肉眼可见的动作、物体交互和环境变化。\n"
     "2. 视听融合：结合字幕，指出是谁说了这些话。\n"
@@ -61,17 +158,27 @@ PROMPT_BATCH_ANALYSIS = (
     "4. 严禁读心：绝对不要猜测人物内心的想法、意图、回忆或潜台词。只描述表现出来的东西。\n"
     "5. 字数限制：150字以内。"
 )
+PROMPT_BATCH_INPUT = "【历史上下文（前20秒）】：\n{history}\n\n【字幕文本】：\n{subtitles}"
 
 PROMPT_PHASE_SUMMARY = (
-    "你是一个专业的剧情剪辑师。请进行阶段性回顾。\n"
-    "【全局故事脉络（所有已发生的阶段）】：\n{past_summaries}\n\n"
-    "【最近1分钟的微观记录】：\n{recent_logs}\n\n"
+    "你是一个专业的剧情剪辑师。请根据全局故事脉络和用户提供的最近1分钟的微观记录进行阶段性回顾。\n"
     "【任务】：\n"
     "1. 逻辑整合：结合全局脉络和最近的细节，概括这1分钟内的剧情。\n"
     "2. 因果梳理：修正碎片化记录中的逻辑断层，明确“因为A做了什么，导致B产生了什么反应”。\n"
     "3. 客观总结：去除琐碎的动作描写，提炼核心事件。不要揣测人物的内心或者想法,只做如实描述。\n"
     "4. 字数限制：250字以内。如果你没有看到多条全局故事脉络，说明故事才刚刚开始，你应该总结的更简单些，不要凑字数。"
 )
+PROMPT_STORY_CONTEXT = "\n\n【全局故事脉络（之前的幕与阶段）】：\n{past_summaries}"
+PROMPT_RECENT_LOGS = "【最近1分钟的微观记录】：\n{recent_logs}"
+
+PROMPT_ACT_SUMMARY = (
+    "你是一个专业的剧情剪辑师。用户会给出按时间顺序排列的若干段剧情回顾，请把它们合并为一段连贯的剧情梗概。\n"
+    "【要求】：\n"
+    "1. 保留关键事件、人物名字、重要台词与因果关系，去掉重复内容。\n"
+    "2. 按时间顺序叙述，不要揣测人物内心。\n"
+    "3. 字数限制：300字以内。"
+)
+PROMPT_ACT_INPUT = "【剧情回顾】：\n{summaries}"
 
 PROMPT_FINAL_SUMMARY = (
     "你是一位百万粉影视解说博主。全片播放结束，请根据所有的阶段剧情，撰写最终的解说文案。\n"
@@ -91,13 +198,17 @@ class WindowController:
     """使用 PostMessage 实现后台窗口控制"""
 
     def __init__(self):
-        self.user32 = ctypes.windll.user32
+        # 仅 Windows 提供 windll；其他平台上暂停/恢复为空操作
+        self.user32 = ctypes.windll.user32 if hasattr(ctypes, "windll") else None
         self.WM_KEYDOWN = 0x0100
         self.WM_KEYUP = 0x0101
         self.VK_SPACE = 0x20  # 空格键
 
     def toggle_play_pause(self, region):
         if not region: return
+        if self.user32 is None:
+            print("Background window control is only available on Windows.")
+            return
         x, y, w, h = region
         center_x = x + w // 2
         center_y = y + h // 2
@@ -123,31 +234,648 @@ class WindowController:
 #                                 主程序逻辑
 # =========================================================================
 
-class SubtitleDeduplicator:
-    def __init__(self, max_history=10):
-        self.history = []
-        self.max_history = max_history
-
-    def process(self, raw_text):
-        if not raw_text or "无" in raw_text: return ""
-        lines = [line.strip() for line in raw_text.split('\n') if line.strip()]
-        unique_lines = []
-        for line in lines:
-            if len(line) < 2: continue
-            is_dup = False
-            for old in self.history:
-                if difflib.SequenceMatcher(None, line, old).ratio() > 0.85:
-                    is_dup = True
-                    break
-            if not is_dup:
-                unique_lines.append(line)
-                self.history.append(line)
-        if len(self.history) > self.max_history:
-            self.history = self.history[-self.max_history:]
-        return " ".join(unique_lines)
+class BatchJob:
+    """一个待分析批次：整帧、字幕条与首帧时间戳"""
+
+    def __init__(self, index, frames, subs, pts, merged_indices=(), static=False, motion=()):
+        self.index = index
+        self.frames = frames
+        self.subs = subs
+        self.pts = pts
+        self.merged_indices = list(merged_indices)  # 被并入本批次的后续批次序号
+        self.static = static  # 全部是超时强制采集的静止帧，可沿用上一片段
+        self.motion = list(motion)  # 各帧画面区差异度 / 画面区阈值，用于模型路由
+
+
+def pick_evenly(items, count):
+    """从列表中均匀挑选 count 个元素 (保留首尾)"""
+    if len(items) <= count:
+        return list(items)
+    if count == 1:
+        return [items[0]]
+    return [items[round(i * (len(items) - 1) / (count - 1))] for i in range(count)]
+
+
+def merge_batch_jobs(queued, new):
+    """
+    merge 溢出策略：把新批次并入队尾批次。
+    画面均匀抽取回 BATCH_SIZE 帧以保持 2x2 拼图；字幕条尽量保留以免漏掉对白，上限为 2 倍批大小。
+    """
+    return BatchJob(
+        queued.index,
+        pick_evenly(queued.frames + new.frames, BATCH_SIZE),
+        pick_evenly(queued.subs + new.subs, BATCH_SIZE * 2),
+        queued.pts,
+        queued.merged_indices + [new.index] + new.merged_indices,
+        queued.static and new.static,
+        queued.motion + new.motion
+    )
+
+
+class PhaseSummaryJob:
+    """一次后台阶段回顾：总结 [start, upto) 范围内的批次，写入日志中预留的位置"""
+
+    def __init__(self, start, upto, slot):
+        self.start = start
+        self.upto = upto
+        self.slot = slot
+        self.done = threading.Event()
+
+
+def format_gating_stats(stats):
+    return (f"视觉门控: 跳过静止帧 {stats['skipped']} | 沿用批次 {stats['reused']} | "
+            f"免 OCR 批次 {stats['ocr_skipped']}\n"
+            f"字幕条: 无文字 {stats['strips_empty']} | 重复 {stats['strips_repeated']} | "
+            f"节省调用 ~{stats['saved_calls']}")
+
+
+def format_story_stats(stats):
+    return f"分层汇总: {stats['phases']} 个阶段 → {stats['acts']} 幕 | 汇总请求 {stats['reductions']}"
+
+
+def create_llm_client():
+    return LLMClient(HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT, MAX_REQUESTS_PER_ENDPOINT, PROMPT_CACHE_OPTIONS)
+
+
+def create_endpoint_pools(client):
+    """按配置为 ocr / vlm / vlm_small / summary 四个角色创建端点池"""
+    return {role: EndpointPool(client, role, endpoints, LOAD_BALANCE_POLICY, ENDPOINT_MAX_FAILURES,
+                               ENDPOINT_EJECT_SECONDS, LLM_MAX_RETRIES, RETRY_BACKOFF_SECONDS, HEDGE_REQUESTS)
+            for role, endpoints in (("ocr", OCR_ENDPOINTS), ("vlm", VLM_ENDPOINTS), ("vlm_small", VLM_SMALL_ENDPOINTS),
+                                    ("summary", SUMMARY_ENDPOINTS))}
+
+
+def create_router():
+    return CascadeRouter(ROUTE_THRESHOLD, min_answer_chars=ROUTE_MIN_ANSWER_CHARS, enabled=MODEL_CASCADE)
+
+
+def create_response_cache():
+    """按配置打开回复缓存；RESPONSE_CACHE_DIR 为空时不缓存"""
+    if not RESPONSE_CACHE_DIR:
+        return None
+    return ResponseCache(RESPONSE_CACHE_DIR, RESPONSE_CACHE_MAX_MB * 1024 * 1024)
+
+
+class AnalysisEngine:
+    """
+    无界面分析引擎：帧来源 → 批处理 → OCR/VLM → 阶段回顾 → 最终报告。
+    不依赖 tkinter；GUI 与命令行都通过 add_listener 订阅事件：
+    status / capture / preview / diff / buffer / gating / schedule / queue / network / cache / budget / routing /
+    imaging / batch / summary / final / finished，
+    以及阶段回顾与最终解说的流式输出 stream_start / stream_token / stream_end。
+    每个实例持有独立的会话状态，可在同一进程中并行运行多个会话。
+    """
+
+    def __init__(self, source, log_dir=".", video_ctrl=None, capture_region=None, client=None, cache=None,
+                 pause_for_summary=None):
+        self.source = source
+        # 可传入共享的 LLMClient，让同一进程中的多个会话复用连接池
+        self.client = client or create_llm_client()
+        self.pools = create_endpoint_pools(self.client)
+        self.cache = cache or create_response_cache()
+        self.budget = TokenBudget(PROMPT_TOKEN_BUDGETS)
+        self.router = create_router()
+        self.log_dir = log_dir
+        self.video_ctrl = video_ctrl  # 实时模式下用于阶段回顾时暂停播放器
+        self.pause_for_summary = AUTO_PAUSE_VIDEO if pause_for_summary is None else pause_for_summary
+        self.capture_region = capture_region
+        self.listeners = []
+
+        self.is_running = False
+        self.thread = None
+        self.log_filename = ""
+        self.pool = None  # 批处理工作池 (有界队列 + 固定线程数)
+        self.sequencer = None  # 按批次序号顺序释放结果
+        self.scheduler = None  # 自适应采样调度
+        self.summary_pool = None  # 后台阶段回顾 (单线程，按顺序生成)
+        self.journal = None  # 会话日志，阶段回顾按批次位置插入
+        self.story = None  # 阶段回顾 → 幕 → 全片 的分层汇总
+        self.imaging = None  # 拼图与编码的预处理进程池
+
+        self.frame_buffer = []
+        self.subtitle_buffer = []
+        self.analysis_logs = SpillWindow(BATCH_LOG_WINDOW)  # 最近的 (批次序号, 记录)
+        self.phase_summaries = SpillWindow(SUMMARY_LOG_WINDOW)
+        self.summary_upto = 0  # 已提交阶段回顾覆盖的批次数
+        self.batch_count = 0
+        self.final_report = None
+
+        self.deduplicator = SubtitleDeduplicator(SUBTITLE_DEDUP_THRESHOLD, SUBTITLE_DEDUP_WINDOW)
+        self.detector = ChangeDetector(CHANGE_DETECTOR, SUBTITLE_BAND, SUBTITLE_CHANGE_THRESHOLD,
+                                       SCENE_CHANGE_THRESHOLD)
+        self.last_frame = None  # 上一次采集入库的帧，静止判断以它为基准
+        self.consecutive_skips = 0
+        self.batch_static = True
+        self.batch_motion = []
+        self.frames_skipped = 0
+        self.batches_reused = 0
+        self.ocr_skipped = 0
+        self.strip_filter = SubtitleStripFilter(SUBTITLE_MIN_STROKE_DENSITY, SUBTITLE_REPEAT_THRESHOLD)
+
+    # ================= 事件 =================
+
+    def add_listener(self, callback):
+        """callback(event, data)；在分析线程中调用，GUI 需自行切回主线程"""
+        self.listeners.append(callback)
+
+    def emit(self, event, **data):
+        for callback in list(self.listeners):
+            try:
+                callback(event, data)
+            except Exception as e:
+                print(f"Listener error: {e}")
+
+    def update_status(self, msg, is_error=False):
+        self.emit("status", message=msg, is_error=is_error)
+
+    # ================= 会话控制 =================
+
+    def start(self):
+        """在后台线程中运行，立即返回"""
+        self.is_running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """请求停止；分析线程会完成结算后退出"""
+        self.is_running = False
+
+    def wait(self, timeout=None):
+        if self.thread:
+            self.thread.join(timeout)
+
+    def run(self):
+        """阻塞运行整个会话 (命令行直接调用)"""
+        self.is_running = True
+        self.frame_buffer = []
+        self.subtitle_buffer = []
+        self.summary_upto = 0
+        self.batch_count = 0
+        self.final_report = None
+        self.budget = TokenBudget(PROMPT_TOKEN_BUDGETS)
+        self.router = create_router()
+        self.deduplicator = SubtitleDeduplicator(SUBTITLE_DEDUP_THRESHOLD, SUBTITLE_DEDUP_WINDOW)
+        self.last_frame = None
+        self.consecutive_skips = 0
+        self.batch_static = True
+        self.batch_motion = []
+        self.frames_skipped = 0
+        self.batches_reused = 0
+        self.ocr_skipped = 0
+        self.strip_filter = SubtitleStripFilter(SUBTITLE_MIN_STROKE_DENSITY, SUBTITLE_REPEAT_THRESHOLD)
+        self.sequencer = OrderedSequencer(self.on_batch_released)
+        # 离线模式下丢弃/合并批次没有意义，始终阻塞解码等待后端
+        overflow = QUEUE_OVERFLOW_POLICY if self.source.is_live else "block"
+        self.pool = BatchWorkerPool(self.process_batch_async, workers=WORKER_THREADS, max_queue=JOB_QUEUE_SIZE,
+                                    overflow=overflow, merge_fn=merge_batch_jobs, on_drop=self.on_batch_dropped)
+        self.summary_pool = BatchWorkerPool(self.run_phase_summary, workers=1, max_queue=2, name="summary")
+        self.story = StoryTree(self.reduce_summaries, ACT_PHASES, REDUCE_INPUT_TOKENS, REDUCE_WORKERS)
+
+        name = "" if self.source.is_live else os.path.splitext(os.path.basename(self.source.path))[0] + "_"
+        self.log_filename = os.path.join(
+            self.log_dir, f"movie_log_{name}{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.txt")
+        self.journal = LogJournal(self.log_filename)
+        # 挤出内存窗口的批次记录与阶段回顾写入日志旁的 jsonl
+        log_base = os.path.splitext(self.log_filename)[0]
+        self.analysis_logs = SpillWindow(BATCH_LOG_WINDOW, log_base + "_batches.jsonl")
+        self.phase_summaries = SpillWindow(SUMMARY_LOG_WINDOW, log_base + "_summaries.jsonl")
+        # 每张送出图片的格式、质量、字节数、视觉 token 与编码耗时写入 *_images.csv
+        self.imaging = ImagePreprocessor(PREPROCESS_WORKERS, {"grid": VLM_ENCODE_PROFILE, "strip": OCR_ENCODE_PROFILE},
+                                         log_path=os.path.splitext(self.log_filename)[0] + "_images.csv")
+        # 每次采样决策写入 *_schedule.csv，用于权衡成本与覆盖率
+        self.scheduler = CaptureScheduler(
+            CAPTURE_INTERVAL, MIN_CAPTURE_INTERVAL, MAX_CAPTURE_INTERVAL, calls_per_sample=2 / BATCH_SIZE,
+            call_budget=CALL_BUDGET, duration=None if self.source.is_live else self.source.end,
+            enabled=ADAPTIVE_CAPTURE, log_path=os.path.splitext(self.log_filename)[0] + "_schedule.csv")
+
+        self.update_status("分析启动")
+        try:
+            self.analysis_loop()
+        finally:
+            self.is_running = False
+            self.summary_pool.close(wait=False)
+            self.story.close()
+            self.imaging.close()
+            self.scheduler.close()
+            self.analysis_logs.close()
+            self.phase_summaries.close()
+            self.journal.close()
+            self.emit("finished", final=self.final_report, log_filename=self.log_filename)
+
+    # ================= 视觉门控 =================
+
+    def calculate_diff(self, frame):
+        """与上一帧比较 (字幕带 / 画面区分别计算)，返回 ChangeScore"""
+        return self.detector.compare(self.last_frame, frame)
+
+    # ================= 核心流程 =================
+
+    def analysis_loop(self):
+        batch_counter = 0
+        batch_pts = 0.0
+        clock = 0.0  # 调度时钟：离线为影片时间，实时为会话已运行时间
+
+        while self.is_running:
+            loop_start = time.time()
+            frame = self.source.read()
+            changed = None  # 没有读到帧时不更新调度器的运动度
+
+            if self.source.finished:
+                # 离线模式：文件读完即进入最终结算
+                break
+
+            captured = frame is not None
+            if frame:
+                self.emit("capture", **self.source.stats())
+                current_img = frame.image
+                # 1. 更新预览
+                self.emit("preview", image=current_img, pts=frame.pts)
+
+                # 2. 差异计算 (与上一次入库的帧比较)
+                score = self.calculate_diff(frame)
+                self.emit("diff", value=score.level, subtitle=score.subtitle, picture=score.picture,
+                          changed=score.changed)
+                changed = score.changed
+                clock = frame.pts
+
+                if ENABLE_VISUAL_DEDUP and not score.changed and self.consecutive_skips < MAX_SKIP_COUNT:
+                    # 静止帧：不入库，省下它在批次里占用的 OCR / VLM 份额
+                    self.consecutive_skips += 1
+                    self.frames_skipped += 1
+                    self.emit_gating_stats()
+                    captured = False
+                else:
+                    self.batch_static = self.batch_static and not score.changed
+                    self.batch_motion.append(score.picture / self.detector.picture_threshold)
+                    self.consecutive_skips = 0
+                    self.last_frame = frame
+
+            if captured:
+                # 3. 采集入库
+                if not self.frame_buffer:
+                    batch_pts = frame.pts
+                w, h = current_img.size
+                sub_h = int(h * SUBTITLE_BAND)
+                strip = current_img.crop((0, h - sub_h, w, h))
+                # 只保留出现新文字的字幕条，OCR 只拼接这些条
+                if not ENABLE_OCR_PREFILTER or self.strip_filter.accept(strip):
+                    self.subtitle_buffer.append(strip)
+                self.frame_buffer.append(current_img)
+
+                current_len = len(self.frame_buffer)
+                self.emit("buffer", count=current_len)
+                self.update_status(f"捕获中 {current_len}/{BATCH_SIZE}")
+
+                if current_len >= BATCH_SIZE:
+                    # 并行处理：快照当前数据，提交到有界工作池，清空缓冲
+                    job = BatchJob(batch_counter, list(self.frame_buffer), list(self.subtitle_buffer), batch_pts,
+                                   static=ENABLE_VISUAL_DEDUP and self.batch_static, motion=self.batch_motion)
+
+                    # 队列满时按溢出策略处理 (block 策略会在此阻塞采集)；池已关闭时占位跳过，顺序释放不被卡住
+                    if not self.pool.submit(job):
+                        self.sequencer.skip(job.index)
+                    self.emit_queue_stats()
+
+                    # 立即清空，准备下一批
+                    self.frame_buffer = []
+                    self.subtitle_buffer = []
+                    self.batch_static = True
+                    self.batch_motion = []
+                    self.emit("buffer", count=0)
+
+                    batch_counter += 1
+                    self.batch_count = batch_counter
+
+                    # 阶段回顾：提交到后台，采集与批处理继续
+                    if batch_counter % SUMMARY_TRIGGER_BATCHES == 0:
+                        self.schedule_phase_summary(batch_counter)
+
+            interval = self.next_capture_interval(clock, changed, captured)
+
+            if not self.source.is_live:
+                # 离线模式：按媒体时间推进，不等待墙钟时间
+                self.source.advance(interval)
+                progress = self.source.progress()
+                if progress is not None:
+                    self.emit("progress", value=progress, pts=frame.pts if frame else None)
+                continue
+
+            elapsed = time.time() - loop_start
+            wait = max(0.1, interval - elapsed)
+            time.sleep(wait)
+
+        self.source.close()
+        # 等待队列中的批次全部完成后再结算
+        self.pool.close(wait=True)
+        self.emit_queue_stats()
+        self.process_final_report()
+        self.update_status("已停止")
+
+    def emit_queue_stats(self):
+        self.emit("queue", **self.pool.stats())
+
+    def calls_used(self):
+        """本次会话已发出的模型请求数 (缓存命中不计)"""
+        return sum(s["requests"] for s in self.client.stats().values())
+
+    def next_capture_interval(self, clock, changed, captured):
+        """由调度器根据画面变化、队列积压、后端耗时与调用预算决定下一次采样间隔；captured: 本帧是否入库"""
+        queue_depth, queue_max, service_time = 0, 1, 0.0
+        if self.source.is_live:
+            # 离线模式下解码由工作池阻塞，积压只影响总耗时而不会漏掉内容，因此只看画面变化与预算
+            stats = self.pool.stats()
+            queue_depth, queue_max = stats["depth"], stats["max_queue"]
+            service_time = stats["avg_service_time"] / (stats["workers"] * BATCH_SIZE)
+        interval = self.scheduler.next_interval(clock, changed, self.calls_used(), queue_depth, queue_max,
+                                                service_time, sampled=captured)
+        self.emit("schedule", **self.scheduler.stats())
+        return interval
+
+    def gating_stats(self):
+        # 每个批次需要 OCR + VLM 两次调用：跳过 BATCH_SIZE 帧约等于省下一个批次
+        saved = self.frames_skipped * 2 // BATCH_SIZE + self.batches_reused * 2 + self.ocr_skipped
+        strips = self.strip_filter.stats()
+        return {"skipped": self.frames_skipped, "reused": self.batches_reused, "ocr_skipped": self.ocr_skipped,
+                "strips_empty": strips["empty"], "strips_repeated": strips["repeated"], "saved_calls": saved}
+
+    def emit_gating_stats(self):
+        self.emit("gating", **self.gating_stats())
+
+    def on_batch_dropped(self, job):
+        print(f"Batch {job.index + 1} dropped (queue full)")
+        self.update_status(f"队列已满，丢弃批次 {job.index + 1}", is_error=True)
+        for index in [job.index] + job.merged_indices:
+            self.sequencer.skip(index)
+
+    def on_batch_released(self, index, result):
+        """由 sequencer 按批次顺序调用：写入日志、通知订阅者、写文件"""
+        if result.get("reused"):
+            self.batches_reused += 1
+        elif result.get("ocr_skipped"):
+            self.ocr_skipped += 1
+        self.emit_gating_stats()
+        self.analysis_logs.append((index, result["entry"]))
+        self.emit("batch", index=index, **result)
+        self.write_file(result["entry"], key=index)
+        self.emit("network", stats=self.client.stats(), pools=self.pool_stats())
+        if self.cache:
+            self.emit("cache", **self.cache.stats())
+        self.emit("budget", stats=self.budget.stats())
+        self.emit("routing", **self.router.stats())
+
+    def process_batch_async(self, job):
+        """工作线程中处理单批次分析；结果交给 sequencer 按序释放"""
+        result = None
+        try:
+            result = self.analyze_batch(job)
+        except Exception as e:
+            print(f"Batch {job.index + 1} error: {e}")
+        finally:
+            # 失败的批次也要占位，避免后续批次一直等待
+            self.sequencer.put(job.index, result)
+            for index in job.merged_indices:
+                self.sequencer.skip(index)
+
+    def analyze_batch(self, job):
+        index, frames, subs, pts = job.index, job.frames, job.subs, job.pts
+        start = format_pts(pts) if pts is not None else f"{index * 10}s"
+
+        if job.static:
+            # 整批都是静止画面：不调用模型，沿用上一片段的剧情 (上一批失败时照常分析)
+            history = self.sequencer.wait_history(index, 1)
+            if history:
+                plot = history[-1]["plot"]
+                entry = f"【片段 {start}+】\n字幕：无\n剧情：（画面无变化）{plot}\n"
+                return {"pts": pts, "subtitles": "无", "plot": plot, "entry": entry, "reused": True}
+
+        self.update_status(f"后台分析批次 {index + 1}...", is_error=True)
+        self.emit_queue_stats()
+
+        # 拼图与编码在预处理进程中进行；2x2 拼图与 OCR 请求同时准备
+        plot_future = self.imaging.submit("grid", frames, max_dim=VLM_MAX_DIMENSION)
+
+        # 1. OCR (使用快照数据，不依赖历史，可与其他批次并行)；没有新字幕条时不调用 OCR
+        sub_b64 = self.imaging.run("strip", subs, width=OCR_TARGET_WIDTH)
+        raw = None
+        if sub_b64:
+            raw = self.call_llm("ocr", [
+                {"role": "system", "content": PROMPT_OCR},
+                {"role": "user", "content": [{"type": "image_url", "image_url": {"url": sub_b64}}]}
+            ], max_tokens=150, kind="ocr")
+
+        plot_b64 = plot_future.result()
+        self.emit("imaging", **self.imaging.stats())
+        if not plot_b64:
+            return None
+
+        # 2. 等待前序批次全部释放：字幕去重与历史上下文都与串行处理一致
+        history = self.sequencer.wait_history(index, 2)
+        clean_subs = self.deduplicator.process(raw, t=pts) if sub_b64 else "无"
+
+        # 3. VLM (使用快照数据)：简单批次交给小模型，未通过质量检查时升级到大模型
+        history_context = "\n".join(r["entry"] for r in history) if history else "（无历史记录）"
+        tier, difficulty = self.router.route(job.motion, len(subs), len(frames))
+        plot, latency = self.describe_batch(tier, history_context, clean_subs, plot_b64)
+        if tier == "small" and not self.router.check(plot) and (ROUTE_ESCALATE or not plot):
+            print(f"Batch {index + 1} escalated to the large model (difficulty {difficulty:.2f})")
+            self.router.record(tier, latency, kept=False)
+            tier = "large"
+            plot, latency = self.describe_batch(tier, history_context, clean_subs, plot_b64)
+        self.router.record(tier, latency)
+
+        if not plot:
+            return None
+        entry = f"【片段 {start}+】\n字幕：{clean_subs}\n剧情：{plot}\n"
+        return {"pts": pts, "subtitles": clean_subs, "plot": plot, "entry": entry, "ocr_skipped": not subs,
+                "tier": tier, "difficulty": difficulty}
+
+    def describe_batch(self, tier, history_context, clean_subs, plot_b64):
+        """用 tier (small / large) 对应的模型分析 2x2 拼图，返回 (剧情 或 None, 请求耗时 或 None 表示命中缓存)"""
+        role = "vlm_small" if tier == "small" else "vlm"
+        # 超出预算时先裁剪较早的历史，再裁剪字幕
+        prompt = self.budget.fit(self.pools[role].model, PROMPT_BATCH_INPUT, [
+            Section("history", history_context, priority=0),
+            Section("subtitles", clean_subs if clean_subs else "（无对白）", priority=1, keep="head")
+        ], fixed=PROMPT_BATCH_ANALYSIS, images=[plot_b64], max_tokens=350)
+
+        metrics = {}
+        plot = self.call_llm(role, [
+            {"role": "system", "content": PROMPT_BATCH_ANALYSIS},
+            {"role": "user", "content": [
+                {"type": "text", "text": prompt},
+                {"type": "image_url", "image_url": {"url": plot_b64}}
+            ]}
+        ], max_tokens=350, kind="batch" if tier == "large" else "batch_small", metrics=metrics)
+        return plot, metrics.get("latency")
+
+    def schedule_phase_summary(self, upto):
+        """
+        提交覆盖前 upto 个批次的阶段回顾，并在日志中紧跟这些批次的位置预留回顾内容。
+        默认不等待生成；开启 pause_for_summary 的实时模式下暂停播放器，等回顾完成后再恢复。
+        """
+        job = PhaseSummaryJob(self.summary_upto, upto, self.journal.reserve(key=upto - 0.5))
+        self.summary_upto = upto
+        pause = self.pause_for_summary and self.source.is_live and self.video_ctrl is not None
+        if pause:
+            self.update_status("⚠️ 阶段回顾，暂停视频...")
+            self.video_ctrl.toggle_play_pause(self.capture_region)
+            # 稍微等待确保暂停生效
+            time.sleep(1.0)
+
+        if not self.summary_pool.submit(job):
+            self.journal.finish(job.slot)
+            return
+
+        if pause:
+            job.done.wait()
+            self.update_status("恢复播放...")
+            self.video_ctrl.toggle_play_pause(self.capture_region)
+            time.sleep(0.5)
+
+    def run_phase_summary(self, job):
+        """后台线程：等待 [start, upto) 的批次按序释放，对这段记录的快照生成回顾"""
+        try:
+            self.sequencer.wait_released(job.upto)
+            logs = self.analysis_logs.recent()
+            if not logs or logs[0][0] > job.start:
+                # 后台回顾积压时，要回顾的批次可能已挤出内存窗口，从磁盘读回
+                logs = self.analysis_logs.history()
+            recent_logs = [entry for index, entry in logs if job.start <= index < job.upto]
+            if not recent_logs:
+                return
+
+            # 全局脉络只在阶段边界变化 (且已限制在 SUMMARY_CONTEXT_TOKENS 内)，放在系统消息中作为稳定前缀
+            past_summaries = self.story.context(SUMMARY_CONTEXT_TOKENS) or "（暂无先前阶段）"
+            system = PROMPT_PHASE_SUMMARY + PROMPT_STORY_CONTEXT.format(past_summaries=past_summaries)
+            prompt = self.budget.fit(self.pools["summary"].model, PROMPT_RECENT_LOGS, [
+                Section("recent_logs", "\n".join(recent_logs))
+            ], fixed=system, max_tokens=600)
+
+            title = f"第 {self.phase_summaries.total + 1} 阶段回顾"
+            summary = self.call_llm_stream("summary", title, "\n=== 阶段回顾 ===\n", "\n\n",
+                                           "summary", [
+                                               {"role": "system", "content": system},
+                                               {"role": "user", "content": prompt}
+                                           ], max_tokens=600, slot=job.slot)
+
+            if summary:
+                self.phase_summaries.append(summary)
+                self.story.add_phase(summary)
+                self.emit("summary", title=title, content=summary)
+        finally:
+            self.journal.finish(job.slot)
+            job.done.set()
+
+    def process_final_report(self):
+        self.update_status("生成最终解说...")
+        if self.summary_upto < self.batch_count:
+            self.schedule_phase_summary(self.batch_count)
+        # 等待后台回顾全部完成
+        self.summary_pool.close(wait=True)
+
+        # 各幕汇总完成后，超出提示词剩余空间的部分再分组汇总 (而不是截掉结尾)
+        model = self.pools["summary"].model
+        available = self.budget.available(model, "全片脉络：\n{context}", ["context"], PROMPT_FINAL_SUMMARY,
+                                          max_tokens=2500)
+        context = self.budget.fit(model, "全片脉络：\n{context}", [
+            Section("context", format_items(self.story.final_items(available)), keep="head")
+        ], fixed=PROMPT_FINAL_SUMMARY, max_tokens=2500)
+        final = self.call_llm_stream("final", "★ 全片最终解说 ★", "\n\n★ 最终解说 ★\n", "\n",
+                                     "summary", [
+                                         {"role": "system", "content": PROMPT_FINAL_SUMMARY},
+                                         {"role": "user", "content": context}
+                                     ], max_tokens=2500)
+
+        if final:
+            self.final_report = final
+            self.emit("final", content=final)
+
+    def reduce_summaries(self, items):
+        """汇总线程：把若干阶段回顾 / 幕 [(标签, 文本)] 合并为一段剧情梗概"""
+        self.update_status(f"汇总 {items[0][0]} - {items[-1][0]}...")
+        prompt = self.budget.fit(self.pools["summary"].model, PROMPT_ACT_INPUT, [
+            Section("summaries", format_items(items), keep="head")
+        ], fixed=PROMPT_ACT_SUMMARY, max_tokens=500)
+        return self.call_llm("summary", [
+            {"role": "system", "content": PROMPT_ACT_SUMMARY},
+            {"role": "user", "content": prompt}
+        ], max_tokens=500, kind="act")
+
+    def pool_stats(self):
+        return [pool.stats() for pool in self.pools.values()]
+
+    def call_llm(self, role, messages, max_tokens=200, kind="vlm", metrics=None):
+        """
+        非流式请求 (OCR / 批次 VLM / 分幕汇总)，由角色 role 的端点池选择端点。
+        先查回复缓存，成功的回复写回缓存；kind 为预算统计的请求类型。
+        传入 metrics 时写入请求指标 (命中缓存时不写入)。
+        """
+        pool = self.pools[role]
+        model = pool.model
+        key = None
+        if self.cache:
+            key = self.cache.make_key(model, messages, max_tokens)
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+        self.budget.record(kind, model, messages, max_tokens)
+        result = pool.chat(messages, max_tokens=max_tokens, temperature=0.7, metrics=metrics)
+        if key and result:
+            self.cache.put(key, result)
+        return result
+
+    def call_llm_stream(self, kind, title, header, footer, role, messages, max_tokens=200, slot=None):
+        """
+        流式请求 (用于阶段回顾与最终解说)：token 到达即推送 stream_token 事件，
+        并写入日志中的占位 slot (header + 正文 + footer；None 时追加到日志末尾)。记录首字延迟与生成速度。
+        """
+        self.emit("stream_start", kind=kind, title=title)
+        own_slot = slot is None
+        if own_slot:
+            slot = self.journal.reserve()
+        self.journal.write(slot, header)
+
+        def on_token(text):
+            self.emit("stream_token", kind=kind, text=text)
+            self.journal.write(slot, text)
+
+        pool = self.pools[role]
+        self.budget.record(kind, pool.model, messages, max_tokens)
+        metrics = {}
+        result = None
+        try:
+            result = pool.chat(messages, max_tokens=max_tokens, temperature=0.7, on_token=on_token, metrics=metrics)
+        finally:
+            self.journal.write(slot, footer if result else "（生成失败）\n")
+            if own_slot:
+                self.journal.finish(slot)
+        self.emit("stream_end", kind=kind, ok=result is not None, metrics=metrics)
+        if result:
+            self.update_status(f"{title}完成 {format_stream_metrics(metrics)}")
+        return result
+
+    def write_file(self, text, key=None):
+        self.journal.append(text + "\n", key)
+
+
+# =========================================================================
+#                                 图形界面
+# =========================================================================
+
+def load_gui_modules():
+    """导入 tkinter / ImageTk；仅在启动 GUI 时调用"""
+    global tk, ttk, scrolledtext, messagebox, filedialog, ImageTk
+    import tkinter
+    from tkinter import ttk as _ttk, scrolledtext as _scrolledtext, messagebox as _messagebox, \
+        filedialog as _filedialog
+    from PIL import ImageTk as _ImageTk
+    tk, ttk, scrolledtext, messagebox, filedialog = tkinter, _ttk, _scrolledtext, _messagebox, _filedialog
+    ImageTk = _ImageTk
 
 
 class VideoAnalyzerApp:
+    """GUI：只负责选择来源、启动/停止引擎，并把引擎事件显示出来"""
+
     def __init__(self, root):
         self.root = root
         self.root.title("Video AI Analyzer V10.0 (Async & Background Ctrl)")
@@ -160,26 +888,24 @@ class VideoAnalyzerApp:
         style.configure("Header.TLabel", font=("Microsoft YaHei", 12, "bold"), foreground="#333")
         style.configure("Status.TLabel", font=("Consolas", 9), foreground="#555")
 
-        self.is_running = False
+        self.engine = None
         self.capture_region = None
+        self.video_path = ""  # 非空时使用离线视频文件模式
         self.region_text = tk.StringVar(value="未选择区域")
         self.status_text = tk.StringVar(value="就绪")
-        self.log_filename = ""
 
         self.diff_var = tk.DoubleVar(value=0.0)
         self.buffer_var = tk.DoubleVar(value=0.0)
 
-        self.frame_buffer = []
-        self.subtitle_buffer = []
-        self.analysis_logs = []
-        self.phase_summaries = []
-
-        self.deduplicator = SubtitleDeduplicator()
         self.video_ctrl = WindowController()
-        self.last_pil_image = None
+        # 引擎事件：显示最新值的只保留最后一次，相邻的流式文本拼接
+        self.ui_events = UIEventQueue(
+            latest=("status", "preview", "diff", "buffer", "progress", "gating", "schedule", "queue", "network",
+                    "cache", "budget", "routing", "capture", "imaging"),
+            concat=("stream_token",))
 
         self.setup_ui()
-        self.setup_region_selector()
+        self.root.after(UI_FRAME_INTERVAL_MS, self.drain_ui_events)
 
     def setup_ui(self):
         toolbar = ttk.Frame(self.root, padding=10)
@@ -187,6 +913,7 @@ class VideoAnalyzerApp:
 
         ttk.Label(toolbar, text="Video AI Analyzer V10", style="Header.TLabel").pack(side=tk.LEFT, padx=(0, 20))
         ttk.Button(toolbar, text="✂️ 框选屏幕区域", command=self.start_region_selection).pack(side=tk.LEFT, padx=5)
+        ttk.Button(toolbar, text="🎞️ 打开视频文件", command=self.choose_video_file).pack(side=tk.LEFT, padx=5)
         ttk.Label(toolbar, textvariable=self.region_text, foreground="#0066cc").pack(side=tk.LEFT, padx=5)
         ttk.Separator(toolbar, orient=tk.VERTICAL).pack(side=tk.LEFT, padx=20, fill=tk.Y)
 
@@ -212,14 +939,47 @@ class VideoAnalyzerApp:
         status_group = ttk.LabelFrame(left_frame, text="状态仪表盘", padding=10)
         status_group.pack(fill=tk.X, pady=5)
 
-        ttk.Label(status_group, text="视觉动态:").pack(anchor="w")
-        self.pb_diff = ttk.Progressbar(status_group, variable=self.diff_var, maximum=20.0, mode='determinate')
+        ttk.Label(status_group, text="视觉动态 (过半即超过阈值):").pack(anchor="w")
+        self.pb_diff = ttk.Progressbar(status_group, variable=self.diff_var, maximum=2.0, mode='determinate')
         self.pb_diff.pack(fill=tk.X, pady=(2, 8))
 
         ttk.Label(status_group, text=f"批处理缓冲:").pack(anchor="w")
         self.pb_buffer = ttk.Progressbar(status_group, variable=self.buffer_var, maximum=BATCH_SIZE, mode='determinate')
         self.pb_buffer.pack(fill=tk.X, pady=(2, 8))
 
+        self.queue_text = tk.StringVar(value="队列: -")
+        ttk.Label(status_group, textvariable=self.queue_text, style="Status.TLabel").pack(anchor="w")
+
+        self.gating_text = tk.StringVar(value="视觉门控: -")
+        ttk.Label(status_group, textvariable=self.gating_text, style="Status.TLabel").pack(anchor="w", pady=(4, 0))
+
+        self.schedule_text = tk.StringVar(value="采样: -")
+        ttk.Label(status_group, textvariable=self.schedule_text, style="Status.TLabel").pack(anchor="w", pady=(4, 0))
+
+        self.network_text = tk.StringVar(value="网络: -")
+        ttk.Label(status_group, textvariable=self.network_text, style="Status.TLabel",
+                  wraplength=280).pack(anchor="w", pady=(4, 0))
+
+        self.cache_text = tk.StringVar(value="缓存: -")
+        ttk.Label(status_group, textvariable=self.cache_text, style="Status.TLabel",
+                  wraplength=280).pack(anchor="w", pady=(4, 0))
+
+        self.capture_text = tk.StringVar(value="采集: -")
+        ttk.Label(status_group, textvariable=self.capture_text, style="Status.TLabel",
+                  wraplength=280).pack(anchor="w", pady=(4, 0))
+
+        self.budget_text = tk.StringVar(value="提示词 token: -")
+        ttk.Label(status_group, textvariable=self.budget_text, style="Status.TLabel",
+                  wraplength=280).pack(anchor="w", pady=(4, 0))
+
+        self.route_text = tk.StringVar(value="模型路由: -")
+        ttk.Label(status_group, textvariable=self.route_text, style="Status.TLabel",
+                  wraplength=280).pack(anchor="w", pady=(4, 0))
+
+        self.imaging_text = tk.StringVar(value="图像预处理: -")
+        ttk.Label(status_group, textvariable=self.imaging_text, style="Status.TLabel",
+                  wraplength=280).pack(anchor="w", pady=(4, 0))
+
         ttk.Separator(status_group, orient=tk.HORIZONTAL).pack(fill=tk.X, pady=8)
         self.lbl_status_detail = ttk.Label(status_group, textvariable=self.status_text, foreground="#d9534f",
                                            wraplength=280)
@@ -247,19 +1007,29 @@ class VideoAnalyzerApp:
         self.statusbar = ttk.Label(self.root, text="就绪", relief=tk.SUNKEN, anchor="w", padding=(10, 5))
         self.statusbar.pack(fill=tk.X)
 
-    def setup_region_selector(self):
-        self.region_win_class = type('RegionSelectionWindow', (tk.Toplevel,), {})  # 动态定义或保持原类
-
-    # ================= 截图与图像处理 =================
+    # ================= 来源选择 =================
 
     def start_region_selection(self):
         self.root.iconify()
         time.sleep(0.2)
         RegionSelectionWindow(self.root, self.on_region_selected)
 
+    def choose_video_file(self):
+        path = filedialog.askopenfilename(
+            title="选择视频文件",
+            filetypes=[("视频文件", "*.mp4 *.mkv *.avi *.mov *.flv *.wmv *.ts *.webm"), ("所有文件", "*.*")]
+        )
+        if not path: return
+        self.video_path = path
+        self.capture_region = None
+        self.region_text.set(f"离线文件: {os.path.basename(path)}")
+        self.btn_start.config(state=tk.NORMAL)
+        self.update_status("已选择视频文件")
+
     def on_region_selected(self, region):
         self.root.deiconify()
         self.capture_region = region
+        self.video_path = ""
         self.region_text.set(f"已选: {region[2]}x{region[3]} @ ({region[0]},{region[1]})")
         self.btn_start.config(state=tk.NORMAL)
         self.update_status("区域已锁定")
@@ -269,289 +1039,125 @@ class VideoAnalyzerApp:
         self.lbl_status_detail.config(foreground="red" if is_error else "#28a745")
         self.statusbar.config(text=f"{msg} | {datetime.datetime.now().strftime('%H:%M:%S')}")
 
-    def capture_screen(self):
-        if not self.capture_region: return None
-        try:
-            return pyautogui.screenshot(region=self.capture_region)
-        except:
-            return None
-
     def update_preview_image(self, img):
         if img:
-            disp = img.copy()
-            disp.thumbnail((280, 200))
+            disp = fit_box(img, PREVIEW_SIZE)
             photo = ImageTk.PhotoImage(disp)
             self.lbl_image.config(image=photo, text="")
             self.lbl_image.image = photo
 
-    def adaptive_resize_for_vlm(self, img):
-        w, h = img.size
-        if w > VLM_MAX_DIMENSION or h > VLM_MAX_DIMENSION:
-            ratio = min(VLM_MAX_DIMENSION / w, VLM_MAX_DIMENSION / h)
-            return img.resize((int(w * ratio), int(h * ratio)), Image.Resampling.LANCZOS)
-        return img
-
-    def adaptive_resize_for_ocr(self, img):
-        w, h = img.size
-        ratio = OCR_TARGET_WIDTH / w
-        return img.resize((OCR_TARGET_WIDTH, int(h * ratio)), Image.Resampling.LANCZOS)
-
-    def stitch_images_grid_2x2(self, images):
-        if len(images) != 4: return None
-        w, h = images[0].size
-        cw, ch = w // 2, h // 2
-        target = Image.new('RGB', (w, h))
-        target.paste(images[0].resize((cw, ch)), (0, 0))
-        target.paste(images[1].resize((cw, ch)), (cw, 0))
-        target.paste(images[2].resize((cw, ch)), (0, ch))
-        target.paste(images[3].resize((cw, ch)), (cw, ch))
-        return target
-
-    def stitch_images_vertical(self, images):
-        if not images: return None
-        w, h = images[0].size
-        target = Image.new('RGB', (w, h * len(images)))
-        for i, img in enumerate(images):
-            target.paste(img, (0, i * h))
-        return target
-
-    def image_to_base64(self, img):
-        buffered = io.BytesIO()
-        img.save(buffered, format="JPEG", quality=85)
-        return f"data:image/jpeg;base64,{base64.b64encode(buffered.getvalue()).decode()}"
-
-    def calculate_diff(self, img_new):
-        if self.last_pil_image is None: return 100.0
-        i1 = self.last_pil_image.resize((64, 36)).convert("RGB")
-        i2 = img_new.resize((64, 36)).convert("RGB")
-        diff = ImageChops.difference(i1, i2)
-        stat = ImageStat.Stat(diff)
-        return sum(stat.mean) / len(stat.mean)
-
-    # ================= 核心流程 =================
+    # ================= 引擎控制 =================
 
     def start_analysis(self):
-        self.is_running = True
-        self.frame_buffer = []
-        self.subtitle_buffer = []
-        self.analysis_logs = []
-        self.phase_summaries = []
-        self.deduplicator = SubtitleDeduplicator()
+        try:
+            if self.video_path:
+                source = VideoFileSource(self.video_path)
+            else:
+                source = ScreenRegionSource(self.capture_region, CAPTURE_BACKEND)
+        except (RuntimeError, ImportError) as e:
+            messagebox.showerror("错误", str(e))
+            return
 
-        self.log_filename = f"movie_log_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
+        self.engine = AnalysisEngine(source, video_ctrl=self.video_ctrl, capture_region=self.capture_region)
+        self.engine.add_listener(self.on_engine_event)
 
         self.btn_start.config(state=tk.DISABLED)
         self.btn_stop.config(state=tk.NORMAL)
-        self.update_status("分析启动")
-
-        threading.Thread(target=self.analysis_loop, daemon=True).start()
+        self.engine.start()
 
     def stop_analysis_trigger(self):
-        self.is_running = False
+        if self.engine:
+            self.engine.stop()
         self.update_status("请求停止，等待结算...")
 
-    def analysis_loop(self):
-        batch_counter = 0
+    def on_engine_event(self, event, data):
+        """引擎事件来自分析线程：预览在这里缩小，再放入合并队列，由 Tk 主线程按帧率取出"""
+        if event == "preview":
+            data = dict(data, image=fit_box(data["image"], PREVIEW_SIZE))
+        self.ui_events.put(event, data)
 
-        while self.is_running:
-            loop_start = time.time()
-            current_img = self.capture_screen()
-
-            if current_img:
-                # 1. 更新预览
-                self.root.after(0, lambda img=current_img: self.update_preview_image(img))
-
-                # 2. 差异计算
-                diff = self.calculate_diff(current_img)
-                self.root.after(0, lambda v=diff: self.diff_var.set(v))
-                self.last_pil_image = current_img
-
-                # 3. 采集入库
-                w, h = current_img.size
-                sub_h = int(h / 5)
-                self.subtitle_buffer.append(current_img.crop((0, h - sub_h, w, h)))
-                self.frame_buffer.append(current_img)
-
-                current_len = len(self.frame_buffer)
-                self.root.after(0, lambda v=current_len: self.buffer_var.set(v))
-                self.root.after(0, lambda: self.update_status(f"捕获中 {current_len}/{BATCH_SIZE}"))
-
-                if current_len >= BATCH_SIZE:
-                    # 并行处理：快照当前数据，启动线程，清空缓冲
-                    frames_snapshot = list(self.frame_buffer)
-                    subs_snapshot = list(self.subtitle_buffer)
-                    current_batch_index = batch_counter
-
-                    # 启动分析线程
-                    threading.Thread(
-                        target=self.process_batch_async,
-                        args=(current_batch_index, frames_snapshot, subs_snapshot)
-                    ).start()
-
-                    # 立即清空，准备下一批
-                    self.frame_buffer = []
-                    self.subtitle_buffer = []
-                    self.root.after(0, lambda: self.buffer_var.set(0))
-
-                    batch_counter += 1
-
-                    # 阶段回顾（暂停视频）
-                    if batch_counter % SUMMARY_TRIGGER_BATCHES == 0:
-                        self.process_phase_summary()
-
-            elapsed = time.time() - loop_start
-            wait = max(0.1, CAPTURE_INTERVAL - elapsed)
-            time.sleep(wait)
-
-        self.process_final_report()
-        self.root.after(0, lambda: self.btn_start.config(state=tk.NORMAL))
-        self.root.after(0, lambda: self.btn_stop.config(state=tk.DISABLED))
-        self.root.after(0, lambda: self.update_status("已停止"))
-
-    def process_batch_async(self, index, frames, subs):
-        """异步处理单批次分析"""
-        self.root.after(0, lambda: self.update_status(f"后台分析批次 {index + 1}...", is_error=True))
-
-        # 1. OCR (使用快照数据)
-        stitched_sub = self.stitch_images_vertical(subs)
-        clean_subs = "无"
-        if stitched_sub:
-            stitched_sub = self.adaptive_resize_for_ocr(stitched_sub)
-            raw = self.call_llm(OCR_API_URL, OCR_MODEL_ID, [
-                {"role": "system", "content": PROMPT_OCR},
-                {"role": "user",
-                 "content": [{"type": "image_url", "image_url": {"url": self.image_to_base64(stitched_sub)}}]}
-            ], max_tokens=150)
-            clean_subs = self.deduplicator.process(raw)
-
-        # 2. VLM (使用快照数据)
-        stitched_plot = self.stitch_images_grid_2x2(frames)
-        if stitched_plot:
-            stitched_plot = self.adaptive_resize_for_vlm(stitched_plot)
-
-            # 访问共享资源 analysis_logs 
-            history_context = "\n".join(self.analysis_logs[-2:]) if self.analysis_logs else "（无历史记录）"
-
-            prompt = PROMPT_BATCH_ANALYSIS.format(
-                history=history_context,
-                subtitles=clean_subs if clean_subs else "（无对白）"
-            )
-
-            plot = self.call_llm(VLM_API_URL, VLM_MODEL_ID, [
-                {"role": "user", "content": [
-                    {"type": "text", "text": prompt},
-                    {"type": "image_url", "image_url": {"url": self.image_to_base64(stitched_plot)}}
-                ]}
-            ], max_tokens=350)
-
-            if plot:
-                entry = f"【片段 {index * 10}s+】\n字幕：{clean_subs}\n剧情：{plot}\n"
-                # 写入共享资源 (append 是原子的，基本安全)
-                self.analysis_logs.append(entry)
-                self.log_stream(index, clean_subs, plot)
-                self.write_file(entry)
-
-    def process_phase_summary(self):
-        """阶段回顾：暂停视频"""
-        # 1. 暂停视频
-        self.root.after(0, lambda: self.update_status("⚠️ 阶段回顾，暂停视频..."))
-        self.video_ctrl.toggle_play_pause(self.capture_region)
-
-        # 2. 稍微等待确保暂停生效
-        time.sleep(1.0)
-
-        self.root.after(0, lambda: self.update_status("AI 生成阶段回顾中..."))
-
-        past_summaries = "\n".join(self.phase_summaries) if self.phase_summaries else "（暂无先前阶段）"
-        recent_logs = "\n".join(self.analysis_logs[-SUMMARY_TRIGGER_BATCHES:])
-
-        prompt = PROMPT_PHASE_SUMMARY.format(
-            past_summaries=past_summaries,
-            recent_logs=recent_logs
-        )
-
-        summary = self.call_llm(VLM_API_URL, VLM_MODEL_ID, [
-            {"role": "user", "content": prompt}
-        ], max_tokens=600)
-
-        if summary:
-            self.phase_summaries.append(summary)
-            self.log_summary(f"第 {len(self.phase_summaries)} 阶段回顾", summary)
-            self.write_file(f"\n=== 阶段回顾 ===\n{summary}\n")
-
-        # 3. 恢复视频
-        self.root.after(0, lambda: self.update_status("恢复播放..."))
-        self.video_ctrl.toggle_play_pause(self.capture_region)
-        time.sleep(0.5)
-
-    def process_final_report(self):
-        self.root.after(0, lambda: self.update_status("生成最终解说..."))
-        if len(self.analysis_logs) % SUMMARY_TRIGGER_BATCHES != 0:
-            self.process_phase_summary()
-
-        context = "\n".join([f"阶段{i + 1}: {s}" for i, s in enumerate(self.phase_summaries)])
-        final = self.call_llm(VLM_API_URL, VLM_MODEL_ID, [
-            {"role": "system", "content": PROMPT_FINAL_SUMMARY},
-            {"role": "user", "content": f"全片脉络：\n{context}"}
-        ], max_tokens=2500)
-
-        if final:
-            self.write_file("\n\n★ 最终解说 ★\n" + final)
-            self.log_summary("★ 全片最终解说 ★", final)
+    def drain_ui_events(self):
+        """Tk 主线程：每帧处理一次积累的引擎事件"""
+        try:
+            for event, data in self.ui_events.drain():
+                self.handle_engine_event(event, data)
+        finally:
+            self.root.after(UI_FRAME_INTERVAL_MS, self.drain_ui_events)
+
+    def handle_engine_event(self, event, data):
+        if event == "status":
+            self.update_status(data["message"], is_error=data["is_error"])
+        elif event == "preview":
+            self.update_preview_image(data["image"])
+        elif event == "diff":
+            self.diff_var.set(min(data["value"], 2.0))
+        elif event == "buffer":
+            self.buffer_var.set(data["count"])
+        elif event == "gating":
+            self.gating_text.set(format_gating_stats(data))
+        elif event == "schedule":
+            self.schedule_text.set(format_schedule_stats(data))
+        elif event == "queue":
+            self.queue_text.set(
+                f"队列: {data['depth']}/{data['max_queue']} | 分析中: {data['busy']}/{data['workers']}\n"
+                f"排队等待: {data['last_queue_wait']:.1f}s (平均 {data['avg_queue_wait']:.1f}s) | "
+                f"采集阻塞: {data['total_block_wait']:.0f}s\n"
+                f"丢弃: {data['dropped']} | 合并: {data['merged']}")
+        elif event == "network":
+            text = "\n".join(filter(None, [format_client_stats(data["stats"]), format_pool_stats(data["pools"])]))
+            self.network_text.set(text or "网络: -")
+        elif event == "cache":
+            self.cache_text.set(format_cache_stats(data))
+        elif event == "budget":
+            self.budget_text.set(format_budget_stats(data["stats"]))
+        elif event == "routing":
+            self.route_text.set(format_route_stats(data))
+        elif event == "capture":
+            self.capture_text.set(format_capture_stats(data))
+        elif event == "imaging":
+            self.imaging_text.set(format_imaging_stats(data))
+        elif event == "batch":
+            self._insert_stream(datetime.datetime.now().strftime("%H:%M:%S"), data["subtitles"], data["plot"])
+        elif event == "stream_start":
+            self._insert_summary_header(data["title"])
+        elif event == "stream_token":
+            self._append_summary(data["text"])
+        elif event == "stream_end":
+            self._append_summary("\n" if data["ok"] else "（生成失败）\n")
+        elif event == "final":
             messagebox.showinfo("完成", "解说文案生成完毕！")
+        elif event == "finished":
+            self.btn_start.config(state=tk.NORMAL)
+            self.btn_stop.config(state=tk.DISABLED)
 
-    def call_llm(self, url, model, messages, max_tokens=200):
-        try:
-            resp = requests.post(url, json={
-                "model": model, "messages": messages,
-                "temperature": 0.7, "max_tokens": max_tokens
-            }, timeout=90)
-            if resp.status_code == 200:
-                return resp.json()['choices'][0]['message']['content']
-        except Exception as e:
-            print(f"API Error: {e}")
-        return None
+    def _insert_stream(self, ts, sub, plot):
+        append_capped(self.txt_stream, [
+            (f"[{ts}] 分析节点\n", "time"),
+            (f"🗣️ {sub}\n", "sub"),
+            (f"🎬 {plot}\n", "plot"),
+            ("-" * 40 + "\n", "time"),
+        ], LOG_VIEW_MAX_LINES)
 
-    def log_stream(self, index, sub, plot):
-        timestamp = datetime.datetime.now().strftime("%H:%M:%S")
-        self.root.after(0, lambda: self._insert_stream(timestamp, sub, plot))
+    def _insert_summary_header(self, title):
+        append_capped(self.txt_summary, [(f"\n=== {title} ===\n", "header")], LOG_VIEW_MAX_LINES)
 
-    def _insert_stream(self, ts, sub, plot):
-        self.txt_stream.config(state='normal')
-        self.txt_stream.insert(tk.END, f"[{ts}] 分析节点\n", "time")
-        self.txt_stream.insert(tk.END, f"🗣️ {sub}\n", "sub")
-        self.txt_stream.insert(tk.END, f"🎬 {plot}\n", "plot")
-        self.txt_stream.insert(tk.END, "-" * 40 + "\n", "time")
-        self.txt_stream.see(tk.END)
-        self.txt_stream.config(state='disabled')
-
-    def log_summary(self, title, content):
-        self.root.after(0, lambda: self._insert_summary(title, content))
-
-    def _insert_summary(self, title, content):
-        self.txt_summary.config(state='normal')
-        self.txt_summary.insert(tk.END, f"\n=== {title} ===\n", "header")
-        self.txt_summary.insert(tk.END, f"{content}\n")
-        self.txt_summary.see(tk.END)
-        self.txt_summary.config(state='disabled')
-
-    def write_file(self, text):
-        if self.log_filename:
-            with open(self.log_filename, "a", encoding="utf-8") as f:
-                f.write(text + "\n")
+    def _append_summary(self, text):
+        append_capped(self.txt_summary, [(text, None)], LOG_VIEW_MAX_LINES)
 
 
 # 定义选区类 (保持完整，修复引用)
-class RegionSelectionWindow(tk.Toplevel):
+class RegionSelectionWindow:
+    """全屏半透明选区窗口 (组合 tk.Toplevel，以便 tkinter 按需导入)"""
+
     def __init__(self, master, callback):
-        super().__init__(master)
         self.callback = callback
-        self.attributes('-fullscreen', True)
-        self.attributes('-alpha', 0.3)
-        self.attributes('-topmost', True)
-        self.configure(bg='black', cursor="crosshair")
+        self.win = tk.Toplevel(master)
+        self.win.attributes('-fullscreen', True)
+        self.win.attributes('-alpha', 0.3)
+        self.win.attributes('-topmost', True)
+        self.win.configure(bg='black', cursor="crosshair")
 
-        self.canvas = tk.Canvas(self, bg="black", highlightthickness=0)
+        self.canvas = tk.Canvas(self.win, bg="black", highlightthickness=0)
         self.canvas.pack(fill=tk.BOTH, expand=True)
 
         self.start_x = None
@@ -561,7 +1167,7 @@ class RegionSelectionWindow(tk.Toplevel):
         self.canvas.bind('<Button-1>', self.on_press)
         self.canvas.bind('<B1-Motion>', self.on_drag)
         self.canvas.bind('<ButtonRelease-1>', self.on_release)
-        self.bind('<Escape>', lambda e: self.destroy())
+        self.win.bind('<Escape>', lambda e: self.win.destroy())
 
     def on_press(self, event):
         self.start_x = event.x
@@ -581,13 +1187,113 @@ class RegionSelectionWindow(tk.Toplevel):
         y2 = max(self.start_y, event.y)
         if (x2 - x1) > 50 and (y2 - y1) > 50:
             self.callback((x1, y1, x2 - x1, y2 - y1))
-            self.destroy()
+            self.win.destroy()
         else:
             self.canvas.delete(self.rect_id)
 
 
-if __name__ == "__main__":
+# =========================================================================
+#                                 命令行入口
+# =========================================================================
+
+def parse_region(text):
+    x, y, w, h = (int(v) for v in text.split(","))
+    return x, y, w, h
+
+
+def print_event(event, data):
+    """命令行订阅者：把关键事件打印到标准输出"""
+    if event == "batch":
+        print(data["entry"], flush=True)
+    elif event == "summary":
+        # 阶段回顾在后台生成，与批次记录交错，生成完毕后整段打印
+        print(f"=== {data['title']} ===\n{data['content']}\n", flush=True)
+    elif event == "status" and data["is_error"]:
+        print(f"[status] {data['message']}", flush=True)
+    elif data.get("kind") != "final":
+        return
+    elif event == "stream_start":
+        print(f"=== {data['title']} ===", flush=True)
+    elif event == "stream_token":
+        print(data["text"], end="", flush=True)
+    elif event == "stream_end":
+        print(f"\n[{format_stream_metrics(data['metrics']) or '生成失败'}]\n", flush=True)
+
+
+def run_headless(args):
+    if args.video or args.synthetic:
+        if args.video:
+            source = VideoFileSource(args.video, start=args.start, end=args.end)
+        else:
+            source = SyntheticSource(args.synthetic, start=args.start)
+        engine = AnalysisEngine(source, log_dir=args.out)
+    else:
+        region = parse_region(args.region)
+        source = ScreenRegionSource(region, CAPTURE_BACKEND)
+        video_ctrl = WindowController() if args.pause_player else None
+        engine = AnalysisEngine(source, log_dir=args.out, video_ctrl=video_ctrl, capture_region=region,
+                                pause_for_summary=args.pause_player)
+
+    os.makedirs(args.out, exist_ok=True)
+    engine.add_listener(print_event)
+    engine.start()
+    try:
+        while engine.thread.is_alive():
+            engine.wait(0.5)
+            if args.duration and source.is_live and time.time() - source.start_time > args.duration:
+                engine.stop()
+    except KeyboardInterrupt:
+        print("Stopping, generating final report...")
+        engine.stop()
+        engine.wait()
+
+    if engine.final_report:
+        report_path = os.path.splitext(engine.log_filename)[0] + "_final.txt"
+        with open(report_path, "w", encoding="utf-8") as f:
+            f.write(engine.final_report)
+        print(f"Final report: {report_path}")
+    print(f"Log: {engine.log_filename}")
+    print(format_capture_stats(engine.source.stats()))
+    print(format_client_stats(engine.client.stats()))
+    pools = format_pool_stats(engine.pool_stats())
+    if pools:
+        print(pools)
+    print(format_gating_stats(engine.gating_stats()))
+    print(format_story_stats(engine.story.stats()))
+    schedule = engine.scheduler.stats()
+    print(format_schedule_stats(schedule) + " | 约束: " +
+          ", ".join(f"{reason} {count}" for reason, count in sorted(schedule["reasons"].items())))
+    if engine.cache:
+        print(format_cache_stats(engine.cache.stats()))
+    print(format_budget_stats(engine.budget.stats()))
+    print(format_route_stats(engine.router.stats()))
+    print(format_imaging_stats(engine.imaging.stats()))
+    print(format_session_stats({"批次": engine.analysis_logs.stats(), "阶段回顾": engine.phase_summaries.stats()}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CineScribe VLM v1Pro。不带参数时启动图形界面。")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--video", help="离线分析本地视频文件 (无界面)")
+    group.add_argument("--region", help="无界面实时截取屏幕区域，格式 x,y,w,h")
+    group.add_argument("--synthetic", type=float, metavar="SECONDS", help="分析程序生成的测试画面 (无界面，用于测试)")
+    parser.add_argument("--out", default=".", help="日志与报告输出目录")
+    parser.add_argument("--start", type=float, default=0.0, help="离线模式起始时间 (秒)")
+    parser.add_argument("--end", type=float, default=None, help="离线模式结束时间 (秒)")
+    parser.add_argument("--duration", type=float, default=None, help="实时模式运行时长 (秒)，默认直到 Ctrl+C")
+    parser.add_argument("--pause-player", action="store_true", help="实时模式阶段回顾时暂停播放器并等待回顾完成 (仅 Windows)")
+    args = parser.parse_args()
+
+    if args.video or args.region or args.synthetic:
+        run_headless(args)
+        return
+
+    load_gui_modules()
     root = tk.Tk()
     app = VideoAnalyzerApp(root)
 
     root.mainloop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""
+提示词前缀缓存基准：原提示词布局 vs 稳定前缀布局。
+
+后端 (llama.cpp / LM Studio) 只能复用与上一次请求相同的提示词前缀的 KV 缓存。
+- v1Pro 批次分析：原提示词把每批都变的历史上下文与字幕放在固定指令中间，固定的分析要求无法复用；
+  新布局把固定指令放在系统消息，可变内容放在最后的用户消息
+- v1 单帧分析：历史剧情 (只在阶段边界变化) 由用户消息移入系统消息，紧跟固定指令
+生成一段模拟会话，统计两种布局下相邻请求可复用的前缀 token 数 (估算)。指定 --url 时把各布局
+依次发给真实后端 (只生成 1 个 token，不带图片)，比较后端报告的预填充耗时 (llama.cpp timings.prompt_ms，
+没有时用请求总耗时) 与前缀缓存命中率，得出每次请求节省的预填充时间。
+
+用法: python benchmarks/bench_prefix_cache.py [--requests 60] [--phase-every 12]
+      [--url http://127.0.0.1:1234/v1/chat/completions --model qwen/qwen3-vl-30b]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from CineScribe_VLM_v1 import PROMPT_SINGLE_FRAME, PROMPT_STORY_CONTEXT, SUMMARY_CONTEXT_TOKENS  # noqa: E402
+from CineScribe_VLM_v1Pro import PROMPT_BATCH_ANALYSIS, PROMPT_BATCH_INPUT  # noqa: E402
+from cinescribe.llm import LLMClient  # noqa: E402
+from cinescribe.tokens import estimate_tokens, trim_text  # noqa: E402
+
+CHARS = "我你他她们的是了在不有这个人来到说要去就和也那会么好吗没看想知道什么时候为现在还走吧对呢里"
+
+# v1Pro 原来的批次提示词 (整段作为用户消息)
+OLD_PROMPT_BATCH_ANALYSIS = (
+    "你是一个客观冷静的视频记录员。正在分析一段约10秒的视频片段。\n"
+    "【历史上下文（前20秒）】：\n{history}\n\n"
+    "【当前输入】：\n"
+    "1. 图片：由4个连续时刻画面按2x2拼接而成。\n"
+    "2. 字幕文本：\n{subtitles}\n\n"
+    "【分析要求】：\n"
+    "1. 客观描述：像监控记录员一样，描述画面中“谁”在“做什么”。重点关注肉眼可见的动作、物体交互和环境变化。\n"
+    "2. 视听融合：结合字幕，指出是谁说了这些话。\n"
+    "3. 情感推测（基于视觉）：你可以根据画面的光影、色调、构图以及人物的面部表情来推测当前的情感基调（如：压抑、明快、紧张等）。\n"
+    "4. 严禁读心：绝对不要猜测人物内心的想法、意图、回忆或潜台词。只描述表现出来的东西。\n"
+    "5. 字数限制：150字以内。"
+)
+
+
+def sentence(rng, low, high):
+    return "".join(rng.choice(CHARS) for _ in range(rng.randint(low, high))) + "。"
+
+
+def make_session(count, phase_every, seed=0):
+    """[(阶段历史, 最近2条记录, 字幕)]；阶段历史每 phase_every 次请求追加一条阶段回顾"""
+    rng = random.Random(seed)
+    phases, entries, session = [], [], []
+    for i in range(count):
+        if i and i % phase_every == 0:
+            phases.append(f"阶段{len(phases) + 1}: " + "".join(sentence(rng, 20, 40) for _ in range(5)))
+        history = trim_text("\n".join(phases), SUMMARY_CONTEXT_TOKENS) or "无"
+        session.append((history, "\n".join(entries[-2:]) or "无", sentence(rng, 8, 20)))
+        entries.append(f"【片段 {i * 10}s+】\n剧情：" + sentence(rng, 60, 120))
+    return session
+
+
+def batch_old(history, recent, subtitles):
+    return [{"role": "user", "content": OLD_PROMPT_BATCH_ANALYSIS.format(history=recent, subtitles=subtitles)}]
+
+
+def batch_new(history, recent, subtitles):
+    return [
+        {"role": "system", "content": PROMPT_BATCH_ANALYSIS},
+        {"role": "user", "content": PROMPT_BATCH_INPUT.format(history=recent, subtitles=subtitles)}
+    ]
+
+
+def frame_old(history, recent, subtitles):
+    context = f"【已知历史剧情(阶段回顾)】:\n{history}\n\n【最近2帧记录】:\n{recent}"
+    return [
+        {"role": "system", "content": PROMPT_SINGLE_FRAME},
+        {"role": "user", "content": context + "\n\n请分析下面这张图片："}
+    ]
+
+
+def frame_new(history, recent, subtitles):
+    return [
+        {"role": "system", "content": PROMPT_SINGLE_FRAME + PROMPT_STORY_CONTEXT.format(history=history)},
+        {"role": "user", "content": f"【最近2帧记录】:\n{recent}\n\n请分析下面这张图片："}
+    ]
+
+
+LAYOUTS = [
+    ("v1Pro 批次 原布局", batch_old),
+    ("v1Pro 批次 稳定前缀", batch_new),
+    ("v1 单帧 原布局", frame_old),
+    ("v1 单帧 稳定前缀", frame_new),
+]
+
+
+def serialize(messages):
+    return "".join(f"<|{m['role']}|>{m['content']}" for m in messages)
+
+
+def prefix_reuse(prompts):
+    """(平均提示词 token, 平均可复用前缀 token)：每个提示词与上一个的公共前缀"""
+    total = reused = 0
+    previous = ""
+    for prompt in prompts:
+        total += estimate_tokens(prompt)
+        reused += estimate_tokens(os.path.commonprefix([previous, prompt]))
+        previous = prompt
+    return total / len(prompts), reused / len(prompts)
+
+
+def measure(client, url, model, requests):
+    """依次发送，返回 (平均预填充秒数, 前缀缓存命中率 或 None, 失败数)"""
+    prefills, prompt_tokens, cached_tokens, failures = [], 0, 0, 0
+    for messages in requests:
+        metrics = {}
+        start = time.perf_counter()
+        if client.chat(url, model, messages, max_tokens=1, temperature=0.0, metrics=metrics) is None:
+            failures += 1
+            continue
+        if "prefill_ms" in metrics:
+            prefills.append(metrics["prefill_ms"] / 1000.0)
+        else:
+            prefills.append(time.perf_counter() - start)
+        if metrics.get("prompt_tokens") and "cached_tokens" in metrics:
+            prompt_tokens += metrics["prompt_tokens"]
+            cached_tokens += metrics["cached_tokens"]
+    avg = sum(prefills) / len(prefills) if prefills else 0.0
+    return avg, (cached_tokens / prompt_tokens if prompt_tokens else None), failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=60)
+    parser.add_argument("--phase-every", type=int, default=12, help="每多少次请求新增一条阶段回顾")
+    parser.add_argument("--url", help="chat/completions 地址；不指定时只做离线估算")
+    parser.add_argument("--model", default="qwen/qwen3-vl-30b")
+    parser.add_argument("--no-cache-prompt", action="store_true", help="不附加 cache_prompt 参数")
+    args = parser.parse_args()
+
+    session = make_session(args.requests, args.phase_every)
+    print(f"{args.requests} 次请求，每 {args.phase_every} 次新增一条阶段回顾")
+    print(f"{'布局':<20}{'平均 token':>12}{'可复用前缀':>12}{'复用率':>10}")
+    for name, layout in LAYOUTS:
+        total, reused = prefix_reuse([serialize(layout(*item)) for item in session])
+        print(f"{name:<20}{total:>12.0f}{reused:>12.0f}{reused / total * 100:>9.0f}%")
+
+    if not args.url:
+        return
+    client = LLMClient(read_timeout=120, extra_params=None if args.no_cache_prompt else {"cache_prompt": True})
+    rng = random.Random()
+    prefills = []
+    print(f"\n后端 {args.url} ({args.model})")
+    print(f"{'布局':<20}{'平均预填充':>12}{'前缀缓存命中':>14}{'失败':>6}")
+    for name, layout in LAYOUTS:
+        # 每种布局加一个随机开头，避免命中上一种布局留下的缓存
+        nonce = f"会话{rng.randrange(10 ** 8)}\n"
+        requests = []
+        for item in session:
+            messages = layout(*item)
+            messages[0] = dict(messages[0], content=nonce + messages[0]["content"])
+            requests.append(messages)
+        avg, hit_rate, failures = measure(client, args.url, args.model, requests)
+        prefills.append(avg)
+        hit = f"{hit_rate * 100:.0f}%" if hit_rate is not None else "-"
+        print(f"{name:<20}{avg * 1000:>10.0f}ms{hit:>14}{failures:>6}")
+    for i in range(0, len(LAYOUTS), 2):
+        saved = (prefills[i] - prefills[i + 1]) * 1000
+        print(f"{LAYOUTS[i][0].rsplit(' ', 1)[0]}: 每次请求节省预填充 {saved:.0f}ms")
+    client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+拼图与编码基准：原实现 vs cinescribe.imaging (每帧一次缩放 + 复用画布与编码缓冲)。
+
+- v1Pro 2x2 拼图：原实现先把 4 帧各缩小一半贴到原分辨率画布，再把整张拼图 LANCZOS 缩小到 VLM_MAX_DIMENSION；
+  新实现每帧直接缩放到最终格子尺寸，贴进复用画布
+- v1Pro 字幕条：原实现原宽拼接后整体缩放；新实现每条直接缩放到 OCR_TARGET_WIDTH
+- v1 单帧 (含界面预览缩略图)：原实现每帧整帧复制两次 (采集时保留原图 + 预览缩略图前)；新实现直接缩放
+统计每批次：
+- 耗时
+- Pillow 新建图像数 (Image.core.get_stats，含 resize 内部的中间图像)
+- 新建图像的像素内存 (Image._new 返回的图像，Pillow 内部 RGB 每像素 4 字节；不含 resize 内部的中间缓冲)
+- Python 侧分配峰值 (tracemalloc：getvalue / Base64 等字节串；Pillow 图像内存不经过 tracemalloc)
+在调用线程内运行，不含进程池开销。
+
+用法: python benchmarks/bench_stitch.py [--batches 30] [--size 1920x1080]
+"""
+import argparse
+import base64
+import io
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from PIL import Image  # noqa: E402
+
+from CineScribe_VLM_v1Pro import OCR_TARGET_WIDTH, SUBTITLE_BAND, VLM_MAX_DIMENSION  # noqa: E402
+from cinescribe.imaging import encode_data_url, fit_box, fit_within, stitch_grid, stitch_vertical  # noqa: E402
+from cinescribe.sources import SyntheticSource  # noqa: E402
+
+
+# ---------- 原实现 (v1Pro AnalysisEngine 的图像方法与 v1 capture_screen_data) ----------
+
+def old_image_to_base64(img, quality=85):
+    buffered = io.BytesIO()
+    img.save(buffered, format="JPEG", quality=quality)
+    return f"data:image/jpeg;base64,{base64.b64encode(buffered.getvalue()).decode()}"
+
+
+def old_grid(frames, subs):
+    w, h = frames[0].size
+    cw, ch = w // 2, h // 2
+    target = Image.new('RGB', (w, h))
+    target.paste(frames[0].resize((cw, ch)), (0, 0))
+    target.paste(frames[1].resize((cw, ch)), (cw, 0))
+    target.paste(frames[2].resize((cw, ch)), (0, ch))
+    target.paste(frames[3].resize((cw, ch)), (cw, ch))
+    if w > VLM_MAX_DIMENSION or h > VLM_MAX_DIMENSION:
+        ratio = min(VLM_MAX_DIMENSION / w, VLM_MAX_DIMENSION / h)
+        target = target.resize((int(w * ratio), int(h * ratio)), Image.Resampling.LANCZOS)
+    return old_image_to_base64(target)
+
+
+def old_strip(frames, subs):
+    w, h = subs[0].size
+    target = Image.new('RGB', (w, h * len(subs)))
+    for i, img in enumerate(subs):
+        target.paste(img, (0, i * h))
+    ratio = OCR_TARGET_WIDTH / w
+    target = target.resize((OCR_TARGET_WIDTH, int(h * len(subs) * ratio)), Image.Resampling.LANCZOS)
+    return old_image_to_base64(target)
+
+
+def old_frame(frames, subs):
+    screenshot = frames[0]
+    original_img = screenshot.copy()  # capture_screen_data 保留原图
+    img_display = original_img.copy()  # show_preview
+    img_display.thumbnail((380, 250))
+    # screenshot.thumbnail((1024, 1024)) 会就地修改输入帧，这里做同样的缩放但生成新图
+    w, h = screenshot.size
+    ratio = min(1024 / w, 1024 / h, 1.0)
+    thumb = screenshot.resize((round(w * ratio), round(h * ratio)), Image.Resampling.BICUBIC, reducing_gap=2.0)
+    return img_display, old_image_to_base64(thumb, 80)
+
+
+# ---------- 新实现 ----------
+
+def new_grid(frames, subs):
+    return encode_data_url(stitch_grid(frames, VLM_MAX_DIMENSION))
+
+
+def new_strip(frames, subs):
+    return encode_data_url(stitch_vertical(subs, OCR_TARGET_WIDTH))
+
+
+def new_frame(frames, subs):
+    return fit_box(frames[0], (380, 250)), encode_data_url(fit_within(frames[0], 1024, Image.Resampling.BICUBIC), 80)
+
+
+CASES = [
+    ("2x2 拼图", old_grid, new_grid),
+    ("字幕条", old_strip, new_strip),
+    ("v1 单帧", old_frame, new_frame),
+]
+
+
+def make_batches(count, size):
+    source = SyntheticSource(duration=count * 10, size=size)
+    batches = []
+    for _ in range(count):
+        frames = []
+        for _ in range(4):
+            frames.append(source.read().image)
+            source.advance(2.5)
+        w, h = size
+        subs = [f.crop((0, h - int(h * SUBTITLE_BAND), w, h)) for f in frames]
+        batches.append((frames, subs))
+    return batches
+
+
+def measure(fn, batches):
+    """(每批毫秒, 每批新建图像数, 每批新建图像 MB, Python 分配峰值 KB)"""
+    fn(*batches[0])  # 预热 (复用的画布与缓冲在这里分配)
+    allocated = [0]
+    original_new = Image.Image._new
+
+    def counting_new(self, im):
+        w, h = im.size
+        allocated[0] += w * h * (1 if im.mode in ("1", "L", "P") else 4)
+        return original_new(self, im)
+
+    Image.Image._new = counting_new
+    before = Image.core.get_stats()["new_count"]
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        for frames, subs in batches:
+            fn(frames, subs)
+    finally:
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        Image.Image._new = original_new
+    images = Image.core.get_stats()["new_count"] - before
+    n = len(batches)
+    return elapsed / n * 1000, images / n, allocated[0] / n / 2 ** 20, peak / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--batches", type=int, default=30)
+    parser.add_argument("--size", default="1920x1080", help="帧尺寸 宽x高")
+    args = parser.parse_args()
+    size = tuple(int(v) for v in args.size.lower().split("x"))
+
+    batches = make_batches(args.batches, size)
+    print(f"{args.batches} 批 x 4 帧，{size[0]}x{size[1]}")
+    print(f"{'任务':<10}{'实现':<8}{'每批':>10}{'新建图像':>10}{'图像内存':>12}{'Python 峰值':>14}")
+    for name, old, new in CASES:
+        for label, fn in (("原实现", old), ("新实现", new)):
+            ms, images, mb, peak = measure(fn, batches)
+            print(f"{name:<10}{label:<8}{ms:>8.1f}ms{images:>10.1f}{mb:>10.1f}MB{peak:>12.0f}KB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+"""
+CineScribe 公共组件。
+
+CineScribe_VLM_v1.py 与 CineScribe_VLM_v1Pro.py 共用的帧来源、网络、图像处理等模块。
+"""
@@ -0,0 +1,273 @@
+"""
+多端点负载均衡。
+
+每个角色 (OCR / VLM / 总结) 配置一组端点，各端点是运行同一模型 (相同模型 ID) 的不同服务地址：
+回复缓存的键与 token 预算都按模型 ID 计算，同一角色混用不同模型时无法区分回答出自哪个模型。
+- 按在途请求数最少 ("least_outstanding") 或按观测延迟 ("latency") 选择端点
+- 每个端点一个熔断器：连续失败 max_failures 次后断开 (open)，期间请求直接跳过该端点而不是等待超时；
+  eject_seconds 后进入半开 (half_open) 做健康检查 (GET /v1/models)，通过才重新接入 (closed)
+- 失败后最多重试 retries 次，重试前按指数退避 + 随机抖动等待，优先换一个端点
+  (流式请求已经输出过 token 时不重试，避免重复文本)
+- hedge=True 时，非流式请求超过该角色 p95 延迟仍未返回，向另一个端点发送副本，取先返回的结果；
+  落后的请求无法中途取消 (非流式回复要等生成完毕才返回)，会继续占用并发名额，
+  因此只向仍有空闲名额的端点对冲，负载高时不对冲
+增加一台 GPU 服务器只需在配置中追加端点。
+"""
+import queue
+import random
+import threading
+import time
+from collections import deque
+
+from .llm import percentile, short_endpoint
+
+POLICIES = ("least_outstanding", "latency")
+LATENCY_ALPHA = 0.3  # 延迟滑动平均系数
+HEDGE_PERCENTILE = 95
+HEDGE_MIN_SAMPLES = 20  # 延迟样本不足时不对冲
+MAX_BACKOFF = 10.0  # 单次退避等待上限 (秒)
+
+
+class _Node:
+    __slots__ = ("url", "model", "outstanding", "latency", "failures", "state", "retry_at", "requests",
+                 "ejections")
+
+    def __init__(self, url, model):
+        self.url = url
+        self.model = model
+        self.outstanding = 0
+        self.latency = 0.0  # 成功请求延迟的滑动平均 (秒)，0 表示尚无数据
+        self.failures = 0  # 连续失败次数
+        self.state = "closed"  # 熔断器状态: closed 正常 / open 断开 / half_open 健康检查中
+        self.retry_at = 0.0
+        self.requests = 0
+        self.ejections = 0
+
+
+class EndpointPool:
+    """
+    一个角色的端点池。endpoints: [(url, model_id), ...]，模型 ID 须一致，用作缓存与预算的键。
+    chat() 与 LLMClient.chat 参数一致 (不含 url / model)。
+    retries: 失败后的重试次数；backoff: 首次重试前的最大等待 (秒)，之后每次翻倍；hedge: 是否对冲慢请求。
+    """
+
+    def __init__(self, client, role, endpoints, policy="least_outstanding", max_failures=3, eject_seconds=30.0,
+                 retries=1, backoff=1.0, hedge=False):
+        if not endpoints:
+            raise ValueError(f"{role} 至少需要一个端点")
+        models = sorted({model for _, model in endpoints})
+        if len(models) > 1:
+            raise ValueError(f"{role} 的端点须使用同一模型，当前为 {models}")
+        if policy not in POLICIES:
+            raise ValueError(f"未知的负载均衡策略: {policy}，可选 {POLICIES}")
+        self.client = client
+        self.role = role
+        self.policy = policy
+        self.max_failures = max(1, max_failures)
+        self.eject_seconds = eject_seconds
+        self.nodes = [_Node(url, model) for url, model in endpoints]
+        self.model = self.nodes[0].model
+        self.retries = max(0, retries)
+        self.backoff = backoff
+        self.hedge = hedge
+        self.latencies = deque(maxlen=200)  # 成功的非流式请求延迟，用于对冲阈值
+        self.counters = {"requests": 0, "failed": 0, "retries": 0, "rejected": 0, "hedges": 0, "hedge_wins": 0}
+        self.lock = threading.Lock()
+
+    def _score(self, node):
+        if self.policy == "latency":
+            return node.latency * (node.outstanding + 1), node.outstanding
+        return node.outstanding, node.latency
+
+    def _pick(self, exclude, strict=False, spare=False):
+        """
+        选择熔断器闭合的端点，优先不在 exclude 中的；strict=True 时只选不在 exclude 中的；
+        spare=True 时只选客户端并发名额未满的 (名额按 URL 由各角色共享)。
+        没有可用端点时返回 None (熔断拒绝)。
+        """
+        now = time.time()
+        with self.lock:
+            for node in self.nodes:
+                if node.state == "open" and now >= node.retry_at:
+                    node.state = "half_open"
+                    threading.Thread(target=self._probe, args=(node,), daemon=True,
+                                     name=f"probe-{self.role}").start()
+            closed = [n for n in self.nodes if n.state == "closed"]
+            candidates = [n for n in closed if n not in exclude]
+            if spare:
+                candidates = [n for n in candidates if self.client.has_capacity(n.url)]
+            if not candidates and not strict:
+                candidates = closed
+            if not candidates:
+                return None
+            node = min(candidates, key=self._score)
+            node.outstanding += 1
+            node.requests += 1
+            return node
+
+    def _probe(self, node):
+        """半开状态的健康检查：通过则闭合，否则继续断开"""
+        ok = self.client.probe(node.url)
+        with self.lock:
+            if ok:
+                node.state = "closed"
+                node.failures = 0
+            else:
+                node.state = "open"
+                node.retry_at = time.time() + self.eject_seconds
+        print(f"Endpoint {short_endpoint(node.url)} ({self.role}) health check {'passed' if ok else 'failed'}")
+
+    def _finish(self, node, latency, ok):
+        with self.lock:
+            node.outstanding -= 1
+            if ok:
+                node.failures = 0
+                node.latency = latency if not node.latency else \
+                    (1 - LATENCY_ALPHA) * node.latency + LATENCY_ALPHA * latency
+                return
+            node.failures += 1
+            if node.failures >= self.max_failures and node.state == "closed":
+                node.state = "open"
+                node.retry_at = time.time() + self.eject_seconds
+                node.ejections += 1
+                print(f"Endpoint {short_endpoint(node.url)} ({self.role}) circuit open after {node.failures} failures")
+
+    def _count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+    def _hedge_delay(self):
+        """对冲等待时间 (该角色成功请求延迟的 p95)；不对冲时返回 None"""
+        if not self.hedge or len(self.nodes) < 2:
+            return None
+        with self.lock:
+            if len(self.latencies) < HEDGE_MIN_SAMPLES:
+                return None
+            return percentile(list(self.latencies), HEDGE_PERCENTILE)
+
+    def _attempt(self, node, messages, options, results):
+        """在 node 上发送一次非流式请求，结果 (node, 文本, 指标) 放入 results"""
+        metrics = {}
+        start = time.time()
+        content = None
+        try:
+            content = self.client.chat(node.url, node.model, messages, metrics=metrics, **options)
+        finally:
+            latency = time.time() - start
+            self._finish(node, latency, content is not None)
+            if content is not None:
+                with self.lock:
+                    self.latencies.append(latency)
+            results.put((node, content, metrics))
+
+    def _hedged(self, node, tried, messages, options, metrics):
+        """发送请求；超过对冲阈值仍未返回时向另一个端点发送副本，返回先成功的结果"""
+        results = queue.Queue()
+        delay = self._hedge_delay()
+        if delay is None:
+            self._attempt(node, messages, options, results)
+            deadline = None
+        else:
+            threading.Thread(target=self._attempt, args=(node, messages, options, results), daemon=True,
+                             name=f"request-{self.role}").start()
+            deadline = time.time() + delay
+        running = 1
+        while running:
+            try:
+                timeout = max(0.0, deadline - time.time()) if deadline is not None else None
+                winner, content, attempt_metrics = results.get(timeout=timeout)
+            except queue.Empty:
+                deadline = None  # 每次尝试最多对冲一次
+                # 只向有空闲并发名额的端点发送副本
+                backup = self._pick(tried, strict=True, spare=True)
+                if backup is not None:
+                    tried.append(backup)
+                    self._count("hedges")
+                    threading.Thread(target=self._attempt, args=(backup, messages, options, results), daemon=True,
+                                     name=f"hedge-{self.role}").start()
+                    running += 1
+                continue
+            running -= 1
+            if content is not None:
+                if winner is not node:
+                    self._count("hedge_wins")
+                if metrics is not None:
+                    metrics.update(attempt_metrics)
+                    metrics["hedged"] = running > 0 or winner is not node
+                return content
+        return None
+
+    def chat(self, messages, max_tokens=200, temperature=0.7, read_timeout=None, on_token=None, metrics=None):
+        """
+        选择端点发送请求；失败时退避后重试 (最多 retries 次)，全部失败或熔断拒绝返回 None。
+        传入 metrics 时额外写入 attempts (尝试次数)。
+        """
+        self._count("requests")
+        options = {"max_tokens": max_tokens, "temperature": temperature, "read_timeout": read_timeout}
+        emitted = []
+
+        def forward(text):
+            emitted.append(True)
+            on_token(text)
+
+        tried = []
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self._count("retries")
+                # 指数退避 + 全量随机抖动，避免多个工作线程同时重试
+                time.sleep(random.uniform(0, min(MAX_BACKOFF, self.backoff * 2 ** (attempt - 1))))
+            if metrics is not None:
+                metrics["attempts"] = attempt + 1
+            node = self._pick(tried)
+            if node is None:
+                self._count("rejected")
+                break
+            tried.append(node)
+            if on_token is None:
+                result = self._hedged(node, tried, messages, options, metrics)
+            else:
+                start = time.time()
+                result = None
+                try:
+                    result = self.client.chat(node.url, node.model, messages, on_token=forward, metrics=metrics,
+                                              **options)
+                finally:
+                    self._finish(node, time.time() - start, result is not None)
+            if result is not None:
+                return result
+            if emitted:
+                break
+        self._count("failed")
+        return None
+
+    def stats(self):
+        with self.lock:
+            return {"role": self.role, "policy": self.policy, **self.counters,
+                    "hedge_after": percentile(list(self.latencies), HEDGE_PERCENTILE) if self.hedge else 0.0,
+                    "nodes": [
+                        {"url": n.url, "model": n.model, "state": n.state, "outstanding": n.outstanding,
+                         "latency": n.latency, "requests": n.requests, "ejections": n.ejections}
+                        for n in self.nodes]}
+
+
+def format_pool_stats(pools):
+    """只显示有多个端点、有熔断端点或发生过重试 / 对冲 / 失败的角色；都不需要显示时返回空串"""
+    lines = []
+    for pool in pools:
+        nodes = pool["nodes"]
+        eventful = pool["retries"] or pool["hedges"] or pool["rejected"] or pool["failed"]
+        if len(nodes) < 2 and all(n["state"] == "closed" for n in nodes) and not eventful:
+            continue
+        parts = []
+        for n in nodes:
+            mark = {"closed": "✓", "open": "✗ 熔断", "half_open": "? 半开"}[n["state"]]
+            text = f"{short_endpoint(n['url'])} {mark} {n['requests']}次 在途{n['outstanding']}"
+            if n["ejections"]:
+                text += f" 熔断{n['ejections']}次"
+            parts.append(text)
+        line = f"{pool['role']}: " + " | ".join(parts)
+        if eventful:
+            line += (f" | 重试 {pool['retries']} | 对冲 {pool['hedges']} (胜 {pool['hedge_wins']}) | "
+                     f"熔断拒绝 {pool['rejected']} | 失败 {pool['failed']}/{pool['requests']}")
+        lines.append(line)
+    return "\n".join(lines)
@@ -0,0 +1,144 @@
+"""
+OCR / VLM 回复的持久化缓存。
+
+键由模型 ID、提示词文本与图片的感知哈希组成 (内容寻址)：
+同一部片重跑时拼接图几乎不变，只有提示词改动过的阶段才会重新请求模型。
+存储使用 SQLite，超过容量上限时按最近使用时间 (LRU) 淘汰。
+"""
+import base64
+import hashlib
+import io
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from PIL import Image
+
+
+def perceptual_hash(img, hash_size=16):
+    """
+    dHash：灰度缩放到 (hash_size+1) x hash_size，比较相邻像素亮度。
+    对 JPEG 压缩噪声不敏感；hash_size=16 得到 256 位，足以区分字幕条内容的变化。
+    """
+    small = img.convert("L").resize((hash_size + 1, hash_size), Image.Resampling.BILINEAR)
+    pixels = list(small.getdata())
+    bits = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            bits = (bits << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return f"{bits:0{hash_size * hash_size // 4}x}"
+
+
+def data_url_hash(url):
+    """data:image/...;base64 图片 -> 感知哈希；无法解码时退化为内容 sha1"""
+    try:
+        raw = base64.b64decode(url.split(",", 1)[1])
+        return perceptual_hash(Image.open(io.BytesIO(raw)))
+    except Exception:
+        return hashlib.sha1(url.encode()).hexdigest()
+
+
+class ResponseCache:
+    """
+    线程安全的 SQLite 回复缓存。
+    make_key() 计算请求的内容地址，get()/put() 读写，stats() 返回命中统计。
+    """
+
+    def __init__(self, directory, max_bytes=200 * 1024 * 1024):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, "responses.sqlite")
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(self.path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS responses_lru ON responses (last_access)")
+        self.db.commit()
+        self.total_bytes = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(model, messages, max_tokens=None):
+        """模型 ID + 全部文本 + 图片感知哈希 -> sha256"""
+        canonical = []
+        for message in messages:
+            content = message["content"]
+            if isinstance(content, str):
+                parts = [content]
+            else:
+                parts = []
+                for part in content:
+                    if part.get("type") == "image_url":
+                        parts.append("image:" + data_url_hash(part["image_url"]["url"]))
+                    else:
+                        parts.append(part.get("text", ""))
+            canonical.append([message["role"], parts])
+        blob = json.dumps([model, max_tokens, canonical], ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        with self.lock:
+            row = self.db.execute("SELECT value FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.db.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+            self.db.commit()
+            return row[0]
+
+    def put(self, key, value):
+        size = len(value.encode("utf-8")) + len(key)
+        with self.lock:
+            old = self.db.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            if old:
+                self.total_bytes -= old[0]
+            self.db.execute("INSERT OR REPLACE INTO responses (key, value, size, last_access) VALUES (?, ?, ?, ?)",
+                            (key, value, size, time.time()))
+            self.total_bytes += size
+            self._evict()
+            self.db.commit()
+
+    def _evict(self):
+        """按 last_access 从旧到新淘汰，直到总大小不超过上限"""
+        while self.total_bytes > self.max_bytes:
+            rows = self.db.execute("SELECT key, size FROM responses ORDER BY last_access LIMIT 64").fetchall()
+            if not rows:
+                self.total_bytes = 0
+                return
+            for key, size in rows:
+                self.db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.total_bytes -= size
+                self.evictions += 1
+                if self.total_bytes <= self.max_bytes:
+                    return
+
+    def stats(self):
+        with self.lock:
+            entries = self.db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": entries,
+                "bytes": self.total_bytes,
+            }
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+def format_cache_stats(stats):
+    return (f"缓存: 命中 {stats['hits']} / 未命中 {stats['misses']} ({stats['hit_rate'] * 100:.0f}%) | "
+            f"{stats['entries']} 条 {stats['bytes'] / 1024 / 1024:.1f}MB | 淘汰 {stats['evictions']}")
@@ -0,0 +1,139 @@
+"""
+字幕去重。
+
+原实现对每一行新字幕与历史中的每一行逐一计算 difflib.SequenceMatcher，
+开销随历史长度线性增长，因此只能保留 10 行历史，一分钟前重复出现的台词无法识别。
+
+这里改用字符 n-gram 的 MinHash + LSH 分桶索引：
+每行只与落入相同桶的少数候选行做精确的 Jaccard 比较，单行开销基本与历史长度无关，
+历史按时间窗口 (默认 10 分钟) 保留。OCR 流程与字幕导出共用同一个实现。
+"""
+import random
+import re
+import zlib
+from collections import deque
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+_MASK64 = (1 << 64) - 1
+# 比较前去掉空白与标点，OCR 常见的标点误差不影响判断
+_IGNORED = re.compile(r"[\s\W_]+", re.UNICODE)
+
+
+def normalize_line(line):
+    return _IGNORED.sub("", line).lower()
+
+
+def shingles(text, n=2):
+    """字符 n-gram 集合；短于 n 的文本整体作为一个 n-gram"""
+    if len(text) <= n:
+        return {text} if text else set()
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+def jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class _Entry:
+    __slots__ = ("line", "grams", "keys", "t")
+
+    def __init__(self, line, grams, keys, t):
+        self.line = line
+        self.grams = grams
+        self.keys = keys
+        self.t = t
+
+
+class SubtitleDeduplicator:
+    """
+    MinHash LSH 字幕去重器。
+    threshold: n-gram Jaccard 相似度阈值，达到即视为重复
+        (默认 0.55，约等于原 difflib ratio > 0.85：八个字以上的句子错一个字仍算重复)
+    window: 历史保留时长 (秒，与 process 传入的时间同一时间轴)；max_lines 为条数上限
+    num_perm = bands * rows；rows 越小候选越多、漏检越少，候选最终都会做精确比较。
+    MinHash 使用 multiply-shift 哈希 ((a*x + b) mod 2^64) >> 32，安装了 NumPy 时向量化计算。
+    """
+
+    def __init__(self, threshold=0.55, window=600.0, max_lines=5000, ngram=2, bands=16, rows=2, seed=1):
+        self.threshold = threshold
+        self.window = window
+        self.max_lines = max_lines
+        self.ngram = ngram
+        self.bands = bands
+        self.rows = rows
+        rng = random.Random(seed)
+        self.perms = [(rng.getrandbits(64) | 1, rng.getrandbits(64)) for _ in range(bands * rows)]
+        if np is not None:
+            self.perm_a = np.array([a for a, _ in self.perms], dtype=np.uint64)[:, None]
+            self.perm_b = np.array([b for _, b in self.perms], dtype=np.uint64)[:, None]
+        self.buckets = {}
+        self.entries = deque()
+        self.last_t = 0.0
+
+    def _band_keys(self, grams):
+        hashes = [zlib.crc32(g.encode("utf-8")) for g in grams]
+        if np is not None:
+            # uint64 乘加自然按 2^64 回绕
+            products = self.perm_a * np.array(hashes, dtype=np.uint64) + self.perm_b
+            signature = (products >> np.uint64(32)).min(axis=1).tolist()
+        else:
+            signature = [min(((a * h + b) & _MASK64) >> 32 for h in hashes) for a, b in self.perms]
+        return [(i, tuple(signature[i * self.rows:(i + 1) * self.rows])) for i in range(self.bands)]
+
+    def _expire(self, now):
+        while self.entries and (len(self.entries) > self.max_lines or now - self.entries[0].t > self.window):
+            entry = self.entries.popleft()
+            for key in entry.keys:
+                bucket = self.buckets.get(key)
+                if bucket is not None:
+                    bucket.discard(entry)
+                    if not bucket:
+                        del self.buckets[key]
+
+    def is_duplicate(self, line, t=None, remember=True):
+        """line 是否与时间窗口内的历史字幕重复；remember=True 时把新行加入历史"""
+        now = self.last_t if t is None else t
+        self.last_t = now
+        self._expire(now)
+
+        grams = shingles(normalize_line(line), self.ngram)
+        if not grams:
+            return True
+        keys = self._band_keys(grams)
+        candidates = set()
+        for key in keys:
+            bucket = self.buckets.get(key)
+            if bucket:
+                candidates.update(bucket)
+        for entry in candidates:
+            if jaccard(grams, entry.grams) >= self.threshold:
+                return True
+
+        if remember:
+            entry = _Entry(line, grams, keys, now)
+            self.entries.append(entry)
+            for key in keys:
+                self.buckets.setdefault(key, set()).add(entry)
+        return False
+
+    def process(self, raw_text, t=None):
+        """OCR 输出 (多行) -> 去掉重复行后用空格连接；与原 SubtitleDeduplicator.process 接口一致"""
+        if not raw_text or "无" in raw_text:
+            return ""
+        lines = [line.strip() for line in raw_text.split('\n') if line.strip()]
+        unique_lines = []
+        for line in lines:
+            if len(line) < 2:
+                continue
+            if not self.is_duplicate(line, t):
+                unique_lines.append(line)
+        return " ".join(unique_lines)
+
+    def __len__(self):
+        return len(self.entries)
@@ -0,0 +1,221 @@
+"""
+画面变化检测 (视觉去重门控)。
+
+每帧先整体缩小为灰度小图，再分别对字幕带 (画面底部) 与画面区计算特征：
+- "mean": 平均像素差 (原实现，对压缩噪声敏感)
+- "dhash": 差值哈希，比较相邻像素亮度
+- "phash": 感知哈希，低频 DCT 系数与中位数比较
+- "histogram": 灰度直方图交集
+距离统一为 0-100 的差异度，字幕带与画面区各有阈值。
+特征缓存在 Frame.features 上，同一帧与前后两帧比较时只计算一次。
+
+SubtitleStripFilter 在 OCR 之前按笔画密度与笔画签名过滤字幕条，
+只把出现新文字的字幕条送去 OCR 模型。
+"""
+from PIL import Image, ImageChops, ImageStat
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+METHODS = ("mean", "dhash", "phash", "histogram")
+
+# 各方法默认阈值 (字幕带, 画面区)；画面区阈值较高，只对镜头切换等大变化敏感
+DEFAULT_THRESHOLDS = {
+    "mean": (1.0, 4.0),
+    "dhash": (3.0, 20.0),
+    "phash": (8.0, 25.0),
+    "histogram": (3.0, 15.0),
+}
+
+WORK_WIDTH = 256  # 先缩小到该宽度，之后的特征都在小图上计算
+HISTOGRAM_BINS = 32
+# 比较时的容差 (灰度级)：纯色区域 (黑屏、片头卡) 的相邻像素只差压缩噪声，不应产生随机比特
+HASH_TOLERANCE = 2.0
+
+# 哈希网格 (宽, 高)：字幕带扁长，横向需要更多采样点才能分辨文字变化
+SUBTITLE_GRID = (32, 8)
+PICTURE_GRID = (8, 8)
+# mean 方法的比较尺寸，与原实现一致
+SUBTITLE_MEAN_SIZE = (64, 20)
+PICTURE_MEAN_SIZE = (64, 36)
+
+_dct_matrices = {}
+
+
+def _dct_matrix(n):
+    """n 点 DCT-II 正交矩阵"""
+    m = _dct_matrices.get(n)
+    if m is None:
+        k = np.arange(n)[:, None]
+        i = np.arange(n)[None, :]
+        m = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+        m[0] /= np.sqrt(2.0)
+        _dct_matrices[n] = m
+    return m
+
+
+def _resize(gray, size):
+    return np.asarray(gray.resize(size, Image.Resampling.BILINEAR), dtype=np.float32)
+
+
+def _features(gray, method, grid, mean_size):
+    """灰度小图 -> 单个区域的特征"""
+    if np is None:
+        return gray.resize(mean_size, Image.Resampling.BILINEAR)
+    gw, gh = grid
+    if method == "mean":
+        return _resize(gray, mean_size)
+    if method == "dhash":
+        s = _resize(gray, (gw + 1, gh))
+        return s[:, 1:] > s[:, :-1] + HASH_TOLERANCE
+    if method == "phash":
+        s = _resize(gray, (gw * 4, gh * 4))
+        coeffs = (_dct_matrix(gh * 4) @ s @ _dct_matrix(gw * 4).T)[:gh, :gw]
+        return coeffs > np.median(coeffs.ravel()[1:]) + HASH_TOLERANCE  # 中位数排除直流分量
+    hist = np.bincount(np.asarray(gray).ravel() // (256 // HISTOGRAM_BINS), minlength=HISTOGRAM_BINS)
+    return hist / max(1, hist.sum())
+
+
+def _distance(a, b, method):
+    """两份特征的差异度 (0-100)"""
+    if np is None:
+        stat = ImageStat.Stat(ImageChops.difference(a, b))
+        return stat.mean[0] / 255 * 100
+    if method == "mean":
+        return float(np.abs(a - b).mean()) / 255 * 100
+    if method in ("dhash", "phash"):
+        return np.count_nonzero(a != b) / a.size * 100
+    return (1.0 - float(np.minimum(a, b).sum())) * 100
+
+
+class ChangeScore:
+    """一次比较的结果：字幕带 / 画面区差异度，以及是否超过任一阈值"""
+
+    __slots__ = ("subtitle", "picture", "changed", "level")
+
+    def __init__(self, subtitle, picture, changed, level):
+        self.subtitle = subtitle
+        self.picture = picture
+        self.changed = changed
+        self.level = level  # 相对阈值的最大比例，>= 1 即视为变化
+
+
+class ChangeDetector:
+    """
+    可插拔的变化检测器。
+    compare(prev, frame) 比较两帧 (sources.Frame)，prev 为 None 时视为变化。
+    subtitle_band 为字幕带占画面底部的比例；阈值为 None 时使用该方法的默认值。
+    未安装 NumPy 时退化为 mean 方法。
+    """
+
+    def __init__(self, method="dhash", subtitle_band=1 / 3, subtitle_threshold=None, picture_threshold=None):
+        if method not in METHODS:
+            raise ValueError(f"未知的变化检测方法: {method}，可选 {METHODS}")
+        if np is None and method != "mean":
+            print(f"NumPy not installed, change detector falls back to 'mean' (requested '{method}')")
+            method = "mean"
+        self.method = method
+        self.subtitle_band = subtitle_band
+        default_sub, default_pic = DEFAULT_THRESHOLDS[method]
+        self.subtitle_threshold = subtitle_threshold if subtitle_threshold is not None else default_sub
+        self.picture_threshold = picture_threshold if picture_threshold is not None else default_pic
+        self.key = (method, subtitle_band)
+
+    def features(self, frame):
+        """(字幕带特征, 画面区特征)，按检测器配置缓存在 frame.features 上"""
+        cached = frame.features.get(self.key)
+        if cached is not None:
+            return cached
+        img = frame.image
+        w, h = img.size
+        work_h = max(8, round(h * WORK_WIDTH / w))
+        gray = img.resize((WORK_WIDTH, work_h), Image.Resampling.BILINEAR, reducing_gap=2.0).convert("L")
+        band_top = min(work_h - 1, int(work_h * (1 - self.subtitle_band)))
+        subtitle = gray.crop((0, band_top, WORK_WIDTH, work_h))
+        picture = gray.crop((0, 0, WORK_WIDTH, max(1, band_top)))
+        cached = (_features(subtitle, self.method, SUBTITLE_GRID, SUBTITLE_MEAN_SIZE),
+                  _features(picture, self.method, PICTURE_GRID, PICTURE_MEAN_SIZE))
+        frame.features[self.key] = cached
+        return cached
+
+    def compare(self, prev, frame):
+        if prev is None:
+            return ChangeScore(100.0, 100.0, True, float("inf"))
+        try:
+            prev_sub, prev_pic = self.features(prev)
+            sub, pic = self.features(frame)
+            subtitle = _distance(prev_sub, sub, self.method)
+            picture = _distance(prev_pic, pic, self.method)
+        except Exception as e:
+            print(f"Diff calc error: {e}")
+            return ChangeScore(100.0, 100.0, True, float("inf"))
+        level = max(subtitle / max(self.subtitle_threshold, 1e-6), picture / max(self.picture_threshold, 1e-6))
+        return ChangeScore(subtitle, picture, level >= 1.0, level)
+
+
+# --- 字幕条预过滤 (OCR 之前) ---
+STROKE_WIDTH = 640  # 字幕条先缩放到该宽度再检测笔画
+STROKE_BRIGHTNESS = 180  # 字幕文字 (白 / 黄) 的最低亮度
+STROKE_EDGE = 50  # 笔画边缘的最小亮度跳变
+SIGNATURE_BLOCK = 8  # 笔画掩码按 8x8 块求平均作为字幕条签名
+
+
+def stroke_mask(strip):
+    """亮色且紧邻强边缘的像素：字幕笔画 (描边文字)；模糊或运动的背景很少同时满足两者"""
+    w, h = strip.size
+    gray = strip.convert("L").resize((STROKE_WIDTH, max(SIGNATURE_BLOCK, round(h * STROKE_WIDTH / w))),
+                                     Image.Resampling.BILINEAR)
+    g = np.asarray(gray, dtype=np.int16)
+    gx = np.abs(np.diff(g, axis=1)) > STROKE_EDGE
+    gy = np.abs(np.diff(g, axis=0)) > STROKE_EDGE
+    edges = np.zeros(g.shape, dtype=bool)
+    edges[:, 1:] |= gx
+    edges[:, :-1] |= gx
+    edges[1:, :] |= gy
+    edges[:-1, :] |= gy
+    return edges & (g >= STROKE_BRIGHTNESS)
+
+
+class SubtitleStripFilter:
+    """
+    OCR 前的本地预过滤，在采集线程中按时间顺序调用 accept(strip)：
+    - 笔画密度低于 min_density：字幕带没有文字，丢弃
+    - 笔画签名与上一条送检字幕条的差异低于 repeat_threshold：同一句字幕仍在屏幕上，丢弃
+    只有出现新文字的字幕条才会被拼接送去 OCR。未安装 NumPy 时全部放行。
+    """
+
+    def __init__(self, min_density=0.004, repeat_threshold=0.3):
+        self.min_density = min_density
+        self.repeat_threshold = repeat_threshold
+        self.last_signature = None
+        self.total = 0
+        self.empty = 0
+        self.repeated = 0
+
+    def accept(self, strip):
+        self.total += 1
+        if np is None:
+            return True
+        mask = stroke_mask(strip)
+        if mask.mean() < self.min_density:
+            self.empty += 1
+            return False
+        h, w = mask.shape
+        h, w = h // SIGNATURE_BLOCK * SIGNATURE_BLOCK, w // SIGNATURE_BLOCK * SIGNATURE_BLOCK
+        signature = mask[:h, :w].reshape(h // SIGNATURE_BLOCK, SIGNATURE_BLOCK,
+                                         w // SIGNATURE_BLOCK, SIGNATURE_BLOCK).mean(axis=(1, 3))
+        prev = self.last_signature
+        if prev is not None and prev.shape == signature.shape:
+            # 归一化的笔画差异：0 为完全相同，约 1 为完全不同的文字
+            diff = np.abs(prev - signature).sum() / max(prev.sum(), signature.sum(), 1e-6)
+            if diff < self.repeat_threshold:
+                self.repeated += 1
+                return False
+        self.last_signature = signature
+        return True
+
+    def stats(self):
+        return {"strips": self.total, "empty": self.empty, "repeated": self.repeated,
+                "sent": self.total - self.empty - self.repeated}
@@ -0,0 +1,101 @@
+"""
+按逻辑顺序写入的会话日志。
+
+阶段回顾在后台生成：开始生成时，后续批次的记录已经陆续写入，
+直接追加会让回顾出现在错误的位置，流式 token 也会与批次记录交错。
+LogJournal 让回顾先按位置占位 (reserve)，文件只写到第一个未完成的占位为止，
+其后的内容暂存在内存中；占位生成完毕 (finish) 后再依次落盘。
+位于最前面的占位收到的文本会立即写入，流式输出仍能实时看到。
+"""
+import bisect
+import threading
+
+
+class _Segment:
+    __slots__ = ("key", "parts", "written", "done")
+
+    def __init__(self, key, parts, done):
+        self.key = key
+        self.parts = parts
+        self.written = 0  # 已落盘的片段数
+        self.done = done
+
+
+class LogJournal:
+    """
+    key 决定内容在文件中的顺序 (数字越小越靠前)，None 表示排在当前所有内容之后。
+    v1Pro 用批次序号作为批次记录的 key，覆盖前 n 个批次的阶段回顾占位 key 为 n - 0.5。
+    所有方法线程安全。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "a", encoding="utf-8") if path else None
+        self.segments = []  # 尚未完全落盘的内容，按 key 排序
+        self.keys = []
+        self.last_key = -1.0
+        self.lock = threading.Lock()
+
+    def _insert(self, key, parts, done):
+        if key is None:
+            key = self.last_key + 1
+        self.last_key = max(self.last_key, key)
+        segment = _Segment(key, parts, done)
+        i = bisect.bisect_right(self.keys, key)
+        self.keys.insert(i, key)
+        self.segments.insert(i, segment)
+        self._flush()
+        return segment
+
+    def _flush(self):
+        """从头写出内容，直到遇到未完成的占位"""
+        while self.segments:
+            head = self.segments[0]
+            if self.file and head.written < len(head.parts):
+                self.file.write("".join(head.parts[head.written:]))
+                self.file.flush()
+            head.written = len(head.parts)
+            if not head.done:
+                return
+            self.segments.pop(0)
+            self.keys.pop(0)
+
+    def append(self, text, key=None):
+        """写入一段完整内容"""
+        with self.lock:
+            self._insert(key, [text], True)
+
+    def reserve(self, key=None):
+        """为稍后生成的内容占位，返回占位句柄"""
+        with self.lock:
+            return self._insert(key, [], False)
+
+    def write(self, slot, text):
+        """向占位追加文本；占位位于最前面时立即落盘"""
+        with self.lock:
+            slot.parts.append(text)
+            if self.segments and self.segments[0] is slot:
+                self._flush()
+
+    def finish(self, slot, text=""):
+        """占位内容生成完毕 (可附带结尾文本)，其后暂存的内容随之落盘"""
+        with self.lock:
+            if text:
+                slot.parts.append(text)
+            slot.done = True
+            self._flush()
+
+    def pending(self):
+        """尚未完成的占位数"""
+        with self.lock:
+            return sum(1 for s in self.segments if not s.done)
+
+    def close(self):
+        """结束会话：未完成的占位按现有内容写出"""
+        with self.lock:
+            for segment in self.segments:
+                segment.done = True
+            self._flush()
+            if self.file:
+                self.file.close()
+                self.file = None
@@ -0,0 +1,334 @@
+"""
+OpenAI 兼容接口 (LM Studio / llama.cpp) 的共享 HTTP 客户端。
+
+每个端点一个 requests.Session 与独立连接池，保持长连接 (keep-alive)，
+避免每次 OCR / VLM / 总结请求都重新建立 TCP 连接；
+每个端点有并发请求上限，并统计连接复用率与延迟。
+支持 stream: true (SSE)，token 到达即回调，并记录首字延迟 (TTFT) 与生成速度。
+可附加后端专用参数 (如 llama.cpp 的 cache_prompt)；端点以 HTTP 400 / 422 拒绝并在错误信息中提到这些参数时，
+自动去掉后重发。
+回复中带有 usage.prompt_tokens_details.cached_tokens (OpenAI 格式) 或 timings (llama.cpp) 时，
+统计提示词前缀缓存命中的 token 数与预填充耗时。
+"""
+import json
+import threading
+import time
+from collections import deque
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+def percentile(values, q):
+    """简单百分位数 (q: 0-100)，values 为空时返回 0"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = min(len(ordered) - 1, max(0, int(round(q / 100.0 * (len(ordered) - 1)))))
+    return ordered[k]
+
+
+class EndpointStats:
+    """单个端点的请求计数与延迟窗口"""
+
+    def __init__(self, window=200):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.failures = 0
+        self.in_flight = 0
+        self.latencies = deque(maxlen=window)
+        self.ttfts = deque(maxlen=window)
+        self.token_rates = deque(maxlen=window)
+        self.prefills = deque(maxlen=window)
+        self.prompt_tokens = 0  # 后端报告了缓存命中数的请求的提示词 token 总数
+        self.cached_tokens = 0
+
+    def record(self, latency, ok, ttft=None, tokens_per_sec=None, prompt_tokens=None, cached_tokens=None,
+               prefill_ms=None):
+        with self.lock:
+            self.requests += 1
+            if ok:
+                self.latencies.append(latency)
+                if ttft is not None:
+                    self.ttfts.append(ttft)
+                if tokens_per_sec:
+                    self.token_rates.append(tokens_per_sec)
+                if prompt_tokens and cached_tokens is not None:
+                    self.prompt_tokens += prompt_tokens
+                    self.cached_tokens += cached_tokens
+                if prefill_ms is not None:
+                    self.prefills.append(prefill_ms / 1000.0)
+            else:
+                self.failures += 1
+
+    def snapshot(self):
+        with self.lock:
+            latencies = list(self.latencies)
+            ttfts = list(self.ttfts)
+            rates = list(self.token_rates)
+            prefills = list(self.prefills)
+            return {
+                "requests": self.requests,
+                "failures": self.failures,
+                "in_flight": self.in_flight,
+                "latency_avg": sum(latencies) / len(latencies) if latencies else 0.0,
+                "latency_p50": percentile(latencies, 50),
+                "latency_p95": percentile(latencies, 95),
+                "ttft_p50": percentile(ttfts, 50),
+                "ttft_p95": percentile(ttfts, 95),
+                "tokens_per_sec": sum(rates) / len(rates) if rates else 0.0,
+                "prefill_avg": sum(prefills) / len(prefills) if prefills else 0.0,
+                "prompt_tokens": self.prompt_tokens,
+                "cache_hit_rate": self.cached_tokens / self.prompt_tokens if self.prompt_tokens else None,
+            }
+
+
+class _Endpoint:
+    """一个端点：Session + 连接池 + 并发上限 + 统计"""
+
+    def __init__(self, url, max_concurrency):
+        self.url = url
+        self.session = requests.Session()
+        self.adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency, max_retries=0)
+        self.session.mount("http://", self.adapter)
+        self.session.mount("https://", self.adapter)
+        self.slots = threading.BoundedSemaphore(max_concurrency)
+        self.stats = EndpointStats()
+        self.extra_ok = True  # 端点是否接受附加参数
+
+    def connection_counts(self):
+        """(新建连接数, 请求数)，来自 urllib3 连接池计数"""
+        connections = requests_made = 0
+        pools = self.adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            try:
+                pool = pools[key]
+            except KeyError:
+                continue
+            connections += pool.num_connections
+            requests_made += pool.num_requests
+        return connections, requests_made
+
+
+class LLMClient:
+    """
+    共享的 chat/completions 客户端。
+    - 按端点 URL 复用连接池与长连接
+    - connect_timeout / read_timeout 分开配置
+    - 每个端点最多 max_concurrency 个并发请求，超出的调用方排队等待
+    - extra_params 合并进每个请求体 (如 {"cache_prompt": True})，被端点拒绝后对该端点不再发送
+    失败时与原先的 call_llm 一样打印错误并返回 None。
+    """
+
+    def __init__(self, connect_timeout=5.0, read_timeout=90.0, max_concurrency=2, extra_params=None):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_concurrency = max(1, max_concurrency)
+        self.extra_params = dict(extra_params or {})
+        self.endpoints = {}
+        self.lock = threading.Lock()
+
+    def _endpoint(self, url):
+        with self.lock:
+            endpoint = self.endpoints.get(url)
+            if endpoint is None:
+                endpoint = _Endpoint(url, self.max_concurrency)
+                self.endpoints[url] = endpoint
+            return endpoint
+
+    def chat(self, url, model, messages, max_tokens=200, temperature=0.7, read_timeout=None,
+             on_token=None, metrics=None):
+        """
+        发送一次 chat/completions 请求，返回完整回复文本，失败返回 None。
+        传入 on_token 时使用流式 (SSE) 请求，每收到一段文本就调用 on_token(text)；
+        传入 metrics 字典时写入本次请求的 latency / ttft / tokens / tokens_per_sec，
+        后端报告时还有 prompt_tokens / cached_tokens / prefill_ms。
+        """
+        endpoint = self._endpoint(url)
+        payload = {
+            "model": model, "messages": messages,
+            "temperature": temperature, "max_tokens": max_tokens
+        }
+        if on_token is not None:
+            payload["stream"] = True
+            payload["stream_options"] = {"include_usage": True}
+        extra = self.extra_params if endpoint.extra_ok else {}
+        payload.update(extra)
+        timeout = (self.connect_timeout, read_timeout or self.read_timeout)
+        result = {}
+
+        with endpoint.slots:
+            with endpoint.stats.lock:
+                endpoint.stats.in_flight += 1
+            start = time.time()
+            content = None
+            try:
+                content = self._send(endpoint, url, payload, timeout, on_token, start, result)
+                rejected = result.get("status") in (400, 422) and any(k in result.get("error", "") for k in extra)
+                if content is None and rejected:
+                    # 后端不认识附加参数：去掉后重发，之后对该端点不再附加
+                    endpoint.extra_ok = False
+                    print(f"Endpoint {short_endpoint(url)} rejected {sorted(extra)}, retrying without them")
+                    for key in extra:
+                        payload.pop(key, None)
+                    content = self._send(endpoint, url, payload, timeout, on_token, start, result)
+            except Exception as e:
+                print(f"API Error: {e}")
+            finally:
+                with endpoint.stats.lock:
+                    endpoint.stats.in_flight -= 1
+                result["latency"] = time.time() - start
+                result.pop("status", None)
+                result.pop("error", None)
+                endpoint.stats.record(result["latency"], content is not None,
+                                      result.get("ttft"), result.get("tokens_per_sec"), result.get("prompt_tokens"),
+                                      result.get("cached_tokens"), result.get("prefill_ms"))
+                if metrics is not None:
+                    metrics.update(result)
+        return content
+
+    def has_capacity(self, url):
+        """该端点当前是否还有空闲的并发名额 (发送时不必排队)"""
+        endpoint = self._endpoint(url)
+        with endpoint.stats.lock:
+            return endpoint.stats.in_flight < self.max_concurrency
+
+    def _send(self, endpoint, url, payload, timeout, on_token, start, result):
+        if on_token is not None:
+            return self._stream(endpoint, url, payload, timeout, on_token, start, result)
+        resp = endpoint.session.post(url, json=payload, timeout=timeout)
+        result["status"] = resp.status_code
+        if resp.status_code != 200:
+            result["error"] = resp.text[:200]
+            print(f"API Error: HTTP {resp.status_code} from {url}: {result['error']}")
+            return None
+        data = resp.json()
+        read_prompt_usage(data, result)
+        return data['choices'][0]['message']['content']
+
+    def _stream(self, endpoint, url, payload, timeout, on_token, start, result):
+        """读取 SSE 流：data: {...} 行直到 data: [DONE]"""
+        resp = endpoint.session.post(url, json=payload, timeout=timeout, stream=True)
+        try:
+            result["status"] = resp.status_code
+            if resp.status_code != 200:
+                result["error"] = resp.text[:200]
+                print(f"API Error: HTTP {resp.status_code} from {url}: {result['error']}")
+                return None
+            parts = []
+            chunks = 0
+            usage_tokens = None
+            first_token_at = None
+            # chunk_size=None: 数据到达即处理，不等缓冲区填满
+            for line in resp.iter_lines(chunk_size=None):
+                if not line.startswith(b"data:"):
+                    continue
+                data = line[5:].strip()
+                if data == b"[DONE]":
+                    break
+                event = json.loads(data.decode("utf-8"))
+                if event.get("usage"):
+                    usage_tokens = event["usage"].get("completion_tokens")
+                read_prompt_usage(event, result)
+                for choice in event.get("choices") or []:
+                    text = (choice.get("delta") or {}).get("content")
+                    if not text:
+                        continue
+                    if first_token_at is None:
+                        first_token_at = time.time()
+                        result["ttft"] = first_token_at - start
+                    chunks += 1
+                    parts.append(text)
+                    on_token(text)
+            if first_token_at is None:
+                return None
+
+            # 多数后端每个 SSE 分片对应一个 token；若返回了 usage 则以其为准
+            tokens = usage_tokens or chunks
+            generation_time = time.time() - first_token_at
+            result["tokens"] = tokens
+            result["tokens_per_sec"] = tokens / generation_time if generation_time > 0 else 0.0
+            return "".join(parts)
+        finally:
+            resp.close()
+
+    def probe(self, url, timeout=3.0):
+        """健康检查：GET 同一服务的 /v1/models，返回端点是否可用"""
+        endpoint = self._endpoint(url)
+        models_url = url.rsplit("/chat/completions", 1)[0] + "/models"
+        try:
+            resp = endpoint.session.get(models_url, timeout=(self.connect_timeout, timeout))
+            resp.close()
+            return resp.status_code == 200
+        except requests.RequestException:
+            return False
+
+    def stats(self):
+        """{端点: {requests, failures, in_flight, latency_*, connections, reuse_rate}}"""
+        with self.lock:
+            endpoints = dict(self.endpoints)
+        result = {}
+        for url, endpoint in endpoints.items():
+            snapshot = endpoint.stats.snapshot()
+            connections, pooled_requests = endpoint.connection_counts()
+            snapshot["connections"] = connections
+            snapshot["reuse_rate"] = 1.0 - connections / pooled_requests if pooled_requests else 0.0
+            result[url] = snapshot
+        return result
+
+    def close(self):
+        with self.lock:
+            for endpoint in self.endpoints.values():
+                endpoint.session.close()
+            self.endpoints = {}
+
+
+def read_prompt_usage(data, result):
+    """
+    从回复 (或流式的最后一个分片) 中读取提示词 token 数、前缀缓存命中数与预填充耗时，写入 result。
+    OpenAI 格式: usage.prompt_tokens_details.cached_tokens；llama.cpp: timings.cache_n / prompt_n / prompt_ms
+    """
+    usage = data.get("usage") or {}
+    timings = data.get("timings") or {}
+    if usage.get("prompt_tokens"):
+        result["prompt_tokens"] = usage["prompt_tokens"]
+    cached = (usage.get("prompt_tokens_details") or {}).get("cached_tokens")
+    if cached is None:
+        cached = timings.get("cache_n")
+    if cached is not None:
+        result["cached_tokens"] = cached
+        if "prompt_tokens" not in result and "prompt_n" in timings:
+            result["prompt_tokens"] = timings["prompt_n"] + cached
+    if "prompt_ms" in timings:
+        result["prefill_ms"] = timings["prompt_ms"]
+
+
+def short_endpoint(url):
+    """用于显示的端点简称 host:port"""
+    parts = urlsplit(url)
+    return parts.netloc or url
+
+
+def format_client_stats(stats):
+    """把 LLMClient.stats() 格式化为多行状态文本"""
+    lines = []
+    for url, s in stats.items():
+        line = (f"{short_endpoint(url)}: {s['requests']}次 失败{s['failures']} | "
+                f"复用 {s['reuse_rate'] * 100:.0f}% | p50 {s['latency_p50']:.1f}s p95 {s['latency_p95']:.1f}s")
+        if s["tokens_per_sec"]:
+            line += f" | 首字 {s['ttft_p50']:.1f}s {s['tokens_per_sec']:.0f}tok/s"
+        if s["cache_hit_rate"] is not None:
+            line += f" | 前缀缓存 {s['cache_hit_rate'] * 100:.0f}%"
+        if s["prefill_avg"]:
+            line += f" 预填充 {s['prefill_avg']:.2f}s"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def format_stream_metrics(metrics):
+    """单次流式请求的指标文本"""
+    if not metrics.get("tokens"):
+        return ""
+    return (f"首字 {metrics.get('ttft', 0):.1f}s | {metrics['tokens']} tokens | "
+            f"{metrics.get('tokens_per_sec', 0):.1f} tok/s | 总耗时 {metrics.get('latency', 0):.1f}s")
@@ -0,0 +1,206 @@
+"""
+批处理流水线组件。
+
+BatchWorkerPool: 固定数量的工作线程 + 有界任务队列，
+队列满时按溢出策略处理，避免分析线程和整帧图像无限堆积。
+OrderedSequencer: 按批次序号重排乱序完成的结果，并提供流水线式的历史依赖。
+"""
+import threading
+import time
+from collections import deque
+
+OVERFLOW_POLICIES = ("block", "drop_oldest", "merge")
+
+
+class _QueuedJob:
+    __slots__ = ("job", "enqueued_at")
+
+    def __init__(self, job, enqueued_at):
+        self.job = job
+        self.enqueued_at = enqueued_at
+
+
+class BatchWorkerPool:
+    """
+    有界批处理工作池。
+    overflow 策略 (队列已满时提交新批次)：
+    - "block": 阻塞提交方 (采集线程)，直到有空位，形成背压
+    - "drop_oldest": 丢弃队列中最旧的批次，调用 on_drop(job)
+    - "merge": 用 merge_fn(队尾批次, 新批次) 合并为一个批次
+    """
+
+    def __init__(self, handler, workers=2, max_queue=2, overflow="block", merge_fn=None, on_drop=None,
+                 name="batch"):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"未知的溢出策略: {overflow}，可选 {OVERFLOW_POLICIES}")
+        if overflow == "merge" and merge_fn is None:
+            raise ValueError("merge 策略需要提供 merge_fn")
+        self.handler = handler
+        self.max_queue = max(1, max_queue)
+        self.overflow = overflow
+        self.merge_fn = merge_fn
+        self.on_drop = on_drop
+
+        self.queue = deque()
+        self.cond = threading.Condition()
+        self.closed = False
+        self.busy = 0
+
+        # 统计
+        self.submitted = 0
+        self.completed = 0
+        self.dropped = 0
+        self.merged = 0
+        self.total_queue_wait = 0.0
+        self.last_queue_wait = 0.0
+        self.total_block_wait = 0.0
+        self.last_block_wait = 0.0
+        self.service_times = deque(maxlen=20)  # 最近批次的处理耗时
+
+        self.threads = []
+        for i in range(max(1, workers)):
+            t = threading.Thread(target=self._worker, name=f"{name}-worker-{i}", daemon=True)
+            t.start()
+            self.threads.append(t)
+
+    def submit(self, job):
+        """提交批次；返回 False 表示池已关闭"""
+        dropped = None
+        with self.cond:
+            if self.closed:
+                return False
+            self.submitted += 1
+            if len(self.queue) >= self.max_queue:
+                if self.overflow == "block":
+                    block_start = time.time()
+                    while len(self.queue) >= self.max_queue and not self.closed:
+                        self.cond.wait()
+                    self.last_block_wait = time.time() - block_start
+                    self.total_block_wait += self.last_block_wait
+                    if self.closed:
+                        # 等待期间池被关闭：批次不会再被处理，由调用方处理
+                        self.submitted -= 1
+                        return False
+                elif self.overflow == "drop_oldest":
+                    dropped = self.queue.popleft().job
+                    self.dropped += 1
+                else:
+                    tail = self.queue[-1]
+                    tail.job = self.merge_fn(tail.job, job)
+                    self.merged += 1
+                    return True
+            self.queue.append(_QueuedJob(job, time.time()))
+            self.cond.notify_all()
+
+        if dropped is not None and self.on_drop:
+            self.on_drop(dropped)
+        return True
+
+    def _worker(self):
+        while True:
+            with self.cond:
+                while not self.queue and not self.closed:
+                    self.cond.wait()
+                if not self.queue:
+                    return  # 已关闭且队列已清空
+                item = self.queue.popleft()
+                self.busy += 1
+                self.last_queue_wait = time.time() - item.enqueued_at
+                self.total_queue_wait += self.last_queue_wait
+                self.cond.notify_all()  # 唤醒被阻塞的提交方
+
+            start = time.time()
+            try:
+                self.handler(item.job)
+            except Exception as e:
+                print(f"Worker error: {e}")
+            finally:
+                with self.cond:
+                    self.busy -= 1
+                    self.completed += 1
+                    self.service_times.append(time.time() - start)
+                    self.cond.notify_all()
+
+    def close(self, wait=True):
+        """停止接收新批次；wait=True 时等待队列中的批次全部处理完"""
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+        if wait:
+            for t in self.threads:
+                t.join()
+
+    def stats(self):
+        with self.cond:
+            started = self.completed + self.busy
+            return {
+                "depth": len(self.queue),
+                "max_queue": self.max_queue,
+                "busy": self.busy,
+                "workers": len(self.threads),
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "dropped": self.dropped,
+                "merged": self.merged,
+                "avg_queue_wait": self.total_queue_wait / started if started else 0.0,
+                "last_queue_wait": self.last_queue_wait,
+                "total_block_wait": self.total_block_wait,
+                "last_block_wait": self.last_block_wait,
+                "avg_service_time": sum(self.service_times) / len(self.service_times) if self.service_times else 0.0,
+            }
+
+
+class OrderedSequencer:
+    """
+    按批次序号严格顺序释放结果。
+    工作线程乱序 put(index, result)，on_release(index, result) 只按 0, 1, 2... 顺序调用；
+    被丢弃、合并或失败的批次用 skip(index) 占位，后续批次不会被卡住。
+
+    wait_history(index, n) 阻塞到 index 之前的批次全部释放，再返回最近 n 条结果。
+    依赖历史的步骤 (VLM 提示词) 因此与串行处理看到完全相同的上下文，
+    而不依赖历史的步骤 (截图预处理、OCR) 仍可并行。
+    """
+
+    def __init__(self, on_release, history_size=10, start=0):
+        self.on_release = on_release
+        self.next_index = start
+        self.pending = {}
+        self.history = deque(maxlen=history_size)
+        self.cond = threading.Condition()
+
+    def put(self, index, result):
+        """提交 index 的结果；result 为 None 等价于 skip(index)"""
+        with self.cond:
+            if index < self.next_index or index in self.pending:
+                return  # 重复提交 (例如失败后又被 skip)
+            self.pending[index] = result
+            # 回调在锁内按顺序执行，保证多线程同时 put 时释放顺序不乱
+            while self.next_index in self.pending:
+                ready = self.pending.pop(self.next_index)
+                if ready is not None:
+                    self.history.append(ready)
+                    try:
+                        self.on_release(self.next_index, ready)
+                    except Exception as e:
+                        print(f"Release error: {e}")
+                self.next_index += 1
+            self.cond.notify_all()
+
+    def skip(self, index):
+        self.put(index, None)
+
+    def wait_history(self, index, n):
+        """等待 index 之前的批次全部释放，返回最近 n 条已释放结果"""
+        with self.cond:
+            while self.next_index < index:
+                self.cond.wait()
+            return list(self.history)[-n:] if n > 0 else []
+
+    def wait_released(self, count, timeout=None):
+        """等待前 count 个批次全部释放；超时返回 False"""
+        with self.cond:
+            return self.cond.wait_for(lambda: self.next_index >= count, timeout)
+
+    def pending_count(self):
+        with self.cond:
+            return len(self.pending)
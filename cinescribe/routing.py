@@ -0,0 +1,107 @@
+"""
+级联模型路由 (小模型 / 大模型)。
+
+v1Pro 的批次剧情分析原来一律发给大模型 (30B)，而静态对话镜头、字幕滚动、片尾字幕等
+画面简单的批次用小模型 (4B) 就足够。CascadeRouter 在调用前用廉价信号为批次打分：
+- 运动度：批次内各帧画面区差异度相对镜头切换阈值的均值
+- 镜头切换：批次内是否有帧 (含与上一批次末帧相比) 超过画面区阈值
+- 字幕密度：出现新文字的字幕条占帧数的比例 (对白多时需要分辨说话人)
+难度低于阈值的批次交给小模型；小模型的回答未通过质量检查时可升级到大模型重做。
+统计各层占比、升级次数，并按大模型的平均延迟估算节省的时间。
+"""
+import re
+import threading
+
+TIERS = ("small", "large")
+DEFAULT_WEIGHTS = {"motion": 0.5, "shot": 0.3, "subtitles": 0.2}
+# 小模型回答中出现这些词通常表示没看懂画面
+REFUSAL_MARKERS = ("看不清", "无法识别", "无法判断", "无法确定", "抱歉", "图片模糊")
+
+_CJK = re.compile(r"[\u4e00-\u9fff]")
+
+
+class CascadeRouter:
+    """
+    threshold: 难度 (0-1) 低于此值走小模型；weights: 各信号的权重。
+    min_answer_chars: 质量检查要求的最少中文字数。enabled=False 时全部走大模型，只统计。
+    所有方法线程安全。
+    """
+
+    def __init__(self, threshold=0.35, weights=None, min_answer_chars=30, enabled=True):
+        self.threshold = threshold
+        self.weights = dict(DEFAULT_WEIGHTS, **(weights or {}))
+        self.min_answer_chars = min_answer_chars
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.routed = {tier: 0 for tier in TIERS}
+        self.escalated = 0
+        self.latency = {tier: [0.0, 0] for tier in TIERS}  # [总耗时, 次数]，不含缓存命中
+        self.small_time = 0.0  # 小模型请求的总耗时 (含之后被升级的)
+        self.small_kept = 0  # 小模型回答被采用的批次数
+
+    def difficulty(self, motion, strips, frames):
+        """
+        motion: 批次内各帧画面区差异度 / 画面区阈值 (>= 1 为镜头切换)；
+        strips: 出现新文字的字幕条数；frames: 帧数。返回 0-1 的难度。
+        """
+        motion = list(motion)
+        level = sum(min(1.0, m) for m in motion) / len(motion) if motion else 1.0
+        shot = 1.0 if not motion or max(motion) >= 1.0 else 0.0
+        density = min(1.0, strips / frames) if frames else 0.0
+        w = self.weights
+        return (w["motion"] * level + w["shot"] * shot + w["subtitles"] * density) / sum(w.values())
+
+    def route(self, motion, strips, frames):
+        """返回 (层级, 难度)"""
+        score = self.difficulty(motion, strips, frames)
+        tier = "small" if self.enabled and score < self.threshold else "large"
+        with self.lock:
+            self.routed[tier] += 1
+        return tier, score
+
+    def check(self, answer):
+        """小模型回答的质量检查：足够长、含中文且没有表示看不懂的措辞"""
+        if not answer:
+            return False
+        if len(_CJK.findall(answer)) < self.min_answer_chars:
+            return False
+        return not any(marker in answer for marker in REFUSAL_MARKERS)
+
+    def record(self, tier, latency, kept=True):
+        """记录一次请求耗时 (None 表示命中缓存)；kept=False 表示小模型回答未通过检查，已升级"""
+        with self.lock:
+            if tier == "small" and not kept:
+                self.escalated += 1
+            if latency is None:
+                return
+            total = self.latency[tier]
+            total[0] += latency
+            total[1] += 1
+            if tier == "small":
+                self.small_time += latency
+                self.small_kept += int(kept)
+
+    def stats(self):
+        """
+        {small, large, escalated, share, small_latency, large_latency, saved}
+        saved: 小模型处理的批次若交给大模型预计多花的时间，减去小模型 (含被升级的) 的实际耗时；
+        大模型还没有延迟样本时为 None。
+        """
+        with self.lock:
+            routed = dict(self.routed)
+            avg = {tier: (t / n if n else 0.0) for tier, (t, n) in self.latency.items()}
+            total = sum(routed.values())
+            saved = None
+            if self.latency["large"][1]:
+                saved = self.small_kept * avg["large"] - self.small_time
+            return {"small": routed["small"], "large": routed["large"], "escalated": self.escalated,
+                    "share": routed["small"] / total if total else 0.0,
+                    "small_latency": avg["small"], "large_latency": avg["large"], "saved": saved}
+
+
+def format_route_stats(stats):
+    text = (f"模型路由: 小模型 {stats['small']} ({stats['share'] * 100:.0f}%) | 大模型 {stats['large']} | "
+            f"升级 {stats['escalated']} | 延迟 {stats['small_latency']:.1f}s / {stats['large_latency']:.1f}s")
+    if stats["saved"] is not None:
+        text += f" | 节省 ~{round(stats['saved'])}s"
+    return text
@@ -0,0 +1,136 @@
+"""
+自适应采样调度。
+
+固定间隔采样在字幕/镜头快速变化时漏帧，在静止片段和后端积压时又白白耗费调用。
+CaptureScheduler 每次读帧后给出下一次的间隔：
+- 画面变化 (运动度的指数滑动平均) 越多，间隔越接近 min_interval；静止时退避到 max_interval
+- 批处理队列积压时按队列占用比例放慢
+- 后端处理一帧所需的时间 (service_time) 是间隔下限
+- 设定了调用预算时，按剩余预算与剩余片长平均分配
+每次决策可写入 CSV (时间, 间隔, 约束原因, 帧/分钟 ...)，便于在成本与覆盖率之间调参。
+帧/分钟只统计真正入库 (送去分析) 的采样，被门控跳过或读取失败的帧不计入。
+"""
+import csv
+import time
+from collections import deque
+
+MOTION_ALPHA = 0.35  # 运动度滑动平均系数
+SAMPLED_ALPHA = 0.1  # 入库比例滑动平均系数
+FPM_WINDOW = 60.0  # 统计入库帧率的时间窗口 (秒)
+
+
+class CaptureScheduler:
+    """
+    t 为调度时钟：离线模式用影片时间，实时模式用会话已运行时间。
+    calls_per_sample: 每个入库采样大约消耗的模型调用数 (v1 为 1，v1Pro 为 2 / BATCH_SIZE)
+    call_budget: 本次会话最多调用模型的次数 (None 不限)；duration 已知时按剩余片长平均分配，
+    未知 (实时模式) 时用完预算后退到 max_interval。
+    enabled=False 时始终返回 base_interval，只记录日志。
+    """
+
+    def __init__(self, base_interval, min_interval, max_interval, calls_per_sample=1.0, call_budget=None,
+                 duration=None, enabled=True, log_path=None):
+        self.base_interval = base_interval
+        self.min_interval = min(min_interval, base_interval)
+        self.max_interval = max(max_interval, base_interval)
+        self.calls_per_sample = calls_per_sample
+        self.call_budget = call_budget
+        self.duration = duration
+        self.enabled = enabled
+
+        span = self.max_interval - self.min_interval
+        # 初始运动度对应 base_interval
+        self.motion = (self.max_interval - base_interval) / span if span > 0 else 0.0
+        self.interval = base_interval
+        self.reason = "base"
+        self.samples = deque()  # 最近 FPM_WINDOW 秒内入库采样的时刻
+        self.sampled_ratio = 1.0  # 读到的帧中入库的比例 (滑动平均)，用于把调用预算换算成读帧间隔
+        self.decisions = 0
+        self.reason_counts = {}
+
+        self.log_file = None
+        self.log_writer = None
+        if log_path:
+            self.log_file = open(log_path, "w", encoding="utf-8", newline="")
+            self.log_writer = csv.writer(self.log_file)
+            self.log_writer.writerow(["wall_time", "t", "sampled", "changed", "motion", "queue_depth", "service_time",
+                                      "calls_used", "interval", "reason", "frames_per_min"])
+
+    def next_interval(self, t, changed, calls_used=0, queue_depth=0, queue_max=1, service_time=0.0, sampled=True):
+        """
+        记录一次读帧，返回到下一次读帧的间隔 (秒)。changed: 画面是否变化 (None 表示没有读到帧，不更新运动度)；
+        sampled: 这一帧是否入库 (送去分析)，只有入库的帧计入帧率。
+        """
+        if sampled:
+            self.samples.append(t)
+        self.sampled_ratio = (1 - SAMPLED_ALPHA) * self.sampled_ratio + SAMPLED_ALPHA * (1.0 if sampled else 0.0)
+        while self.samples and t - self.samples[0] > FPM_WINDOW:
+            self.samples.popleft()
+        if changed is not None:
+            self.motion = (1 - MOTION_ALPHA) * self.motion + MOTION_ALPHA * (1.0 if changed else 0.0)
+
+        if not self.enabled:
+            interval, reason = self.base_interval, "fixed"
+        else:
+            interval = self.max_interval - (self.max_interval - self.min_interval) * self.motion
+            reason = "motion"
+            if queue_depth > 0:
+                interval *= 1.0 + queue_depth / max(1, queue_max)
+                reason = "queue"
+            if service_time > interval:
+                interval, reason = service_time, "backend"
+            budget_interval = self.budget_interval(t, calls_used)
+            if budget_interval > interval:
+                interval, reason = budget_interval, "budget"
+            if interval < self.min_interval:
+                interval, reason = self.min_interval, "min"
+            elif interval > self.max_interval:
+                interval = self.max_interval
+                if reason != "budget":
+                    reason = "max"
+
+        self.interval = interval
+        self.reason = reason
+        self.decisions += 1
+        self.reason_counts[reason] = self.reason_counts.get(reason, 0) + 1
+        if self.log_writer:
+            self.log_writer.writerow([f"{time.time():.2f}", f"{t:.2f}", int(sampled), "" if changed is None else
+                                      int(changed), f"{self.motion:.2f}",
+                                      queue_depth, f"{service_time:.2f}", calls_used, f"{interval:.2f}", reason,
+                                      f"{self.frames_per_minute():.1f}"])
+            self.log_file.flush()
+        return interval
+
+    def budget_interval(self, t, calls_used):
+        """满足调用预算所需的最小读帧间隔 (只有入库的帧消耗调用)；没有预算时为 0"""
+        if not self.call_budget:
+            return 0.0
+        remaining_calls = self.call_budget - calls_used
+        if remaining_calls <= 0:
+            return self.max_interval
+        if self.duration is None:
+            return 0.0
+        remaining_time = max(0.0, self.duration - t)
+        return remaining_time * self.calls_per_sample * self.sampled_ratio / remaining_calls
+
+    def frames_per_minute(self):
+        if len(self.samples) < 2:
+            return 0.0
+        span = self.samples[-1] - self.samples[0]
+        return (len(self.samples) - 1) * 60.0 / span if span > 0 else 0.0
+
+    def stats(self):
+        return {"interval": self.interval, "reason": self.reason, "motion": self.motion,
+                "frames_per_min": self.frames_per_minute(), "decisions": self.decisions,
+                "reasons": dict(self.reason_counts)}
+
+    def close(self):
+        if self.log_file:
+            self.log_file.close()
+            self.log_file = None
+            self.log_writer = None
+
+
+def format_schedule_stats(stats):
+    return (f"采样: 间隔 {stats['interval']:.1f}s ({stats['reason']}) | "
+            f"{stats['frames_per_min']:.1f} 帧/分钟 | 运动度 {stats['motion']:.2f}")
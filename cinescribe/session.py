@@ -0,0 +1,95 @@
+"""
+有界的会话状态。
+
+单帧 / 批次记录与阶段回顾原来保存在不断增长的列表里，提示词却只读取最近几条
+(v1 的 [-2:] 与 [-10:]，v1Pro 最近 SUMMARY_TRIGGER_BATCHES 个批次)，长时间运行时进程内存持续上涨。
+SpillWindow 在内存中只保留最近 size 条，挤出窗口的旧记录按 JSON Lines 追加到磁盘，
+需要时 (如后台回顾积压到窗口之外) 仍可通过 history() 读回。
+append_capped() 为 Tk 日志控件限制行数：更早的内容只保留在日志文件中。
+"""
+import json
+import threading
+from collections import deque
+
+
+class SpillWindow:
+    """
+    保留最近 size 条记录的内存窗口。path 不为空时，挤出窗口的记录追加写入该文件
+    (每行一条 JSON)，为空时直接丢弃。记录须可序列化为 JSON (元组读回时为列表)。所有方法线程安全。
+    """
+
+    def __init__(self, size, path=None):
+        self.items = deque(maxlen=size)
+        self.path = path
+        self.file = None
+        self.total = 0  # 累计追加的条数 (含已挤出的)
+        self.spilled = 0
+        self.lock = threading.Lock()
+
+    def append(self, item):
+        with self.lock:
+            if len(self.items) == self.items.maxlen:
+                self._spill(self.items[0])
+            self.items.append(item)
+            self.total += 1
+
+    def _spill(self, item):
+        self.spilled += 1
+        if not self.path:
+            return
+        if self.file is None:
+            self.file = open(self.path, "a", encoding="utf-8")
+        self.file.write(json.dumps(item, ensure_ascii=False) + "\n")
+
+    def recent(self, n=None):
+        """窗口内最近 n 条 (默认整个窗口)，旧的在前"""
+        with self.lock:
+            items = list(self.items)
+        if n is None:
+            return items
+        return items[-n:] if n > 0 else []
+
+    def history(self):
+        """全部记录：先从磁盘读回已挤出的部分，再接上窗口内的记录"""
+        with self.lock:
+            items = list(self.items)
+            if not (self.path and self.spilled):
+                return items
+            if self.file:
+                self.file.flush()
+            with open(self.path, encoding="utf-8") as f:
+                spilled = [json.loads(line) for line in f]
+        return spilled + items
+
+    def stats(self):
+        with self.lock:
+            return {"total": self.total, "window": len(self.items), "spilled": self.spilled}
+
+    def close(self):
+        with self.lock:
+            if self.file:
+                self.file.close()
+                self.file = None
+
+
+def format_session_stats(windows):
+    """windows: {名称: SpillWindow.stats()}"""
+    parts = [f"{name} {s['total']} 条 (内存 {s['window']} / 磁盘 {s['spilled']})" for name, s in windows.items()]
+    return "会话记录: " + (" | ".join(parts) if parts else "-")
+
+
+def append_capped(widget, parts, max_lines):
+    """
+    向只读的 Tk Text 控件追加 [(文本, 标签或 None)]，超过 max_lines 行时删除最早的行。
+    只有视图原本停在末尾时才自动滚动，向上翻看时不会被新内容打断。
+    """
+    follow = widget.yview()[1] >= 1.0
+    widget.config(state="normal")
+    for text, tags in parts:
+        widget.insert("end", text, tags or ())
+    lines = int(widget.index("end-1c").split(".")[0])
+    if lines > max_lines:
+        widget.delete("1.0", f"{lines - max_lines + 1}.0")
+    if follow:
+        widget.see("end")
+    widget.config(state="disabled")
@@ -0,0 +1,419 @@
+"""
+帧来源。
+
+所有帧来源提供相同的接口：read() 返回 Frame (读不到返回 None)，advance(秒) 推进时间，
+is_live 区分实时截屏与离线文件，finished 表示来源已耗尽，stats() 返回每帧采集耗时。
+
+- ScreenRegionSource: 实时截取屏幕固定区域 (v1Pro)
+- WindowSource: 实时截取指定标题的窗口 (v1)，窗口位置缓存，只在窗口移动或缩放时重新计算截取区域
+- VideoFileSource: 从本地视频文件按媒体时间解码帧 (离线模式)，
+  处理速度只受后端吞吐限制，不再受播放速度限制。
+- SyntheticSource: 程序生成的测试画面 (镜头切换、运动物体、滚动字幕)，不需要屏幕与视频文件
+
+实时截屏后端 (backend)：
+- "mss": 只抓取目标区域 (Linux 上为 X11 共享内存 / XGetImage，Windows 上为 BitBlt)，比整屏截图快得多
+- "pyautogui": 原实现，作为未安装 mss 时的后备
+- "auto": 已安装 mss 时使用 mss
+mss / pyautogui / pygetwindow 只在真正创建实时来源时才导入。
+"""
+import random
+import threading
+import time
+
+from PIL import Image, ImageDraw, ImageFont
+
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+# 目标时间点距离当前解码位置超过该值(秒)时直接 seek，否则顺序 grab
+SEEK_THRESHOLD = 5.0
+CAPTURE_BACKENDS = ("auto", "mss", "pyautogui")
+
+
+class Frame:
+    """一帧画面及其显示时间戳 (pts，单位秒)；features 缓存变化检测等派生特征"""
+
+    __slots__ = ("image", "pts", "features")
+
+    def __init__(self, image, pts):
+        self.image = image
+        self.pts = pts
+        self.features = {}
+
+
+def format_pts(seconds):
+    """秒数 -> HH:MM:SS"""
+    seconds = int(max(0, seconds or 0))
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+def apply_crop(img, crop):
+    """按 (上, 下, 左, 右) 像素裁切图像边缘，至少保留 10px"""
+    top, bottom, left, right = crop
+    w, h = img.size
+    left = min(left, w - 10)
+    top = min(top, h - 10)
+    right = max(left + 10, w - right)
+    bottom = max(top + 10, h - bottom)
+    if (left, top, right, bottom) == (0, 0, w, h):
+        return img
+    return img.crop((left, top, right, bottom))
+
+
+class CaptureStats:
+    """每帧采集 (截屏 / 解码 / 生成) 耗时"""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.frames = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+
+    def record(self, seconds):
+        self.frames += 1
+        self.total += seconds
+        self.last = seconds
+        self.max = max(self.max, seconds)
+
+    def snapshot(self):
+        return {"backend": self.backend, "frames": self.frames,
+                "avg_ms": self.total / self.frames * 1000 if self.frames else 0.0,
+                "last_ms": self.last * 1000, "max_ms": self.max * 1000}
+
+
+def format_capture_stats(stats):
+    text = (f"采集: {stats['backend']} | 每帧平均 {stats['avg_ms']:.1f}ms / 最大 {stats['max_ms']:.1f}ms | "
+            f"{stats['frames']} 帧")
+    if stats.get("geometry_updates"):
+        text += f" | 窗口位置更新 {stats['geometry_updates']} 次"
+    return text
+
+
+class _MssGrabber:
+    """mss 截屏：只抓取目标区域。mss 实例不能跨线程使用，每个线程各建一个"""
+
+    name = "mss"
+
+    def __init__(self):
+        import mss  # 按需导入
+        self._mss = mss
+        self._local = threading.local()
+
+    def grab(self, region):
+        sct = getattr(self._local, "sct", None)
+        if sct is None:
+            sct = self._local.sct = self._mss.mss()
+        x, y, w, h = region
+        shot = sct.grab({"left": x, "top": y, "width": w, "height": h})
+        return Image.frombytes("RGB", shot.size, shot.bgra, "raw", "BGRX")
+
+
+class _PyAutoGuiGrabber:
+    name = "pyautogui"
+
+    def __init__(self):
+        import pyautogui  # 按需导入，无界面离线模式不需要
+        self._screenshot = pyautogui.screenshot
+
+    def grab(self, region):
+        return self._screenshot(region=region)
+
+
+def create_grabber(backend="auto"):
+    """按名称创建截屏后端；auto 优先 mss，未安装时退回 pyautogui"""
+    if backend not in CAPTURE_BACKENDS:
+        raise ValueError(f"未知的截屏后端: {backend}，可选 {CAPTURE_BACKENDS}")
+    if backend in ("auto", "mss"):
+        try:
+            return _MssGrabber()
+        except ImportError:
+            if backend == "mss":
+                raise RuntimeError("未安装 mss，无法使用 mss 截屏后端")
+            print("mss not installed, falling back to pyautogui for screen capture")
+    return _PyAutoGuiGrabber()
+
+
+class ScreenRegionSource:
+    """实时截取屏幕固定区域 (x, y, w, h)"""
+
+    is_live = True
+
+    def __init__(self, region, backend="auto"):
+        self.grabber = create_grabber(backend)
+        self.region = region
+        self.finished = False
+        self.start_time = time.time()
+        self.capture = CaptureStats(self.grabber.name)
+
+    def read(self):
+        start = time.perf_counter()
+        try:
+            img = self.grabber.grab(self.region)
+        except Exception as e:
+            print(f"Capture error: {e}")
+            return None
+        self.capture.record(time.perf_counter() - start)
+        return Frame(img, time.time() - self.start_time)
+
+    def stats(self):
+        return self.capture.snapshot()
+
+    def advance(self, seconds):
+        pass  # 实时来源由调用方 sleep 等待
+
+    def progress(self):
+        return None
+
+    def close(self):
+        pass
+
+
+class WindowSource:
+    """
+    实时截取指定标题的窗口，并按裁切设置 (上, 下, 左, 右) 去掉边缘。
+    按标题枚举窗口很慢，找到后缓存窗口对象，每帧只读取它的位置 (一次 GetWindowRect)；
+    位置或大小变化时才重新计算截取区域，窗口关闭或截图失败时下一帧重新查找。
+    """
+
+    is_live = True
+
+    def __init__(self, title, crop=(0, 0, 0, 0), backend="auto"):
+        try:
+            import pygetwindow
+        except ImportError:
+            raise RuntimeError("未安装 pygetwindow，无法按窗口截图")
+        self._gw = pygetwindow
+        self.grabber = create_grabber(backend)
+        self.title = title
+        self.crop = crop
+        self.finished = False
+        self.start_time = time.time()
+        self.capture = CaptureStats(self.grabber.name)
+        self.window = None
+        self.rect = None
+        self.region = None
+        self.geometry_updates = 0
+
+    def find_window(self):
+        windows = self._gw.getWindowsWithTitle(self.title)
+        return windows[0] if windows else None
+
+    def _region(self):
+        """当前截取区域；窗口移动或缩放时重新计算，找不到窗口返回 None"""
+        if self.window is None:
+            self.window = self.find_window()
+            if self.window is None:
+                return None
+        try:
+            win = self.window
+            rect = (win.left, win.top, win.width, win.height)
+        except Exception:
+            self.window = None  # 窗口已关闭
+            return None
+        if rect != self.rect:
+            self.rect = rect
+            self.geometry_updates += 1
+            left, top, width, height = rect
+            c_top, c_bottom, c_left, c_right = self.crop
+            real_width = width - c_left - c_right
+            real_height = height - c_top - c_bottom
+
+            if real_width <= 10: real_width = 100
+            if real_height <= 10: real_height = 100
+
+            self.region = (left + c_left, top + c_top, real_width, real_height)
+        return self.region
+
+    def read(self):
+        start = time.perf_counter()
+        try:
+            region = self._region()
+            if region is None:
+                return None
+            img = self.grabber.grab(region)
+        except Exception as e:
+            print(f"Capture error: {e}")
+            self.window = None
+            return None
+        self.capture.record(time.perf_counter() - start)
+        return Frame(img, time.time() - self.start_time)
+
+    def set_crop(self, crop):
+        """运行中修改裁切值，下一帧按新值重新计算截取区域"""
+        self.crop = crop
+        self.rect = None
+
+    def stats(self):
+        return dict(self.capture.snapshot(), geometry_updates=self.geometry_updates)
+
+    def advance(self, seconds):
+        pass
+
+    def progress(self):
+        return None
+
+    def close(self):
+        pass
+
+
+class VideoFileSource:
+    """
+    离线视频文件帧源。
+    调用方每次 read() 取得游标处的帧，处理完后 advance(秒) 推进媒体时间；
+    帧携带的是解码器给出的真实显示时间戳，而不是墙钟时间。
+    """
+
+    is_live = False
+
+    def __init__(self, path, start=0.0, end=None, crop=None):
+        if cv2 is None:
+            raise RuntimeError("未安装 opencv-python，无法读取视频文件")
+        self.path = path
+        self.crop = crop
+        self.cap = cv2.VideoCapture(path)
+        if not self.cap.isOpened():
+            raise RuntimeError(f"无法打开视频文件: {path}")
+
+        fps = self.cap.get(cv2.CAP_PROP_FPS) or 0.0
+        frame_count = self.cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0.0
+        self.fps = fps if fps > 0 else 25.0
+        self.duration = frame_count / fps if fps > 0 and frame_count > 0 else None
+        self.end = end if end is not None else self.duration
+
+        self.cursor = float(start)
+        self.finished = False
+        self._decoded_pts = None  # 解码器最近一次 grab 的 pts
+        self.capture = CaptureStats("opencv")
+
+    def _seek(self, t):
+        self.cap.set(cv2.CAP_PROP_POS_MSEC, t * 1000.0)
+        self._decoded_pts = None
+
+    def read(self):
+        """解码游标处 (或其后第一帧) 的画面，返回 Frame；读到结尾返回 None"""
+        if self.finished:
+            return None
+        if self.end is not None and self.cursor > self.end:
+            self.finished = True
+            return None
+
+        start = time.perf_counter()
+        if (self._decoded_pts is None or self.cursor < self._decoded_pts
+                or self.cursor - self._decoded_pts > SEEK_THRESHOLD):
+            self._seek(self.cursor)
+
+        # grab 只解复用/解码不做颜色转换，跳过中间帧很便宜
+        half_frame = 0.5 / self.fps
+        while True:
+            if not self.cap.grab():
+                self.finished = True
+                return None
+            self._decoded_pts = self.cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+            if self._decoded_pts + half_frame >= self.cursor:
+                break
+
+        ok, bgr = self.cap.retrieve()
+        if not ok:
+            self.finished = True
+            return None
+        img = Image.fromarray(cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB))
+        if self.crop:
+            img = apply_crop(img, self.crop)
+        self.capture.record(time.perf_counter() - start)
+        return Frame(img, self._decoded_pts)
+
+    def set_crop(self, crop):
+        """运行中修改裁切值，从下一帧开始生效"""
+        self.crop = crop
+
+    def advance(self, seconds):
+        """媒体时间向前推进 seconds 秒 (代替实时模式下的 sleep)"""
+        self.cursor += max(0.0, seconds)
+
+    def progress(self):
+        """已处理的比例 (0-1)，时长未知时返回 None"""
+        if not self.end:
+            return None
+        return min(1.0, self.cursor / self.end)
+
+    def close(self):
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+
+    def stats(self):
+        return self.capture.snapshot()
+
+
+class SyntheticSource:
+    """
+    程序生成的测试帧源，行为与离线视频文件相同 (按媒体时间推进)。
+    每 scene_every 秒切换一个镜头 (背景色与物体)，物体按速度 motion (像素/秒) 移动，
+    每 subtitle_every 秒换一句底部字幕；subtitle_every 为 None 时没有字幕。同一 seed 生成的画面相同。
+    """
+
+    is_live = False
+
+    def __init__(self, duration=60.0, size=(1280, 720), scene_every=15.0, subtitle_every=3.0, motion=120.0,
+                 seed=0, start=0.0):
+        self.path = "synthetic"
+        self.duration = duration
+        self.end = duration
+        self.size = size
+        self.scene_every = scene_every
+        self.subtitle_every = subtitle_every
+        self.motion = motion
+        self.seed = seed
+        self.cursor = float(start)
+        self.finished = False
+        self.capture = CaptureStats("synthetic")
+        try:
+            self.font = ImageFont.load_default(size=max(12, size[1] // 20))
+        except TypeError:  # Pillow < 10.1 的默认字体不能缩放
+            self.font = ImageFont.load_default()
+
+    def _scene(self, index):
+        rng = random.Random(self.seed * 100003 + index)
+        background = tuple(rng.randrange(20, 200) for _ in range(3))
+        shapes = [(rng.randrange(self.size[0]), rng.randrange(self.size[1] * 2 // 3), rng.randrange(40, 160),
+                   tuple(rng.randrange(256) for _ in range(3))) for _ in range(rng.randint(2, 5))]
+        return background, shapes
+
+    def read(self):
+        if self.finished or self.cursor > self.duration:
+            self.finished = True
+            return None
+        start = time.perf_counter()
+        t = self.cursor
+        w, h = self.size
+        background, shapes = self._scene(int(t // self.scene_every))
+        img = Image.new("RGB", self.size, background)
+        draw = ImageDraw.Draw(img)
+        for i, (x, y, r, color) in enumerate(shapes):
+            dx = int((t * self.motion * (1 + i * 0.3)) % (w + 2 * r)) - r
+            draw.ellipse((x + dx - r - w, y - r, x + dx + r - w, y + r), fill=color)
+            draw.ellipse((x + dx - r, y - r, x + dx + r, y + r), fill=color)
+        if self.subtitle_every:
+            line = int(t // self.subtitle_every)
+            rng = random.Random(self.seed * 7919 + line)
+            text = " ".join("".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(2, 7)))
+                            for _ in range(rng.randint(3, 7)))
+            draw.text((w // 2, h - h // 10), text, fill=(255, 255, 255), font=self.font, anchor="mm", stroke_width=2,
+                      stroke_fill=(0, 0, 0))
+        self.capture.record(time.perf_counter() - start)
+        return Frame(img, t)
+
+    def advance(self, seconds):
+        self.cursor += max(0.0, seconds)
+
+    def progress(self):
+        return min(1.0, self.cursor / self.duration) if self.duration else None
+
+    def close(self):
+        pass
+
+    def stats(self):
+        return self.capture.snapshot()
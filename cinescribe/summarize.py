@@ -0,0 +1,170 @@
+"""
+分层剧情汇总 (map-reduce)。
+
+原实现把所有阶段回顾拼进每一次阶段回顾提示词，最终解说也一次性拼接全部阶段：
+提示词长度 (预填充耗时) 随片长线性增长，累计 token 呈二次增长，长片最终会超出模型上下文。
+
+StoryTree 把剧情分为三层：阶段回顾 → 幕 → 全片。
+- 每 act_size 个阶段回顾在后台汇总为一幕，各幕互不依赖，并行汇总
+- 阶段回顾 / 单帧分析的历史上下文只取最近的幕与尚未成幕的阶段，并截断到 token 上限
+- 最终解说前，若各幕总长仍超过上限，按上限分组再汇总一层，直到放得下
+每次汇总请求的输入都不超过 max_input_tokens。
+阶段回顾原文只保留到被已完成的幕覆盖为止，内存占用不随片长增长。
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .tokens import clip_text, estimate_tokens
+
+
+def format_items(items):
+    """[(标签, 文本)] -> 每行 "标签: 文本" """
+    return "\n".join(f"{label}: {text}" for label, text in items)
+
+
+def fit(items, max_tokens):
+    """总长超过 max_tokens 时把每条截断到平均份额，保留全部条目"""
+    if not items or estimate_tokens(format_items(items)) <= max_tokens:
+        return list(items)
+    share = max(1, max_tokens // len(items))
+    return [(label, clip_text(text, share - estimate_tokens(label) - 2)) for label, text in items]
+
+
+def pack(items, max_tokens):
+    """把连续的 [(标签, 文本)] 分组，每组总长不超过 max_tokens；单条超长时截断"""
+    groups, group, used = [], [], 0
+    for label, text in items:
+        cost = estimate_tokens(f"{label}: {text}\n")
+        if cost > max_tokens:
+            text = clip_text(text, max_tokens - estimate_tokens(label) - 2)
+            cost = max_tokens
+        if group and used + cost > max_tokens:
+            groups.append(group)
+            group, used = [], 0
+        group.append((label, text))
+        used += cost
+    if group:
+        groups.append(group)
+    return groups
+
+
+class StoryTree:
+    """
+    reduce_fn(items) -> str：把 [(标签, 文本)] 汇总为一段剧情 (失败返回 None)，在汇总线程中调用。
+    act_size: 每幕包含的阶段回顾数；max_input_tokens: 每次汇总请求输入的上限；workers: 并行汇总线程数。
+    """
+
+    def __init__(self, reduce_fn, act_size=4, max_input_tokens=6000, workers=2):
+        self.reduce_fn = reduce_fn
+        self.act_size = max(2, act_size)
+        self.max_input_tokens = max_input_tokens
+        self.executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="reduce")
+        self.lock = threading.Lock()
+        self.phases = []  # 尚未被已完成的幕覆盖的阶段回顾 (从第 phase_offset 个开始)
+        self.phase_offset = 0
+        self.phase_count = 0
+        self.acts = []  # [(标签, 文本 或 None)]，None 表示仍在汇总
+        self.pending = []
+        self.reductions = 0
+
+    def _reduce(self, items):
+        """汇总一组条目；失败时退回为截断拼接，保证上层仍有内容"""
+        result = None
+        try:
+            result = self.reduce_fn(fit(items, self.max_input_tokens))
+        except Exception as e:
+            print(f"Reduce error: {e}")
+        with self.lock:
+            self.reductions += 1
+        if result:
+            return result
+        return clip_text(" ".join(text for _, text in items), self.max_input_tokens // 4)
+
+    def add_phase(self, text):
+        """记录一条阶段回顾；凑满一幕时提交后台汇总"""
+        with self.lock:
+            self.phases.append(text)
+            self.phase_count += 1
+            count = self.phase_count
+            if count % self.act_size:
+                return
+            act = len(self.acts)
+            start = count - self.act_size
+            items = [(f"阶段{start + i + 1}", t) for i, t in enumerate(self.phases[-self.act_size:])]
+            self.acts.append((f"第{act + 1}幕 (阶段{start + 1}-{count})", None))
+        future = self.executor.submit(self._finish_act, act, items)
+        with self.lock:
+            self.pending.append(future)
+
+    def _finish_act(self, act, items):
+        text = self._reduce(items)
+        with self.lock:
+            self.acts[act] = (self.acts[act][0], text)
+            # 丢弃已被连续完成的幕覆盖的阶段原文
+            covered = self._covered()
+            del self.phases[:covered - self.phase_offset]
+            self.phase_offset = covered
+
+    def _covered(self):
+        """从头连续完成的幕覆盖的阶段数"""
+        done = 0
+        for _, text in self.acts:
+            if text is None:
+                break
+            done += 1
+        return done * self.act_size
+
+    def _items(self):
+        """已完成的幕 + 尚未被已完成的幕覆盖的阶段 (按时间顺序)"""
+        covered = self._covered()
+        items = list(self.acts[:covered // self.act_size])
+        items += [(f"阶段{covered + i + 1}", t) for i, t in enumerate(self.phases[covered - self.phase_offset:])]
+        return items
+
+    def context(self, max_tokens):
+        """阶段回顾 / 单帧分析用的历史剧情：从最新往前取，总长不超过 max_tokens；没有历史时返回空串"""
+        with self.lock:
+            items = self._items()
+        chosen, used = [], 0
+        for label, text in reversed(items):
+            cost = estimate_tokens(f"{label}: {text}\n")
+            if used + cost > max_tokens:
+                if not chosen:
+                    chosen.append((label, clip_text(text, max_tokens - estimate_tokens(label) - 2)))
+                break
+            chosen.append((label, text))
+            used += cost
+        return format_items(reversed(chosen))
+
+    def final_items(self, max_tokens=None):
+        """
+        等待在途汇总，返回最终解说用的 [(标签, 文本)]，总长不超过 max_tokens (默认 max_input_tokens)。
+        超出时分组并行再汇总一层 (每组不超过 max_tokens 与 max_input_tokens)，最多汇总 4 层，仍超出时逐条截断。
+        调用方应传入最终解说提示词中实际可用的 token 数，使结果无需再被裁剪。
+        """
+        max_tokens = max(1, max_tokens or self.max_input_tokens)
+        group_tokens = min(max_tokens, self.max_input_tokens)
+        for future in list(self.pending):
+            future.result()
+        with self.lock:
+            items = self._items()
+
+        level = 0
+        while estimate_tokens(format_items(items)) > max_tokens and level < 4:
+            groups = pack(items, group_tokens)
+            if len(groups) == 1 and len(groups[0]) == len(items):
+                break  # 单组已截断到上限内
+            level += 1
+            # 各组互不依赖，并行汇总；只有一条的组无需汇总
+            futures = [self.executor.submit(self._reduce, g) if len(g) > 1 else None for g in groups]
+            items = [(f"第{i + 1}部分" if f else g[0][0], f.result() if f else g[0][1])
+                     for i, (g, f) in enumerate(zip(groups, futures))]
+        return fit(items, max_tokens)
+
+    def stats(self):
+        with self.lock:
+            return {"phases": self.phase_count, "acts": sum(1 for _, t in self.acts if t is not None),
+                    "reductions": self.reductions}
+
+    def close(self):
+        self.executor.shutdown(wait=False)
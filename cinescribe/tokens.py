@@ -0,0 +1,203 @@
+"""
+提示词 token 预算。
+
+提示词模板用 str.format 填入历史记录，原来并不知道最终有多少 token，
+超出模型上下文时只能等到请求失败 (call_llm 返回 None) 才发现。
+
+TokenBudget 在发送前估算文本与图片 token：
+- fit() 按段落优先级裁剪历史内容，使 输入 + 输出 不超过该模型的预算
+- record() 记录每次请求实际使用的预算，按请求类型汇总，便于观察整部片的预填充开销
+估算不依赖分词器：中日韩字符约 1 token/字，其余约 4 字符/token；
+图片按 Qwen-VL 的视觉 token 规则 (每 32x32 像素一个 token) 估算。
+"""
+import base64
+import binascii
+import io
+import re
+import threading
+
+from PIL import Image
+
+_CJK = re.compile(r"[\u3000-\u9fff\uac00-\ud7af\uff00-\uffef]")
+
+IMAGE_TOKEN_PIXELS = 32  # 每个视觉 token 覆盖的边长 (像素)
+IMAGE_TOKEN_OVERHEAD = 2  # 图片起止标记
+MESSAGE_OVERHEAD = 4  # 每条消息的角色与分隔标记
+
+
+def estimate_tokens(text):
+    """粗略估算 token 数：中日韩字符约 1 个/字，其余约 4 字符/个"""
+    if not text:
+        return 0
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def clip_text(text, max_tokens):
+    """截断到约 max_tokens 个 token (保留开头)"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if estimate_tokens(text[:mid]) <= max_tokens:
+            lo = mid
+        else:
+            hi = mid - 1
+    return text[:lo] + "…"
+
+
+def trim_text(text, max_tokens, keep="tail"):
+    """
+    按行裁剪到 max_tokens 以内。keep="tail" 保留最新 (末尾) 的行，用于历史记录；
+    keep="head" 保留开头。只剩一行仍超出时按字符截断。
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    if max_tokens <= 0:
+        return ""
+    lines = text.split("\n")
+    if keep == "tail":
+        lines.reverse()
+    kept, used = [], 0
+    for line in lines:
+        cost = estimate_tokens(line) + 1
+        if used + cost > max_tokens:
+            if not kept:
+                kept.append(clip_text(line, max_tokens - 1))
+            break
+        kept.append(line)
+        used += cost
+    if keep == "tail":
+        kept.reverse()
+    return "\n".join(kept)
+
+
+def image_size(url):
+    """data URL 图片的 (宽, 高)；只解析文件头"""
+    try:
+        data = base64.b64decode(url.split(",", 1)[1])
+        with Image.open(io.BytesIO(data)) as img:
+            return img.size
+    except (IndexError, binascii.Error, OSError):
+        return None
+
+
+def image_tokens(size):
+    """(宽, 高) 图片的视觉 token 数"""
+    w, h = size
+    return (-(-w // IMAGE_TOKEN_PIXELS)) * (-(-h // IMAGE_TOKEN_PIXELS)) + IMAGE_TOKEN_OVERHEAD
+
+
+def estimate_image_tokens(url):
+    size = image_size(url)
+    if size is None:
+        return 0
+    return image_tokens(size)
+
+
+def estimate_messages(messages):
+    """OpenAI 格式 messages 的 (文本 token, 图片 token)"""
+    text_tokens = image_tokens = 0
+    for message in messages:
+        text_tokens += MESSAGE_OVERHEAD
+        content = message.get("content")
+        if isinstance(content, str):
+            text_tokens += estimate_tokens(content)
+            continue
+        for part in content or ():
+            if part.get("type") == "text":
+                text_tokens += estimate_tokens(part.get("text", ""))
+            elif part.get("type") == "image_url":
+                image_tokens += estimate_image_tokens(part["image_url"]["url"])
+    return text_tokens, image_tokens
+
+
+class Section:
+    """提示词模板中的一个可裁剪段落；priority 越小越先被裁剪"""
+
+    __slots__ = ("name", "text", "priority", "keep")
+
+    def __init__(self, name, text, priority=0, keep="tail"):
+        self.name = name
+        self.text = text
+        self.priority = priority
+        self.keep = keep
+
+
+class TokenBudget:
+    """
+    limits: {模型 ID: 每次请求 输入 + 输出 的 token 上限}，未列出的模型使用 default_limit。
+    reserve: 为估算误差预留的余量。所有方法线程安全。
+    """
+
+    def __init__(self, limits=None, default_limit=8192, reserve=128):
+        self.limits = dict(limits or {})
+        self.default_limit = default_limit
+        self.reserve = reserve
+        self.usage = {}
+        self.lock = threading.Lock()
+
+    def limit(self, model):
+        return self.limits.get(model, self.default_limit)
+
+    def available(self, model, template, names, fixed="", images=(), max_tokens=0):
+        """template 中 names 这些段落可用的 token 数 (扣除模板其余文本、fixed、图片与输出)"""
+        return (self.limit(model) - self.reserve - max_tokens - estimate_tokens(fixed)
+                - sum(estimate_image_tokens(url) for url in images)
+                - estimate_tokens(template.format(**{name: "" for name in names})))
+
+    def fit(self, model, template, sections, fixed="", images=(), max_tokens=0):
+        """
+        用 sections 填充 template (str.format)，按优先级从低到高裁剪段落，
+        使 模板 + 段落 + fixed (系统提示词等其他文本) + 图片 + 输出 max_tokens 不超过预算。
+        """
+        available = self.available(model, template, [s.name for s in sections], fixed, images, max_tokens)
+        costs = {s.name: estimate_tokens(s.text) for s in sections}
+        excess = sum(costs.values()) - max(0, available)
+        values = {s.name: s.text for s in sections}
+        for section in sorted(sections, key=lambda s: s.priority):
+            if excess <= 0:
+                break
+            allowed = max(0, costs[section.name] - excess)
+            values[section.name] = trim_text(section.text, allowed, section.keep)
+            excess -= costs[section.name] - estimate_tokens(values[section.name])
+        return template.format(**values)
+
+    def record(self, kind, model, messages, max_tokens=0):
+        """记录一次请求的预算使用；超出预算时提示 (请求仍会发送)，返回估算的输入 token 数"""
+        text_tokens, image_tokens = estimate_messages(messages)
+        total = text_tokens + image_tokens
+        limit = self.limit(model)
+        over = total + max_tokens > limit
+        with self.lock:
+            u = self.usage.setdefault(kind, {"requests": 0, "input": 0, "images": 0, "max_input": 0,
+                                             "limit": limit, "over": 0})
+            u["requests"] += 1
+            u["input"] += total
+            u["images"] += image_tokens
+            u["max_input"] = max(u["max_input"], total)
+            u["limit"] = limit
+            u["over"] += int(over)
+        if over:
+            print(f"Prompt over budget ({kind}): ~{total} input + {max_tokens} output > {limit} tokens")
+        return total
+
+    def stats(self):
+        """{请求类型: {requests, avg_input, max_input, images, limit, over}}"""
+        with self.lock:
+            return {kind: {"requests": u["requests"], "avg_input": u["input"] / u["requests"],
+                           "max_input": u["max_input"], "images": u["images"] / u["requests"],
+                           "limit": u["limit"], "over": u["over"]}
+                    for kind, u in self.usage.items()}
+
+
+def format_budget_stats(stats):
+    """每种请求一段：平均 / 最大输入 token 与预算上限"""
+    parts = []
+    for kind, s in stats.items():
+        text = f"{kind} 平均 {s['avg_input']:.0f} / 最大 {s['max_input']} / 上限 {s['limit']}"
+        if s["over"]:
+            text += f" (超出 {s['over']} 次)"
+        parts.append(text)
+    return "提示词 token: " + (" | ".join(parts) if parts else "-")
@@ -0,0 +1,47 @@
+"""
+合并的界面更新通道。
+
+分析线程每采集一帧都会发出预览、差异度、缓冲进度、状态等多个事件，原来每个事件各调用一次
+root.after(0, ...)，采集快于界面刷新时 Tk 主循环的回调越积越多，界面落后于采集。
+UIEventQueue 在分析线程中收集事件：只需显示最新值的事件 (预览、差异度、各类统计) 按事件名只保留最后一次，
+相邻的流式文本拼接为一段，其余事件按顺序保留；界面以固定帧率调用 drain() 一次取出全部更新。
+"""
+import threading
+
+
+class UIEventQueue:
+    """
+    latest: 只保留最新一次的事件名；concat: 相邻两次可合并的文本事件名
+    (data 中除 text 外的字段都相同时把 text 拼接起来)。所有方法线程安全。
+    """
+
+    def __init__(self, latest=(), concat=()):
+        self.latest_events = frozenset(latest)
+        self.concat_events = frozenset(concat)
+        self.latest = {}
+        self.ordered = []
+        self.lock = threading.Lock()
+
+    def put(self, event, data):
+        with self.lock:
+            if event in self.latest_events:
+                self.latest[event] = data
+                return
+            if event in self.concat_events and self.ordered:
+                last_event, last = self.ordered[-1]
+                if last_event == event and _same_except_text(last, data):
+                    self.ordered[-1] = (event, dict(last, text=last["text"] + data["text"]))
+                    return
+            self.ordered.append((event, data))
+
+    def drain(self):
+        """取出所有待处理的 (事件, 数据)：按顺序的事件在前，最新值在后"""
+        with self.lock:
+            items = self.ordered + list(self.latest.items())
+            self.ordered = []
+            self.latest = {}
+        return items
+
+
+def _same_except_text(a, b):
+    return a.keys() == b.keys() and all(a[k] == b[k] for k in a if k != "text")
@@ -0,0 +1,193 @@
+import time
+
+import pytest
+
+from cinescribe import balancer as balancer_module
+from cinescribe.balancer import EndpointPool
+
+A = "http://a:1234/v1/chat/completions"
+B = "http://b:1234/v1/chat/completions"
+
+
+class FakeClock:
+    """替换 balancer 模块中的 time：time() 只在 sleep() 或手动推进时前进"""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class FakeClient:
+    def __init__(self, fail=(), probe_ok=True, delays=None, busy=()):
+        self.fail = set(fail)
+        self.probe_ok = probe_ok
+        self.delays = delays or {}  # url -> 回复前的真实等待 (秒)，用于对冲测试
+        self.busy = set(busy)  # 并发名额已满的端点
+        self.calls = []
+        self.probes = []
+
+    def chat(self, url, model, messages, metrics=None, on_token=None, **options):
+        self.calls.append(url)
+        if url in self.delays:
+            time.sleep(self.delays[url])
+        if on_token is not None:
+            on_token("半句")
+        if url in self.fail:
+            return None
+        return f"reply from {url}"
+
+    def probe(self, url):
+        self.probes.append(url)
+        return self.probe_ok
+
+    def has_capacity(self, url):
+        return url not in self.busy
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(balancer_module, "time", fake)
+    return fake
+
+
+def wait_until(predicate, timeout=2.0):
+    deadline = time.time() + timeout
+    while not predicate():
+        if time.time() > deadline:
+            raise AssertionError("timed out")
+        time.sleep(0.01)
+
+
+def states(pool):
+    return [n["state"] for n in pool.stats()["nodes"]]
+
+
+def test_rejects_bad_configuration():
+    with pytest.raises(ValueError):
+        EndpointPool(FakeClient(), "VLM", [])
+    with pytest.raises(ValueError):
+        EndpointPool(FakeClient(), "VLM", [(A, "qwen/qwen3-vl-30b"), (B, "qwen/qwen3-vl-4b")])
+    with pytest.raises(ValueError):
+        EndpointPool(FakeClient(), "VLM", [(A, "m")], policy="round_robin")
+    assert EndpointPool(FakeClient(), "VLM", [(A, "m"), (B, "m")]).model == "m"
+
+
+def test_least_outstanding_prefers_idle_endpoint(clock):
+    pool = EndpointPool(FakeClient(), "VLM", [(A, "m"), (B, "m")])
+    first = pool._pick([])
+    second = pool._pick([])
+    assert (first.url, second.url) == (A, B)
+    pool._finish(first, 1.0, True)
+    assert pool._pick([]).url == A  # A 已空闲，B 仍有在途请求
+
+
+def test_latency_policy_prefers_faster_endpoint(clock):
+    pool = EndpointPool(FakeClient(), "VLM", [(A, "m"), (B, "m")], policy="latency")
+    for url, latency in ((A, 2.0), (B, 0.5)):
+        node = next(n for n in pool.nodes if n.url == url)
+        node.outstanding += 1
+        pool._finish(node, latency, True)
+    assert pool._pick([]).url == B
+
+
+def test_failing_endpoint_is_ejected_and_readmitted_after_probe(clock):
+    client = FakeClient(fail={A})
+    pool = EndpointPool(client, "VLM", [(A, "m"), (B, "m")], max_failures=2, eject_seconds=30.0)
+    for _ in range(3):
+        assert pool.chat([]) == f"reply from {B}"
+    assert client.calls == [A, B, A, B, B]  # 连续失败 2 次后不再发往 A
+    assert states(pool) == ["open", "closed"]
+
+    client.fail.clear()
+    clock.now += 30.0
+    assert pool.chat([]) == f"reply from {B}"  # 触发后台健康检查，本次仍由 B 处理
+    wait_until(lambda: states(pool)[0] == "closed")
+    assert client.probes == [A]
+    assert pool.chat([]) == f"reply from {A}"
+
+
+def test_failed_probe_keeps_endpoint_out(clock):
+    client = FakeClient(fail={A}, probe_ok=False)
+    pool = EndpointPool(client, "VLM", [(A, "m"), (B, "m")], max_failures=1, eject_seconds=30.0)
+    pool.chat([])
+    clock.now += 30.0
+    pool.chat([])
+    wait_until(lambda: client.probes == [A] and states(pool)[0] == "open")
+    calls = len(client.calls)
+    clock.now += 10.0
+    pool.chat([])
+    assert client.calls[calls:] == [B]
+    assert client.probes == [A]  # 下一次健康检查要再等 eject_seconds
+
+
+def test_retries_are_bounded_with_capped_jittered_backoff(clock, monkeypatch):
+    monkeypatch.setattr(balancer_module.random, "uniform", lambda low, high: high)
+    client = FakeClient(fail={A, B})
+    pool = EndpointPool(client, "VLM", [(A, "m"), (B, "m")], max_failures=10, retries=3, backoff=4.0)
+    metrics = {}
+    assert pool.chat([], metrics=metrics) is None
+    assert len(client.calls) == 4
+    assert client.calls[:2] == [A, B]  # 优先换一个没试过的端点
+    assert clock.sleeps == [4.0, 8.0, balancer_module.MAX_BACKOFF]
+    assert metrics["attempts"] == 4
+    stats = pool.stats()
+    assert (stats["requests"], stats["retries"], stats["failed"]) == (1, 3, 1)
+
+
+def test_streaming_request_is_not_retried_after_tokens(clock):
+    client = FakeClient(fail={A})
+    pool = EndpointPool(client, "VLM", [(A, "m"), (B, "m")], retries=2)
+    tokens = []
+    assert pool.chat([], on_token=tokens.append) is None
+    assert client.calls == [A]
+    assert tokens == ["半句"]
+
+
+def test_open_circuit_rejects_without_calling_endpoint(clock):
+    client = FakeClient(fail={A})
+    pool = EndpointPool(client, "OCR", [(A, "m")], max_failures=1, retries=0)
+    assert pool.chat([]) is None
+    assert pool.chat([]) is None
+    assert client.calls == [A]
+    assert pool.stats()["rejected"] == 1
+
+
+def hedging_pool(client):
+    pool = EndpointPool(client, "VLM", [(A, "m"), (B, "m")], retries=0, hedge=True)
+    pool.latencies.extend([0.02] * balancer_module.HEDGE_MIN_SAMPLES)  # p95 = 0.02 秒
+    return pool
+
+
+def test_slow_request_is_hedged_onto_idle_endpoint():
+    client = FakeClient(delays={A: 0.3})
+    pool = hedging_pool(client)
+    metrics = {}
+    assert pool.chat([], metrics=metrics) == f"reply from {B}"
+    assert client.calls == [A, B]
+    assert metrics["hedged"]
+    stats = pool.stats()
+    assert (stats["hedges"], stats["hedge_wins"]) == (1, 1)
+    wait_until(lambda: all(n["outstanding"] == 0 for n in pool.stats()["nodes"]))
+
+
+def test_hedge_is_never_sent_to_saturated_endpoint():
+    client = FakeClient(delays={A: 0.1}, busy={B})
+    pool = hedging_pool(client)
+    assert pool.chat([]) == f"reply from {A}"
+    assert client.calls == [A]
+    assert pool.stats()["hedges"] == 0
+
+
+def test_hedging_needs_latency_samples():
+    client = FakeClient(delays={A: 0.1})
+    pool = EndpointPool(client, "VLM", [(A, "m"), (B, "m")], retries=0, hedge=True)
+    assert pool.chat([]) == f"reply from {A}"
+    assert client.calls == [A]
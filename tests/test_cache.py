@@ -0,0 +1,63 @@
+import itertools
+
+import pytest
+
+from cinescribe import cache as cache_module
+from cinescribe.cache import ResponseCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """单调递增的 time.time，使 last_access 的先后确定"""
+    ticks = itertools.count(1000)
+    monkeypatch.setattr(cache_module.time, "time", lambda: float(next(ticks)))
+
+
+def messages(text):
+    return [{"role": "system", "content": "固定指令"}, {"role": "user", "content": text}]
+
+
+def test_key_depends_on_model_and_prompt():
+    key = ResponseCache.make_key("model-a", messages("你好"), 100)
+    assert key == ResponseCache.make_key("model-a", messages("你好"), 100)
+    assert key != ResponseCache.make_key("model-b", messages("你好"), 100)
+    assert key != ResponseCache.make_key("model-a", messages("再见"), 100)
+    assert key != ResponseCache.make_key("model-a", messages("你好"), 200)
+
+
+def test_get_put_counts_hits(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    assert cache.get("k") is None
+    cache.put("k", "回答")
+    assert cache.get("k") == "回答"
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, 1)
+    cache.close()
+
+
+def test_evicts_least_recently_used(tmp_path, clock):
+    value = "x" * 100
+    size = len(value) + 1  # 值 + 单字符键
+    cache = ResponseCache(str(tmp_path), max_bytes=3 * size)
+    for key in "abc":
+        cache.put(key, value)
+    cache.get("a")  # a 变为最近使用
+    cache.put("d", value)
+    assert cache.get("b") is None
+    assert cache.get("a") == value
+    assert cache.get("d") == value
+    stats = cache.stats()
+    assert stats["evictions"] == 1
+    assert stats["bytes"] <= 3 * size
+    cache.close()
+
+
+def test_size_survives_reopen(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    cache.put("k", "回答")
+    size = cache.stats()["bytes"]
+    cache.close()
+    reopened = ResponseCache(str(tmp_path))
+    assert reopened.stats()["bytes"] == size
+    assert reopened.get("k") == "回答"
+    reopened.close()
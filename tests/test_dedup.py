@@ -0,0 +1,56 @@
+from cinescribe.dedup import SubtitleDeduplicator, jaccard, normalize_line, shingles
+
+
+def test_shingles_ignore_punctuation_and_spaces():
+    assert shingles(normalize_line("你好，世界！")) == shingles(normalize_line("你好 世界"))
+    assert jaccard(shingles("今天天气很好"), shingles("今天天气很好")) == 1.0
+
+
+def test_repeated_line_with_ocr_error_is_duplicate():
+    dedup = SubtitleDeduplicator()
+    assert not dedup.is_duplicate("我们明天一起去海边看日出吧", 0.0)
+    assert dedup.is_duplicate("我们明天一起去海边看日出吧", 2.0)
+    assert dedup.is_duplicate("我们明天一起去海边看日山吧", 4.0)  # OCR 错一个字
+    assert not dedup.is_duplicate("你为什么现在才告诉我这件事", 6.0)
+
+
+def test_short_line_with_one_ocr_error_at_configured_threshold():
+    from CineScribe_VLM_v1Pro import SUBTITLE_DEDUP_THRESHOLD
+    line = "他说今天不回家了"
+    # 八个字的句子中间错一个字时 Jaccard 最低 (5/9)，须不高于配置的阈值
+    for i in range(len(line)):
+        dedup = SubtitleDeduplicator(SUBTITLE_DEDUP_THRESHOLD)
+        assert not dedup.is_duplicate(line, 0.0)
+        assert dedup.is_duplicate(line[:i] + "来" + line[i + 1:], 2.0), i
+
+
+def test_history_expires_after_window():
+    dedup = SubtitleDeduplicator(window=60.0)
+    assert not dedup.is_duplicate("我们明天一起去海边看日出吧", 0.0)
+    assert not dedup.is_duplicate("我们明天一起去海边看日出吧", 61.0)
+    assert len(dedup) == 1
+
+
+def test_max_lines_bounds_history():
+    dedup = SubtitleDeduplicator(max_lines=3)
+    for i, line in enumerate(["第一句台词内容", "第二句完全不同", "第三行别的东西", "最后这里又是新的"]):
+        dedup.is_duplicate(line, float(i))
+    dedup.is_duplicate("再来一句新台词", 5.0, remember=False)
+    assert len(dedup) == 3
+
+
+def test_process_keeps_only_new_lines():
+    dedup = SubtitleDeduplicator()
+    assert dedup.process("我们明天一起去海边看日出吧\n好", 0.0) == "我们明天一起去海边看日出吧"
+    assert dedup.process("我们明天一起去海边看日出吧\n你为什么现在才告诉我", 3.0) == "你为什么现在才告诉我"
+    assert dedup.process("无", 5.0) == ""
+
+
+def test_numpy_and_pure_python_signatures_match(monkeypatch):
+    from cinescribe import dedup as dedup_module
+    if dedup_module.np is None:
+        return
+    grams = shingles(normalize_line("我们明天一起去海边看日出吧"))
+    vectorized = SubtitleDeduplicator()._band_keys(grams)
+    monkeypatch.setattr(dedup_module, "np", None)
+    assert SubtitleDeduplicator()._band_keys(grams) == vectorized
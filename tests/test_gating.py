@@ -0,0 +1,126 @@
+import pytest
+from PIL import Image, ImageDraw, ImageFont
+
+from cinescribe import gating as gating_module
+from cinescribe.gating import ChangeDetector, SubtitleStripFilter
+from cinescribe.sources import Frame
+
+np = pytest.importorskip("numpy")  # 未安装 NumPy 时检测器只有 mean 方法
+
+FONT = ImageFont.load_default(size=28)
+LINE = "Where are you going tonight?"
+
+
+def scene(seed, subtitle=LINE, shift=0):
+    """纯色背景上的几个色块，底部一行描边字幕；shift 把色块整体右移"""
+    rng = np.random.default_rng(seed)
+    img = Image.new("RGB", (640, 360), tuple(int(v) for v in rng.integers(0, 120, 3)))
+    draw = ImageDraw.Draw(img)
+    for _ in range(6):
+        x, y = (int(v) for v in rng.integers(0, 500, 2))
+        draw.rectangle((x + shift, y % 200, x + shift + 120, y % 200 + 80),
+                       fill=tuple(int(v) for v in rng.integers(0, 256, 3)))
+    if subtitle:
+        draw.text((320, 330), subtitle, font=FONT, fill="white", anchor="mm", stroke_width=2, stroke_fill="black")
+    return img
+
+
+def noisy(img, amplitude=2, seed=0):
+    """模拟压缩噪声：每个像素随机偏移 ±amplitude 个灰度级"""
+    a = np.asarray(img, dtype=np.int16)
+    a = a + np.random.default_rng(seed).integers(-amplitude, amplitude + 1, a.shape)
+    return Image.fromarray(np.clip(a, 0, 255).astype(np.uint8))
+
+
+def compare(detector, a, b):
+    return detector.compare(Frame(a, 0.0), Frame(b, 1.0))
+
+
+def test_rejects_unknown_method():
+    with pytest.raises(ValueError):
+        ChangeDetector("ssim")
+
+
+@pytest.mark.parametrize("method", ["dhash", "phash", "histogram"])
+def test_identical_and_noisy_frames_are_static(method):
+    detector = ChangeDetector(method)
+    base = scene(1)
+    same = compare(detector, base, base.copy())
+    assert (same.subtitle, same.picture, same.changed) == (0.0, 0.0, False)
+    noise = compare(detector, base, noisy(base))
+    assert noise.subtitle < detector.subtitle_threshold
+    assert noise.picture < detector.picture_threshold
+    assert not noise.changed
+
+
+@pytest.mark.parametrize("method", ["mean", "dhash", "phash", "histogram"])
+def test_scene_cut_is_a_change(method):
+    detector = ChangeDetector(method)
+    score = compare(detector, scene(1), scene(2))
+    assert score.picture > detector.picture_threshold
+    assert score.changed and score.level >= 1.0
+
+
+def test_first_frame_is_always_a_change():
+    assert ChangeDetector().compare(None, Frame(scene(1), 0.0)).changed
+
+
+@pytest.mark.parametrize("method", ["dhash", "phash"])
+def test_subtitle_and_picture_have_separate_thresholds(method):
+    detector = ChangeDetector(method)
+    base = scene(1)
+    new_line = compare(detector, base, scene(1, subtitle="I will never tell you that."))
+    assert new_line.subtitle > detector.subtitle_threshold
+    assert new_line.picture == 0.0
+    assert new_line.changed
+    moved = compare(detector, base, scene(1, shift=6))  # 小幅运动只影响画面区，低于画面区阈值
+    assert 0.0 < moved.picture < detector.picture_threshold
+    assert moved.subtitle == 0.0
+    assert not moved.changed
+
+    strict_picture = ChangeDetector(method, subtitle_threshold=100.0, picture_threshold=1.0)
+    assert compare(strict_picture, base, scene(1, shift=6)).changed
+    assert not compare(strict_picture, base, scene(1, subtitle="I will never tell you that.")).changed
+
+
+def test_features_are_computed_once_per_frame(monkeypatch):
+    calls = []
+    features = gating_module._features
+    monkeypatch.setattr(gating_module, "_features", lambda *args: calls.append(args[1]) or features(*args))
+    detector = ChangeDetector("dhash")
+    frames = [Frame(scene(1), 0.0), Frame(scene(1, shift=6), 1.0), Frame(scene(2), 2.0)]
+    detector.compare(frames[0], frames[1])
+    detector.compare(frames[1], frames[2])
+    assert len(calls) == 6  # 3 帧 x (字幕带, 画面区)
+    ChangeDetector("phash").compare(frames[0], frames[1])
+    assert calls[6:] == ["phash"] * 4  # 配置不同的检测器各自缓存
+
+
+def strip(text=None, seed=0):
+    """带噪声的渐变背景字幕条，text 不为空时叠加一行描边文字"""
+    rng = np.random.default_rng(seed)
+    a = np.tile(np.linspace(30, 110, 640), (90, 1))[..., None].repeat(3, axis=2)
+    a = a + rng.integers(-3, 4, a.shape)
+    img = Image.fromarray(np.clip(a, 0, 255).astype(np.uint8))
+    if text:
+        ImageDraw.Draw(img).text((320, 45), text, font=FONT, fill="white", anchor="mm",
+                                 stroke_width=2, stroke_fill="black")
+    return img
+
+
+def test_strip_filter_drops_empty_and_repeated_strips():
+    strips = SubtitleStripFilter()
+    assert not strips.accept(strip())  # 没有字幕
+    assert strips.accept(strip(LINE, seed=1))
+    assert not strips.accept(strip(LINE, seed=2))  # 同一句仍在屏幕上，只有噪声不同
+    assert strips.accept(strip("I will never tell you that.", seed=3))
+    assert not strips.accept(strip(seed=4))
+    assert not strips.accept(strip("I will never tell you that.", seed=5))  # 字幕闪烁后重现，仍与上一条送检相同
+    assert strips.stats() == {"strips": 6, "empty": 2, "repeated": 2, "sent": 2}
+
+
+def test_strip_filter_thresholds():
+    assert not SubtitleStripFilter(min_density=0.5).accept(strip(LINE))
+    strips = SubtitleStripFilter(repeat_threshold=0.0)
+    assert strips.accept(strip(LINE, seed=1))
+    assert strips.accept(strip(LINE, seed=1))  # 阈值为 0 时只要有文字就送检
@@ -0,0 +1,194 @@
+import base64
+import csv
+import io
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+from PIL import Image, ImageChops, ImageDraw, ImageStat
+
+from cinescribe.imaging import (QUALITY_STEP, ImagePreprocessor, encode_data_url, encode_image, encode_profile,
+                                grid_tiles, stitch_grid, strip_tiles)
+
+
+def frame(seed, size=(1280, 720)):
+    """渐变背景上画几个色块，每个 seed 的画面不同"""
+    w, h = size
+    img = Image.linear_gradient("L").resize(size).convert("RGB")
+    draw = ImageDraw.Draw(img)
+    for i in range(5):
+        x, y = (seed * 97 + i * 211) % (w - 200), (seed * 53 + i * 131) % (h - 150)
+        draw.rectangle((x, y, x + 200, y + 150), fill=((seed * 40 + i * 50) % 256, (i * 70) % 256, 120))
+    return img
+
+
+def decode(url):
+    header, data = url.split(",", 1)
+    return header, Image.open(io.BytesIO(base64.b64decode(data)))
+
+
+@pytest.fixture(scope="module")
+def process_pool():
+    pre = ImagePreprocessor(workers=1)
+    yield pre
+    pre.close()
+
+
+def test_process_pool_matches_in_thread_output(process_pool):
+    frames = [frame(i) for i in range(4)]
+    strips = [frame(i, (1280, 120)) for i in range(3)]
+    inline = ImagePreprocessor(workers=0)
+    for task, images, params in (("grid", frames, {"max_dim": 1024}), ("strip", strips, {"width": 640})):
+        expected = inline.run(task, images, **params)
+        assert process_pool.run(task, images, **params) == expected  # 共享内存传递像素，结果逐字节相同
+    assert process_pool.stats()["mode"] == "process"
+    assert process_pool.stats()["tasks"] == 2
+    assert inline.stats()["mode"] == "thread"
+
+    header, grid = decode(process_pool.run("grid", frames, max_dim=1024))
+    assert header == "data:image/jpeg;base64"
+    assert max(grid.size) <= 1024
+    assert decode(process_pool.run("strip", strips, width=640))[1].size == (640, 180)
+
+
+def test_nothing_to_process_returns_none(process_pool):
+    assert process_pool.run("strip", []) is None
+    assert process_pool.run("grid", [frame(0)] * 3) is None  # 拼图需要 4 帧
+    with pytest.raises(ValueError):
+        process_pool.submit("mosaic", [frame(0)])
+
+
+class BrokenPool:
+    """模拟子进程被杀掉的进程池：submit 直接失败，或返回以 BrokenProcessPool 结束的任务"""
+
+    def __init__(self, fail_submit):
+        self.fail_submit = fail_submit
+        self.shutdown_calls = 0
+
+    def submit(self, *args):
+        if self.fail_submit:
+            raise BrokenProcessPool("worker killed")
+        future = Future()
+        future.set_exception(BrokenProcessPool("worker killed"))
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        self.shutdown_calls += 1
+
+
+@pytest.mark.parametrize("fail_submit", [True, False])
+def test_broken_pool_falls_back_to_in_thread_processing(fail_submit):
+    frames = [frame(i) for i in range(4)]
+    expected = ImagePreprocessor(workers=0).run("grid", frames)
+    pre = ImagePreprocessor(workers=1)
+    broken = pre.executor = BrokenPool(fail_submit)
+    assert pre.run("grid", frames) == expected  # 在途任务在线程内重做，不丢弃
+    assert broken.shutdown_calls == 1
+    stats = pre.stats()
+    assert (stats["mode"], stats["tasks"], stats["failures"]) == ("thread", 1, 0)
+    assert pre.run("grid", frames) == expected
+    assert pre.executor is None
+    pre.close()
+
+
+def test_grid_resizes_each_frame_once_to_tile_size():
+    frames = [frame(i, (1920, 1080)) for i in range(4)]
+    tiles = grid_tiles(frames, max_dim=1560)
+    assert {tile.size for tile in tiles} == {(780, 438)}
+    grid = stitch_grid(frames, max_dim=1560)
+    assert grid.size == (1560, 876)
+    assert grid.getpixel((780 + 10, 438 + 10)) == tiles[3].getpixel((10, 10))
+
+    # 与原来 "原分辨率拼接后再整体缩小" 的结果几乎一致
+    reference = Image.new("RGB", (3840, 2160))
+    for i, img in enumerate(frames):
+        reference.paste(img, ((i % 2) * 1920, (i // 2) * 1080))
+    reference = reference.resize(grid.size, Image.Resampling.LANCZOS)
+    assert max(ImageStat.Stat(ImageChops.difference(grid, reference)).mean) < 2.0
+
+
+def test_canvases_are_reused_per_size():
+    frames = [frame(i) for i in range(4)]
+    first = stitch_grid(frames, max_dim=640)
+    pixels = first.tobytes()
+    second = stitch_grid(frames[::-1], max_dim=640)
+    assert second is first  # 同尺寸复用画布，内容被完全覆盖
+    assert second.tobytes() != pixels
+    assert stitch_grid(frames, max_dim=320) is not first
+
+
+def test_strip_tiles_skip_resize_at_target_width():
+    strips = [frame(i, (1024, 100)) for i in range(2)]
+    assert strip_tiles(strips, 1024)[0] is strips[0]
+    assert [tile.size for tile in strip_tiles(strips, 512)] == [(512, 50)] * 2
+
+
+def test_reused_encode_buffer_returns_only_current_image():
+    big = encode_data_url(frame(1, (1280, 720)))
+    small = encode_data_url(frame(2, (64, 36)))
+    assert len(small) < len(big)
+    assert base64.b64decode(small.split(",", 1)[1]).endswith(b"\xff\xd9")  # 复用缓冲区不会带出上一张图的尾部数据
+    assert decode(small)[1].size == (64, 36)
+    assert decode(big)[1].size == (1280, 720)
+
+
+def noisy_frame(size=(640, 360)):
+    """随机噪声几乎不可压缩，JPEG 体积随质量明显变化"""
+    return Image.frombytes("RGB", size, bytes((i * 7919 + i // 13) % 251 for i in range(size[0] * size[1] * 3)))
+
+
+def test_profile_validation():
+    assert encode_profile({"format": "webp"})["format"] == "WEBP"
+    for profile in ({"codec": "JPEG"}, {"format": "GIF"}, {"subsampling": "4:1:1"}):
+        with pytest.raises(ValueError):
+            encode_profile(profile)
+
+
+def test_quality_ladder_meets_target_size():
+    img = noisy_frame()
+    full = encode_image(img, {"quality": 90})[1]
+    target = full["bytes"] // 2
+    url, info = encode_image(img, {"quality": 90, "max_bytes": target, "min_quality": 10})
+    assert info["bytes"] <= target
+    assert info["attempts"] > 1
+    assert info["quality"] == 90 - QUALITY_STEP * (info["attempts"] - 1)
+    assert len(base64.b64decode(url.split(",", 1)[1])) == info["bytes"]
+
+
+def test_quality_ladder_stops_at_min_quality():
+    url, info = encode_image(noisy_frame(), {"quality": 85, "max_bytes": 100, "min_quality": 60})
+    assert info["quality"] == 60
+    assert info["bytes"] > 100  # 达不到目标时停在最低质量，而不是无限降质
+    assert info["attempts"] == 4  # 85 -> 75 -> 65 -> 60
+
+
+def test_lossless_and_grayscale_profiles():
+    url, info = encode_image(noisy_frame(), {"format": "PNG", "max_bytes": 100})
+    assert (info["quality"], info["attempts"]) == (None, 1)  # 无损格式不走质量阶梯
+    assert decode(url)[0] == "data:image/png;base64"
+    url, info = encode_image(frame(1), {"grayscale": True, "subsampling": "4:2:0"})
+    assert decode(url)[1].mode == "L"
+
+
+def test_preprocessor_applies_per_task_profiles(tmp_path):
+    profiles = {"strip": {"format": "PNG", "grayscale": True}, "grid": {"quality": 60}}
+    strips = [frame(i, (1280, 120)) for i in range(2)]
+    frames = [frame(i) for i in range(4)]
+    inline = ImagePreprocessor(workers=0, profiles=profiles, log_path=str(tmp_path / "imaging.csv"))
+    header, strip = decode(inline.run("strip", strips, width=640))
+    assert (header, strip.mode) == ("data:image/png;base64", "L")
+    inline.run("grid", frames, max_dim=640)
+    payloads = inline.stats()["payloads"]
+    assert (payloads["strip"]["format"], payloads["strip"]["quality"]) == ("PNG", None)
+    assert (payloads["grid"]["format"], payloads["grid"]["quality"]) == ("JPEG", 60)
+    inline.close()
+    with open(tmp_path / "imaging.csv", encoding="utf-8", newline="") as f:
+        rows = list(csv.DictReader(f))
+    assert [(r["task"], r["format"], r["grayscale"]) for r in rows] == [("strip", "PNG", "1"), ("grid", "JPEG", "0")]
+
+    pooled = ImagePreprocessor(workers=1, profiles=profiles)
+    try:
+        assert pooled.run("strip", strips, width=640) == ImagePreprocessor(workers=0, profiles=profiles).run(
+            "strip", strips, width=640)  # 编码配置随任务传给子进程
+    finally:
+        pooled.close()
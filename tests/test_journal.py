@@ -0,0 +1,73 @@
+from cinescribe.journal import LogJournal
+
+
+def read(path):
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+
+def test_content_after_unfinished_slot_is_held_back(tmp_path):
+    path = tmp_path / "log.txt"
+    journal = LogJournal(str(path))
+    journal.append("批次0\n", key=0)
+    journal.append("批次1\n", key=1)
+    slot = journal.reserve(key=1.5)  # 覆盖前两个批次的阶段回顾
+    journal.append("批次3\n", key=3)
+    journal.append("批次2\n", key=2)  # 乱序完成的批次按 key 排序
+    assert read(path) == "批次0\n批次1\n"
+    assert journal.pending() == 1
+
+    journal.finish(slot, "回顾\n")
+    assert read(path) == "批次0\n批次1\n回顾\n批次2\n批次3\n"
+    assert journal.pending() == 0
+    journal.close()
+
+
+def test_head_slot_writes_reach_file_immediately(tmp_path):
+    path = tmp_path / "log.txt"
+    journal = LogJournal(str(path))
+    journal.append("批次0\n", key=0)
+    first = journal.reserve(key=0.5)
+    second = journal.reserve(key=1.5)
+    journal.append("批次1\n", key=1)
+    journal.write(first, "流式")
+    journal.write(second, "稍后")  # 不在最前面，暂存
+    assert read(path) == "批次0\n流式"
+    journal.write(first, "输出\n")
+    assert read(path) == "批次0\n流式输出\n"
+
+    journal.finish(first)
+    assert read(path) == "批次0\n流式输出\n批次1\n稍后"  # second 成为最前面的占位
+    journal.finish(second, "\n")
+    assert read(path) == "批次0\n流式输出\n批次1\n稍后\n"
+    journal.close()
+
+
+def test_key_none_appends_after_everything(tmp_path):
+    path = tmp_path / "log.txt"
+    journal = LogJournal(str(path))
+    slot = journal.reserve(key=5)
+    journal.append("末尾\n")
+    journal.finish(slot, "占位\n")
+    journal.close()
+    assert read(path) == "占位\n末尾\n"
+
+
+def test_close_flushes_unfinished_slots(tmp_path):
+    path = tmp_path / "log.txt"
+    journal = LogJournal(str(path))
+    slot = journal.reserve(key=0.5)
+    journal.append("批次1\n", key=1)
+    journal.write(slot, "未完成的回顾")
+    journal.close()
+    assert read(path) == "未完成的回顾批次1\n"
+
+
+def test_without_path_only_tracks_order():
+    journal = LogJournal(None)
+    slot = journal.reserve()
+    journal.append("批次\n")
+    assert journal.pending() == 1
+    journal.finish(slot)
+    assert journal.pending() == 0
+    journal.close()
@@ -0,0 +1,127 @@
+import threading
+import time
+
+import pytest
+
+from cinescribe.pipeline import BatchWorkerPool, OrderedSequencer
+
+
+def wait_until(predicate, timeout=2.0):
+    deadline = time.time() + timeout
+    while not predicate():
+        if time.time() > deadline:
+            raise AssertionError("timed out")
+        time.sleep(0.01)
+
+
+def blocked_pool(**kwargs):
+    """一个工作线程卡在第一个批次上，便于把队列填满"""
+    gate = threading.Event()
+    handled = []
+
+    def handler(job):
+        gate.wait()
+        handled.append(job)
+
+    pool = BatchWorkerPool(handler, workers=1, max_queue=1, **kwargs)
+    pool.submit(0)
+    wait_until(lambda: pool.stats()["busy"] == 1)
+    return pool, gate, handled
+
+
+def test_rejects_unknown_policy():
+    with pytest.raises(ValueError):
+        BatchWorkerPool(lambda job: None, overflow="spill")
+    with pytest.raises(ValueError):
+        BatchWorkerPool(lambda job: None, overflow="merge")
+
+
+def test_drop_oldest_reports_dropped_job():
+    dropped = []
+    pool, gate, handled = blocked_pool(overflow="drop_oldest", on_drop=dropped.append)
+    assert pool.submit(1)
+    assert pool.submit(2)
+    assert dropped == [1]
+    gate.set()
+    pool.close(wait=True)
+    assert handled == [0, 2]
+    assert pool.stats()["dropped"] == 1
+
+
+def test_merge_combines_with_queue_tail():
+    pool, gate, handled = blocked_pool(overflow="merge", merge_fn=lambda tail, job: tail + [job])
+    pool.submit([1])
+    pool.submit(2)
+    pool.submit(3)
+    gate.set()
+    pool.close(wait=True)
+    assert handled == [0, [1, 2, 3]]
+    assert pool.stats()["merged"] == 2
+
+
+def test_block_waits_for_free_slot():
+    pool, gate, handled = blocked_pool(overflow="block")
+    pool.submit(1)
+    result = []
+    submitter = threading.Thread(target=lambda: result.append(pool.submit(2)))
+    submitter.start()
+    time.sleep(0.1)
+    assert not result  # 队列已满，提交方被阻塞
+    gate.set()
+    submitter.join(2.0)
+    pool.close(wait=True)
+    assert result == [True]
+    assert handled == [0, 1, 2]
+
+
+def test_block_returns_false_when_closed_during_wait():
+    pool, gate, handled = blocked_pool(overflow="block")
+    pool.submit(1)
+    result = []
+    submitter = threading.Thread(target=lambda: result.append(pool.submit(2)))
+    submitter.start()
+    time.sleep(0.1)
+    pool.close(wait=False)
+    submitter.join(2.0)
+    assert result == [False]
+    assert pool.stats()["submitted"] == 2
+    gate.set()
+    pool.close(wait=True)
+    assert handled == [0, 1]
+
+
+def test_sequencer_releases_in_order():
+    released = []
+    seq = OrderedSequencer(lambda index, result: released.append((index, result)))
+    seq.put(2, "c")
+    seq.put(1, "b")
+    assert released == []
+    seq.put(0, "a")
+    assert released == [(0, "a"), (1, "b"), (2, "c")]
+
+
+def test_sequencer_skip_unblocks_later_batches():
+    released = []
+    seq = OrderedSequencer(lambda index, result: released.append(index))
+    seq.put(1, "b")
+    seq.skip(0)
+    seq.put(0, "late")  # 已跳过的批次再提交时忽略
+    assert released == [1]
+    assert seq.wait_released(2, timeout=0.1)
+    assert seq.pending_count() == 0
+
+
+def test_sequencer_history_waits_for_earlier_batches():
+    seq = OrderedSequencer(lambda index, result: None, history_size=3)
+    history = []
+    reader = threading.Thread(target=lambda: history.append(seq.wait_history(2, 2)))
+    reader.start()
+    seq.put(0, "a")
+    time.sleep(0.05)
+    assert not history  # 批次 1 尚未释放
+    seq.put(1, "b")
+    reader.join(2.0)
+    assert history == [["a", "b"]]
+    for i, result in enumerate("cde", start=2):
+        seq.put(i, result)
+    assert seq.wait_history(5, 5) == ["c", "d", "e"]
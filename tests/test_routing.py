@@ -0,0 +1,64 @@
+import pytest
+
+from cinescribe.routing import REFUSAL_MARKERS, CascadeRouter
+
+ANSWER = "画面中一名男子站在窗边，神情凝重地望着街道，女子端着茶走近，两人低声交谈，气氛紧张而压抑。"
+
+
+def test_difficulty_combines_motion_shot_and_subtitles():
+    router = CascadeRouter()
+    assert router.difficulty([0.0] * 4, 0, 4) == 0.0
+    assert router.difficulty([0.2] * 4, 0, 4) == pytest.approx(0.1)
+    assert router.difficulty([0.2] * 4, 4, 4) == pytest.approx(0.3)
+    assert router.difficulty([0.2] * 4, 9, 4) == pytest.approx(0.3)  # 字幕密度上限为 1
+    assert router.difficulty([5.0], 0, 1) == pytest.approx(0.8)  # 运动度按 1 截断，且算作镜头切换
+    assert router.difficulty([], 0, 0) == pytest.approx(0.8)  # 没有运动信息时按最难处理
+
+
+def test_threshold_boundary_goes_to_large_model():
+    router = CascadeRouter(threshold=0.25)
+    assert router.route([0.5] * 4, 0, 4) == ("large", 0.25)
+    tier, score = router.route([0.4] * 4, 0, 4)
+    assert (tier, score) == ("small", pytest.approx(0.2))
+    assert (router.routed["small"], router.routed["large"]) == (1, 1)
+
+
+def test_shot_change_pushes_batch_to_large_model():
+    router = CascadeRouter()
+    assert router.route([0.1] * 4, 0, 4)[0] == "small"
+    assert router.route([0.1, 0.1, 1.0, 0.1], 0, 4)[0] == "large"
+
+
+def test_disabled_router_always_uses_large_model():
+    router = CascadeRouter(enabled=False)
+    assert router.route([0.0] * 4, 0, 4)[0] == "large"
+    assert router.stats()["share"] == 0.0
+
+
+def test_check_requires_enough_chinese_and_no_refusal():
+    router = CascadeRouter()
+    assert router.check(ANSWER)
+    assert not router.check(None)
+    assert not router.check("")
+    assert not router.check(ANSWER[:20])
+    assert not router.check("A man stands by the window. " * 10)
+    for marker in REFUSAL_MARKERS:
+        assert not router.check(ANSWER + marker)
+    assert CascadeRouter(min_answer_chars=5).check("两人在交谈。")
+
+
+def test_record_tracks_escalations_and_saved_time():
+    router = CascadeRouter()
+    router.record("small", 2.0)
+    assert router.stats()["saved"] is None  # 大模型还没有延迟样本
+
+    router.record("small", 1.0, kept=False)  # 升级到大模型重做
+    router.record("large", 10.0)
+    router.record("large", 6.0)
+    router.record("small", None, kept=False)  # 缓存命中的小模型回答同样可能被升级
+    stats = router.stats()
+    assert stats["escalated"] == 2
+    assert stats["small_latency"] == pytest.approx(1.5)
+    assert stats["large_latency"] == pytest.approx(8.0)
+    # 被采用的 1 个小模型批次按大模型 8 秒估算，减去小模型实际耗时 3 秒
+    assert stats["saved"] == pytest.approx(5.0)
@@ -0,0 +1,94 @@
+import csv
+
+import pytest
+
+from cinescribe.scheduler import CaptureScheduler
+
+
+def scheduler(**kwargs):
+    return CaptureScheduler(3.0, 1.0, 8.0, **kwargs)
+
+
+def test_starts_at_base_interval_and_ignores_missing_frames():
+    s = scheduler()
+    assert s.next_interval(0.0, None) == pytest.approx(3.0)
+    assert s.next_interval(3.0, None) == pytest.approx(3.0)  # 没有读到帧时不更新运动度
+    assert s.reason == "motion"
+
+
+def test_motion_moves_interval_between_min_and_max():
+    s = scheduler()
+    intervals = [s.next_interval(float(t), True) for t in range(20)]
+    assert all(a > b for a, b in zip(intervals, intervals[1:]))
+    assert 1.0 <= intervals[-1] < 1.01
+
+    intervals = [s.next_interval(float(t), False) for t in range(20, 40)]
+    assert all(a < b for a, b in zip(intervals, intervals[1:]))
+    assert 7.9 < intervals[-1] <= 8.0
+
+
+def test_queue_depth_slows_capture_up_to_max():
+    s = scheduler()
+    assert s.next_interval(0.0, None, queue_depth=2, queue_max=4) == pytest.approx(4.5)
+    assert s.reason == "queue"
+    assert s.next_interval(1.0, None, queue_depth=8, queue_max=4) == 8.0
+    assert s.reason == "max"
+
+
+def test_service_time_is_a_floor():
+    s = scheduler()
+    assert s.next_interval(0.0, None, service_time=5.0) == 5.0
+    assert s.reason == "backend"
+    assert s.next_interval(1.0, None, service_time=2.0) == pytest.approx(3.0)
+
+
+def test_budget_spreads_remaining_calls_over_remaining_time():
+    s = scheduler(call_budget=100, duration=600.0)
+    assert s.next_interval(0.0, True) == pytest.approx(6.0)  # 600 秒 / 100 次
+    assert s.reason == "budget"
+    assert s.next_interval(300.0, True, calls_used=90) == 8.0  # 不超过 max_interval
+    assert s.reason == "budget"
+    assert s.next_interval(310.0, True, calls_used=100) == 8.0  # 预算用完
+
+
+def test_budget_accounts_for_frames_skipped_by_gating():
+    s = scheduler(call_budget=100, duration=600.0)
+    for t in range(10):
+        s.next_interval(float(t), True, sampled=False)
+    # 只有入库的帧消耗调用：跳过的帧越多，读帧间隔可以越短
+    assert s.sampled_ratio == pytest.approx(0.9 ** 10)
+    assert s.budget_interval(10.0, 0) == pytest.approx(590.0 * s.sampled_ratio / 100)
+    assert s.next_interval(10.0, True, sampled=False) < 6.0
+
+
+def test_budget_scales_with_calls_per_sample():
+    s = scheduler(call_budget=100, duration=600.0, calls_per_sample=0.5)
+    assert s.budget_interval(0.0, 0) == pytest.approx(3.0)
+
+
+def test_frames_per_minute_counts_only_sampled_frames():
+    s = scheduler()
+    for t in range(11):
+        s.next_interval(float(t), True, sampled=t % 2 == 0)
+    assert s.frames_per_minute() == pytest.approx(30.0)  # 0, 2, ..., 10 秒入库 6 帧
+    s.next_interval(80.0, False, sampled=False)
+    assert s.frames_per_minute() == 0.0  # 窗口内只剩不到两次入库
+
+
+def test_disabled_scheduler_keeps_base_interval():
+    s = scheduler(enabled=False)
+    for t in range(5):
+        assert s.next_interval(float(t), True, queue_depth=4, service_time=6.0) == 3.0
+    assert s.stats()["reasons"] == {"fixed": 5}
+
+
+def test_decisions_are_logged_to_csv(tmp_path):
+    path = tmp_path / "schedule.csv"
+    s = scheduler(log_path=str(path))
+    s.next_interval(0.0, True)
+    s.next_interval(3.0, None, sampled=False)
+    s.close()
+    with open(path, encoding="utf-8", newline="") as f:
+        rows = list(csv.DictReader(f))
+    assert [(r["sampled"], r["changed"]) for r in rows] == [("1", "1"), ("0", "")]
+    assert rows[0]["reason"] == "motion"
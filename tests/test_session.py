@@ -0,0 +1,35 @@
+from cinescribe.session import SpillWindow, format_session_stats
+
+
+def test_window_keeps_latest_and_counts_total():
+    window = SpillWindow(3)
+    for i in range(5):
+        window.append(i)
+    assert window.recent() == [2, 3, 4]
+    assert window.recent(2) == [3, 4]
+    assert window.recent(0) == []
+    assert window.stats() == {"total": 5, "window": 3, "spilled": 2}
+
+
+def test_spilled_entries_read_back_from_disk(tmp_path):
+    path = tmp_path / "batches.jsonl"
+    window = SpillWindow(2, str(path))
+    for i in range(5):
+        window.append((i, f"记录{i}"))
+    assert window.history() == [[0, "记录0"], [1, "记录1"], [2, "记录2"], (3, "记录3"), (4, "记录4")]
+    assert len(path.read_text(encoding="utf-8").splitlines()) == 3
+    window.close()
+    assert [item[0] for item in window.history()] == [0, 1, 2, 3, 4]
+
+
+def test_without_path_evicted_entries_are_dropped():
+    window = SpillWindow(1)
+    window.append("a")
+    window.append("b")
+    assert window.history() == ["b"]
+
+
+def test_format_session_stats():
+    assert format_session_stats({}) == "会话记录: -"
+    text = format_session_stats({"单帧": {"total": 12, "window": 10, "spilled": 2}})
+    assert text == "会话记录: 单帧 12 条 (内存 10 / 磁盘 2)"
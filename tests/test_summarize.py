@@ -0,0 +1,62 @@
+import threading
+
+from cinescribe.summarize import StoryTree, format_items, pack
+from cinescribe.tokens import estimate_tokens
+
+
+def reducer(items):
+    return "汇总" + "".join(label for label, _ in items)
+
+
+def test_pack_groups_within_limit():
+    items = [(f"阶段{i}", "字" * 40) for i in range(10)]
+    groups = pack(items, 100)
+    assert [item for group in groups for item in group] == items
+    assert all(estimate_tokens(format_items(group)) <= 100 for group in groups)
+
+
+def test_acts_replace_covered_phases():
+    tree = StoryTree(reducer, act_size=2, workers=1)
+    for i in range(5):
+        tree.add_phase(f"第{i + 1}段")
+    items = tree.final_items()
+    assert [label for label, _ in items] == ["第1幕 (阶段1-2)", "第2幕 (阶段3-4)", "阶段5"]
+    assert tree.phases == ["第5段"]  # 已成幕的阶段原文不再保留
+    assert tree.stats()["phases"] == 5
+    tree.close()
+
+
+def test_pending_act_keeps_its_phases():
+    gate = threading.Event()
+
+    def slow(items):
+        gate.wait()
+        return reducer(items)
+
+    tree = StoryTree(slow, act_size=2, workers=1)
+    for i in range(3):
+        tree.add_phase(f"第{i + 1}段")
+    assert "第1段" in tree.context(1000)  # 第一幕仍在汇总，上下文使用阶段原文
+    gate.set()
+    assert [label for label, _ in tree.final_items()][0] == "第1幕 (阶段1-2)"
+    tree.close()
+
+
+def test_final_items_reduce_instead_of_truncating():
+    tree = StoryTree(lambda items: "短" * 20, act_size=2, max_input_tokens=6000, workers=2)
+    for i in range(40):
+        tree.add_phase("长" * 200 + str(i))
+    items = tree.final_items(300)
+    assert estimate_tokens(format_items(items)) <= 300
+    assert all(not text.endswith("…") for _, text in items)
+    tree.close()
+
+
+def test_context_keeps_most_recent():
+    tree = StoryTree(reducer, act_size=10, workers=1)
+    for i in range(5):
+        tree.add_phase(f"阶段内容{i}" * 10)
+    context = tree.context(40)
+    assert "阶段内容4" in context
+    assert "阶段内容0" not in context
+    tree.close()
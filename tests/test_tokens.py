@@ -0,0 +1,63 @@
+from cinescribe.tokens import Section, TokenBudget, clip_text, estimate_tokens, image_tokens, trim_text
+
+
+def test_estimate_counts_cjk_per_character():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("你好世界") == 4
+    assert estimate_tokens("abcdefgh") == 2
+
+
+def test_trim_text_keeps_tail_or_head():
+    text = "\n".join(f"第{i}行内容" for i in range(10))
+    tail = trim_text(text, 20)
+    head = trim_text(text, 20, keep="head")
+    assert estimate_tokens(tail) <= 20 and tail.endswith("第9行内容")
+    assert estimate_tokens(head) <= 20 and head.startswith("第0行内容")
+    assert trim_text(text, 1000) == text
+    assert trim_text(text, 0) == ""
+
+
+def test_trim_text_clips_single_long_line():
+    trimmed = trim_text("字" * 100, 10)
+    assert trimmed.endswith("…")
+    assert estimate_tokens(trimmed) <= 10
+
+
+def test_clip_text_keeps_prefix():
+    assert clip_text("一二三四五", 3) == "一二三…"
+    assert clip_text("一二", 3) == "一二"
+
+
+def test_image_tokens_round_up_to_tiles():
+    assert image_tokens((32, 32)) == 1 + 2
+    assert image_tokens((33, 64)) == 4 + 2
+
+
+def test_fit_trims_lowest_priority_first():
+    budget = TokenBudget(default_limit=200, reserve=0)
+    old = "\n".join(f"旧记录{i}" * 3 for i in range(20))
+    recent = "最近记录" * 10
+    prompt = budget.fit("m", "{old}\n{recent}", [
+        Section("old", old, priority=0),
+        Section("recent", recent, priority=1),
+    ], max_tokens=50)
+    assert recent in prompt  # 高优先级段落完整保留
+    assert "旧记录19" in prompt and "旧记录0" not in prompt
+    assert estimate_tokens(prompt) + 50 <= 200
+
+
+def test_available_matches_fit():
+    budget = TokenBudget(default_limit=500, reserve=10)
+    room = budget.available("m", "上下文：\n{context}", ["context"], fixed="系统" * 20, max_tokens=100)
+    text = "字" * room
+    assert budget.fit("m", "上下文：\n{context}", [Section("context", text, keep="head")],
+                      fixed="系统" * 20, max_tokens=100).endswith(text)
+    assert budget.fit("m", "上下文：\n{context}", [Section("context", text + "多", keep="head")],
+                      fixed="系统" * 20, max_tokens=100).endswith("…")
+
+
+def test_record_flags_over_budget():
+    budget = TokenBudget(default_limit=10)
+    budget.record("batch", "m", [{"role": "user", "content": "字" * 20}], max_tokens=5)
+    stats = budget.stats()["batch"]
+    assert stats["requests"] == 1 and stats["over"] == 1
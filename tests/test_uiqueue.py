@@ -0,0 +1,59 @@
+import threading
+
+from cinescribe.uiqueue import UIEventQueue
+
+
+def test_latest_events_keep_last_value():
+    events = UIEventQueue(latest=("diff", "progress"))
+    for value in range(100):
+        events.put("progress", {"value": value})
+    events.put("diff", {"value": 1})
+    events.put("diff", {"value": 2})
+    assert events.drain() == [("progress", {"value": 99}), ("diff", {"value": 2})]
+    assert events.drain() == []
+
+
+def test_ordered_events_before_latest_values():
+    events = UIEventQueue(latest=("status",))
+    events.put("status", {"message": "a"})
+    events.put("batch", {"index": 0})
+    events.put("batch", {"index": 1})
+    assert events.drain() == [("batch", {"index": 0}), ("batch", {"index": 1}), ("status", {"message": "a"})]
+
+
+def test_adjacent_text_is_concatenated():
+    events = UIEventQueue(concat=("stream_token",))
+    events.put("stream_start", {"kind": "summary", "text": "标题"})
+    for text in "一二三":
+        events.put("stream_token", {"kind": "summary", "text": text})
+    events.put("stream_token", {"kind": "final", "text": "四"})
+    events.put("stream_end", {"kind": "summary", "ok": True})
+    assert events.drain() == [
+        ("stream_start", {"kind": "summary", "text": "标题"}),
+        ("stream_token", {"kind": "summary", "text": "一二三"}),
+        ("stream_token", {"kind": "final", "text": "四"}),
+        ("stream_end", {"kind": "summary", "ok": True}),
+    ]
+
+
+def test_concurrent_producers_lose_no_ordered_events():
+    events = UIEventQueue(latest=("diff",))
+
+    def produce(worker):
+        for i in range(500):
+            events.put("batch", {"worker": worker, "i": i})
+            events.put("diff", {"value": i})
+
+    threads = [threading.Thread(target=produce, args=(w,)) for w in range(4)]
+    for t in threads:
+        t.start()
+    drained = []
+    while any(t.is_alive() for t in threads):
+        drained += events.drain()
+    for t in threads:
+        t.join()
+    drained += events.drain()
+    batches = [data for event, data in drained if event == "batch"]
+    assert len(batches) == 2000
+    for w in range(4):
+        assert [d["i"] for d in batches if d["worker"] == w] == list(range(500))